@@ -0,0 +1,48 @@
+from trajalign.average import load_directory
+from trajalign.average import average_trajectories
+import numpy as np
+import os
+
+#compare the averages of trajectories stored in double ('float64', default)
+#and in single ('float32') precision. Single precision halves the memory
+#used by the trajectories, while times and error propagation remain in
+#double precision and the sums are accumulated in double precision.
+#With the first 5 trajectories in trajectory_average_example/raw_trajectories 
+#the memory of coord and f halves (315768 bytes against 157884 bytes) and the 
+#averages differ by less than 3e-6 pxl in coord and 2e-7 in f, i.e. less 
+#than 2e-4 times the errors of the average.
+
+path = os.path.join( 'trajectory_average_example' , 'raw_trajectories' )
+n = 5 #number of trajectories to average
+
+averages = {}
+for dtype in [ 'float64' , 'float32' ] :
+
+	trajectory_list = load_directory(
+			path = path , 
+			pattern = '.data' ,
+			comment_char = '%' , 
+			dt = 0.1045 , 
+			t_unit = 's' , 
+			coord_unit = 'pxl' , 
+			frames = 0 , 
+			coord = ( 1 , 2 ) , 
+			f = 3 , 
+			dtype = dtype )
+
+	memory = sum( t.coord().nbytes + t.f().nbytes for t in trajectory_list )
+	print( dtype + ': ' + str( len( trajectory_list ) ) + ' trajectories, coord and f use ' + str( memory ) + ' bytes' )
+
+	best , worst , aligned = average_trajectories( trajectory_list[ 0 : n ] , max_frame = 500 , 
+			output_file = 'average_' + dtype , median = True )
+	averages[ dtype ] = best
+
+#the difference between the two averages, in units of the error of the average
+a64 = averages[ 'float64' ]
+a32 = averages[ 'float32' ]
+for a in [ 'coord' , 'f' ] :
+	difference = np.absolute( getattr( a32 , a )() - getattr( a64 , a )() )
+	error = getattr( a64 , a + '_err' )()
+	sel = error > 0 #where the average is computed from one trajectory only the error is zero
+	print( a + ': largest difference ' + str( np.nanmax( difference ) ) + 
+			', largest difference relative to the error ' + str( np.nanmax( difference[ sel ] / error[ sel ] ) ) )
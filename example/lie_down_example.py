@@ -0,0 +1,41 @@
+from trajalign.traj import Traj
+from trajalign.average import lie_down
+from trajalign.average import lie_down_all
+import numpy as np
+import copy as cp
+import time
+
+#compare the orientation of the average trajectories found with the
+#RANSAC regressor and with the Theil-Sen estimator. The angles differ
+#by about one degree at most.
+files = [
+		'align_trajectories_example/abp1.txt' ,
+		'align_trajectories_example/rvs167.txt' ,
+		'align_trajectories_example/sla1.txt' ,
+		'trajectory_average_example/median.txt'
+		]
+
+averages = []
+for f in files :
+	t = Traj()
+	t.load( f )
+	averages.append( t )
+
+print( 'file\tRANSAC (rad)\tTheil-Sen (rad)\tdifference (deg)' )
+
+for i in range( len( files ) ) :
+
+	ransac = lie_down( cp.deepcopy( averages[ i ] ) , method = 'ransac' )
+	theil_sen = lie_down( cp.deepcopy( averages[ i ] ) , method = 'theil_sen' )
+
+	print( files[ i ] + '\t' + str( ransac[ 'angle' ] ) + '\t' + str( theil_sen[ 'angle' ] ) + '\t' +
+			str( np.degrees( theil_sen[ 'angle' ] - ransac[ 'angle' ] ) ) )
+
+#many averages can be lied down at once
+for method in [ 'ransac' , 'theil_sen' ] :
+
+	to_lie_down = [ cp.deepcopy( t ) for t in averages * 25 ]
+
+	t0 = time.time()
+	lie_down_all( to_lie_down , method = method )
+	print( method + ': ' + str( len( to_lie_down ) ) + ' trajectories lied down in ' + str( round( time.time() - t0 , 3 ) ) + ' s' )
@@ -0,0 +1,45 @@
+# All the software here is distributed under the terms of the GNU General Public License Version 3, June 2007.
+# Trajalign is a free software and comes with ABSOLUTELY NO WARRANTY.
+#
+# You are welcome to redistribute the software. However, we appreciate is use of such software would result in citations of
+# Picco, A., Kaksonen, M., _Precise tracking of the dynamics of multiple proteins in endocytic events_,  Methods in Cell Biology, Vol. 139, pages 51-68 (2017)
+# http://www.sciencedirect.com/science/article/pii/S0091679X16301546
+#
+# Author: Andrea Picco (https://github.com/apicco)
+# Year: 2017
+
+"""
+Equivalence tests between the backends of trajalign.kernels: the outputs of each backend must equal those of the
+numpy backend, up to rounding errors. Run with python -m pytest from the folder of setup.py.
+"""
+
+import pytest
+from trajalign import kernels
+
+lengths = [ 1 , 2 , 25 , 100 , 400 ]
+
+def check( backend ) :
+
+    results = kernels.compare_backends( lengths = lengths , backends = [ backend ] , min_time = 0 )
+    assert list( results.keys() ) == [ 'horn' , 'correlate' , 'fill_time' , 'fill_time_step' , 'nan_cumsum' ]
+    assert kernels.mismatches( results ) == []
+
+def test_numpy() :
+
+    check( 'numpy' )
+
+def test_python() :
+
+    #the loops of the numba backend, without compiling them
+    check( 'python' )
+
+def test_numba() :
+
+    pytest.importorskip( 'numba' )
+    check( 'numba' )
+
+def test_mismatches() :
+
+    results = { 'horn' : { 'lengths' : [ 25 ] , 'difference' : { 'python' : [ 1e-6 ] } , 'seconds' : { 'python' : [ 0 ] } } }
+    assert len( kernels.mismatches( results ) ) == 1
+    assert kernels.mismatches( results , tolerance = 1e-5 ) == []
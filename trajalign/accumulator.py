@@ -0,0 +1,217 @@
+# All the software here is distributed under the terms of the GNU General Public License Version 3, June 2007.
+# Trajalign is a free software and comes with ABSOLUTELY NO WARRANTY.
+#
+# You are welcome to redistribute the software. However, we appreciate is use of such software would result in citations of
+# Picco, A., Kaksonen, M., _Precise tracking of the dynamics of multiple proteins in endocytic events_,  Methods in Cell Biology, Vol. 139, pages 51-68 (2017)
+# http://www.sciencedirect.com/science/article/pii/S0091679X16301546
+#
+# Author: Andrea Picco (https://github.com/apicco)
+# Year: 2017
+
+from trajalign.traj import Traj
+import numpy as np
+import warnings as wr
+
+class TrajAccumulator:
+    """
+    TrajAccumulator( median = False , capacity = 1000 , confidence = 0.95 , seed = 42 ) -> streaming average
+    of trajectories that share the same time points, such as aligned trajectories. Trajectories are added one at
+    the time with .update( trajectory ) and the average trajectory, with the same attributes, errors and 'n' as
+    computed by trajectory_average, is returned by .result().
+
+    The mean and the standard deviation are updated at each trajectory (Welford's algorithm), hence only three
+    arrays are kept in memory, whatever the number of trajectories. The median and the median absolute deviation
+    need the values of the trajectories: up to 'capacity' trajectories are kept in memory and the median is exact.
+    Beyond 'capacity' trajectories, a uniform random sample of 'capacity' trajectories is kept (reservoir sampling)
+    and the median is that of the sample. In that case, with probability 'confidence', the rank of the median
+    of the sample differs from that of the median of all the trajectories by at most a fraction
+    sqrt( log( 2 / ( 1 - confidence ) ) / ( 2 m ) ) of the trajectories, where m is the number of sampled
+    values (Dvoretzky-Kiefer-Wolfowitz inequality). This bound is reported in the annotations of the result
+    as 'median_rank_error', together with 'median_confidence' and 'median_samples'.
+
+    EXAMPLE:
+
+    accumulator = TrajAccumulator( median = True , capacity = 500 )
+    for t in aligned_trajectories :
+        accumulator.update( t )
+    average = accumulator.result()
+    """
+
+    def __init__( self , median = False , capacity = 1000 , confidence = 0.95 , seed = 42 ) :
+
+        if capacity < 1 :
+            raise AttributeError( 'The capacity must be at least one trajectory' )
+        if not ( 0 < confidence < 1 ) :
+            raise AttributeError( 'The confidence must be between 0 and 1' )
+
+        self.median = median
+        self.capacity = capacity
+        self.confidence = confidence
+        self._rng = np.random.default_rng( seed )
+
+        self._annotations = None
+        self._t = None
+        self._rows = None
+        self._count = 0 #number of trajectories
+        self._n = None #number of not-nan values
+        self._mean = None
+        self._m2 = None
+        self._samples = None
+        self._n_samples = 0
+
+    def __len__( self ) :
+
+        return self._count
+
+    def __repr__( self ) :
+
+        return 'TrajAccumulator(median = ' + str( self.median ) + ', capacity = ' + str( self.capacity ) + ', trajectories = ' + str( self._count ) + ')'
+
+    def _start( self , trajectory ) :
+
+        #the first trajectory defines the time points and the attributes to be averaged.
+        #Its annotations are inherited by the average, as in trajectory_average.
+        self._annotations = {}
+        for a , v in trajectory.annotations().items() :
+            if a == 'file' :
+                self._annotations[ 'reference_file' ] = v
+            elif a not in ( 'affine_transform' , 'time_shift' ) :
+                self._annotations[ a ] = v
+
+        self._t = trajectory.t().copy()
+
+        self._rows = {}
+        n_rows = 0
+        for a in [ a for a in trajectory.attributes() if a not in ( 't' , 'frames' ) ] :
+
+            if a[ len( a ) - 4 : len( a ) ] == '_err' :
+                raise AttributeError('The trajectories to be averaged have already an non empty error element, suggeting that they are already the result of an average. These error currently are not propagated. Check that your trajectories are correct')
+            if '_' + a + '_err' not in Traj.__slots__ :
+                raise AttributeError( 'The attribute ' + a + ' is not recongnised as an attribute' )
+
+            self._rows[ a ] = ( n_rows , getattr( trajectory , a )().ndim )
+            n_rows += self._rows[ a ][ 1 ]
+
+        shape = ( n_rows , len( self._t ) )
+        self._n = np.zeros( shape , dtype = 'int64' )
+        if self.median :
+            self._samples = np.empty( ( min( self.capacity , 64 ) , ) + shape )
+        else :
+            self._mean = np.zeros( shape )
+            self._m2 = np.zeros( shape )
+
+    def _values( self , trajectory ) :
+
+        #the attributes of the trajectory as rows of a 2D array
+        if len( trajectory ) != len( self._t ) or not np.allclose( trajectory.t() , self._t , equal_nan = True ) :
+            raise IndexError( 'The trajectories to be averaged must have the same time points' )
+
+        x = np.empty( self._n.shape )
+        for a , ( i , n ) in self._rows.items() :
+            y = getattr( trajectory , a )()
+            if y.shape[ y.ndim - 1 ] == 0 :
+                raise AttributeError( 'The attribute ' + a + ' is missing from ' + str( trajectory.annotations().get( 'file' , 'the trajectory' ) ) )
+            x[ i : i + n ] = y
+
+        return x
+
+    def update( self , trajectory ) :
+
+        """
+        .update( trajectory ) adds the trajectory to the average.
+        """
+
+        if self._t is None :
+            self._start( trajectory )
+
+        x = self._values( trajectory )
+        valid = ~ np.isnan( x )
+
+        self._count += 1
+        self._n += valid
+
+        if self.median :
+
+            if self._n_samples < self.capacity :
+
+                #grow the sample buffer geometrically, up to capacity
+                if self._n_samples == len( self._samples ) :
+                    samples = np.empty( ( min( self.capacity , 2 * len( self._samples ) ) , ) + self._samples.shape[ 1: ] )
+                    samples[ : self._n_samples ] = self._samples
+                    self._samples = samples
+
+                self._samples[ self._n_samples ] = x
+                self._n_samples += 1
+
+            else :
+
+                #reservoir sampling: the trajectory replaces a sampled one with probability capacity / count
+                j = self._rng.integers( 0 , self._count )
+                if j < self.capacity :
+                    self._samples[ j ] = x
+
+        else :
+
+            #Welford's update of the mean and of the sum of squared deviations, only where x is not nan
+            delta = np.where( valid , x - self._mean , 0 )
+            self._mean += np.divide( delta , self._n , out = np.zeros( delta.shape ) , where = valid )
+            self._m2 += np.where( valid , delta * ( x - self._mean ) , 0 )
+
+    def result( self ) :
+
+        """
+        .result() returns the average trajectory of the trajectories added so far.
+        """
+
+        if self._t is None :
+            raise IndexError( 'There are no trajectories to average' )
+
+        t = Traj()
+        t.annotations( dict( self._annotations ) )
+        t.input_values( 't' , self._t.copy() )
+
+        with wr.catch_warnings():
+
+            # if a line is made only of nan that are averaged, then a waring is outputed. Here we suppress such warnings.
+            wr.simplefilter("ignore", category=RuntimeWarning)
+
+            if self.median :
+
+                samples = self._samples[ : self._n_samples ]
+                centre = np.nanmedian( samples , axis = 0 )
+                spread = 1.4826 * np.nanmedian( np.absolute( samples - centre ) , axis = 0 ) #see nanMAD
+
+                if self._count > self.capacity :
+
+                    #the smallest number of sampled values where there is data bounds the rank error
+                    m = np.sum( ~ np.isnan( samples ) , axis = 0 )
+                    m = m[ m > 0 ].min() if ( m > 0 ).any() else 0
+                    t.annotations( 'median_samples' , str( self._n_samples ) + ' of ' + str( self._count ) )
+                    t.annotations( 'median_confidence' , str( self.confidence ) )
+                    if m > 0 :
+                        t.annotations( 'median_rank_error' , str( np.sqrt( np.log( 2 / ( 1 - self.confidence ) ) / ( 2 * m ) ) ) )
+
+            else :
+
+                n = np.where( self._n > 0 , self._n , np.nan )
+                centre = np.where( self._n > 0 , self._mean , np.nan )
+                spread = np.sqrt( self._m2 / n )
+
+        #the number of not-nan data points is that of the first attribute, which
+        #in case of two dims (as 'coord') is the first of its rows.
+        if self._rows :
+            n = self._n[ 0 ].astype( 'float64' )
+            n[ n == 0 ] = np.nan
+            t.input_values( 'n' , n )
+
+        for a , ( i , rows ) in self._rows.items() :
+
+            if rows == 2 :
+                i = slice( i , i + 2 )
+
+            t.input_values( a , centre[ i ] )
+
+            #compute the errors as standard errors of the mean/median
+            t.input_values( a + '_err' , spread[ i ] / np.sqrt( t.n() ) )
+
+        return t
@@ -9,6 +9,16 @@
 # Year: 2017
 
 from trajalign.traj import Traj
+from trajalign.traj import split_compression
+from trajalign.traj import rotate_all
+from trajalign.traj import translate_all
+from trajalign.traj import apply_all
+from trajalign.traj import fimax_indices
+from trajalign import memo
+from trajalign import instrument
+from trajalign import kernels
+from trajalign.progress import as_progress
+from trajalign.progress import Cancelled
 from trajalign.average import load_directory
 from trajalign.average import MSD
 from trajalign.average import nanMAD 
@@ -24,12 +34,20 @@ def spline( t1 , t2 ) :
     interpolate t1 or t2 with a spline.
     """
 
+    instrument.count( 'spline' )
+
+    #the interpolations inherit all the annotations (see trajalign.memo)
+    key = memo.key( 'spline' , [ t1 , t2 ] , annotations = None )
+    output = memo.get( key )
+    if output is not None :
+        return output
+
     #the interpolation function
     def interpolation( to_interpolate , delta_t , k = 3 ) :
     
-        interpolated_traj = Traj( interpolated = 'True' )
-        interpolated_traj.annotations( to_interpolate.annotations() )
-        interpolated_traj.annotations()[ 'delta_t' ] = delta_t
+        annotations = { 'interpolated' : 'True' }
+        annotations.update( to_interpolate.annotations() )
+        annotations[ 'delta_t' ] = delta_t
 
         l = len( to_interpolate )
 
@@ -43,31 +61,26 @@ def spline( t1 , t2 ) :
         t = [ to_interpolate.start() ]
         while( t[ len(t) - 1 ] <= to_interpolate.end() ) :
             t.append( t[ len(t) - 1 ] + delta_t )
-        
-        interpolated_traj.input_values( 
-                name = 't' , 
-                x = t ,
-                unit = to_interpolate.annotations()[ 't_unit' ]
-                )
+        t = np.array( t , dtype = 'float64' )
+
+        #the interpolated values are computed here, hence the trajectory 
+        #can be created without validating them
+        values = { 't' : t }
 
         for attribute in to_interpolate.attributes() :     
             
             if attribute in [ 'f' , 'mol' ] :
 
                 s = UnivariateSpline( to_interpolate.t() , getattr( to_interpolate , '_'+attribute ) , k = k )
-                interpolated_traj.input_values( 
-                        name = attribute , 
-                        x = s( interpolated_traj.t() )
-                        )
+                values[ attribute ] = s( t )
 
             if attribute == 'coord' :
 
                 s_x = UnivariateSpline( to_interpolate.t() , to_interpolate.coord()[ 0 ] , k = k )
                 s_y = UnivariateSpline( to_interpolate.t() , to_interpolate.coord()[ 1 ] , k = k )
-                interpolated_traj.input_values( 
-                        name = 'coord' , 
-                        x = [ s_x( interpolated_traj.t() ) , s_y( interpolated_traj.t() ) ],
-                        )
+                values[ 'coord' ] = np.array( [ s_x( t ) , s_y( t ) ] )
+
+        interpolated_traj = Traj.from_arrays( annotations = annotations , validate = False , **values )
 
         return( interpolated_traj )
 
@@ -82,16 +95,14 @@ def spline( t1 , t2 ) :
         
         delta_t = float(t1.annotations()[ 'delta_t' ])
 
-    not_nan = [ i for i in range( len( t1 ) ) if t1.f( i ) == t1.f( i ) ]
-    t1_to_interpolate = t1.extract( not_nan )
+    t1_to_interpolate = t1.extract( np.flatnonzero( t1.valid( 'f' ) ).tolist() )
 
-    not_nan = [ i for i in range( len( t2 ) ) if t2.f( i ) == t2.f( i ) ]
-    t2_to_interpolate = t2.extract( not_nan )
+    t2_to_interpolate = t2.extract( np.flatnonzero( t2.valid( 'f' ) ).tolist() )
 
-    return( 
+    return( memo.put( key , ( 
             interpolation( t1_to_interpolate , delta_t ) ,
             interpolation( t2_to_interpolate , delta_t )
-            )
+            ) ) )
 
 def cc( input_t1 , input_t2 ):
     
@@ -101,8 +112,16 @@ def cc( input_t1 , input_t2 ):
     The trajectory input_t2 will be aligned in time to input_t1 by adding the output of cc to input_t2.t()
     """
 
-    t1 = cp.deepcopy( input_t1 )
-    t2 = cp.deepcopy( input_t2 )
+    instrument.count( 'cc' )
+
+    key = memo.key( 'cc' , [ input_t1 , input_t2 ] )
+    output = memo.get( key )
+    if output is not None :
+        return output
+
+    #copies of the trajectories, which share the arrays of frozen trajectories (see Traj.freeze)
+    t1 = input_t1._working_copy()
+    t2 = input_t2._working_copy()
 
     if t1.annotations()[ 'delta_t' ] != t2.annotations()[ 'delta_t' ] :
         raise AttributeError('The two trajectories have different \'delta_t\' ') 
@@ -119,23 +138,33 @@ def cc( input_t1 , input_t2 ):
     lag0 = t1.start() - t2.start()
     t2.input_values( 't' , t2.t() + lag0 )
 
-    output = []
-    while t2.end() <= t1.end() :
+    #the fluorescence intensities, where NaN do not contribute to the cross correlation
+    f1 = np.where( t1.valid( 'f' ) , t1.f() , 0 ).astype( 'float64' , copy = False )
+    f2 = np.where( t2.valid( 'f' ) , t2.f() , 0 ).astype( 'float64' , copy = False )
+    l = len( t2 )
+
+    #the first point of t1 overlapping t2, for each lag of t2 by one delta_t
+    first = []
+    start = t2.start()
+    end = t2.end()
+    while end <= t1.end() :
 
         #because of rounding errors I cannot use:
         #f1 = [ t1.f( i ) for i in range( len( t1 ) ) if ( t1.t( i ) >= t2.start() ) & ( t1.t( i ) <= t2.end() ) ] 
-        #but the following, where instead of greater than... I use >< delta_t / 2
-        f1 = [ t1.f( i ) for i in range( len( t1 ) ) if ( t1.t( i ) - t2.start() > - delta_t / 2 ) & ( t1.t( i ) - t2.end() < delta_t / 2 ) ] 
+        #but the points of t1 that are within delta_t / 2 from t2 start and end
+        i = t1.time_index( start )
         
-        if len( f1 ) != len( t2 ) : raise IndexError( "There is a problem with the selection of t1 fluorescence intensities and t2 length in the cross-correlation function cc. The lengths do not match.")
-
-        output.append( 
-                sum( [ f1[ i ] * t2.f( i ) for i in range( len( t2 ) ) if ( f1[ i ] == f1[ i ] ) & ( t2.f( i ) == t2.f( i ) ) ] )
-                )
+        if ( i is None ) or ( i + l > len( t1 ) ) or ( t1.time_index( end ) != i + l - 1 ) :
+            raise IndexError( "There is a problem with the selection of t1 fluorescence intensities and t2 length in the cross-correlation function cc. The lengths do not match.")
         
-        t2.lag( 1 )
+        first.append( i )
+        start = start + delta_t
+        end = end + delta_t
 
-    return( lag0 + output.index( max( output ) ) * t1.annotations()[ 'delta_t' ] )
+    #the cross correlation, summing over the points of t2 (see kernels.correlate)
+    output = kernels.correlate( f1 , f2 , np.array( first , dtype = 'int64' ) )
+
+    return( memo.put( key , lag0 + int( output.argmax() ) * t1.annotations()[ 'delta_t' ] ) )
 
 def unify_start_and_end( t1 , t2 ):
 
@@ -172,7 +201,7 @@ def R( angle ) :
 
 #-------------------------END-OF-DEFINITIONS--------------------------------
 
-def align( path_target , path_reference , ch1 , ch2 , fimax1 = False , fimax2 = False , fimax_filter = [ -3/35 , 12/35 , 17/35 , 12/35 , -3/35 ] ):
+def align( path_target , path_reference , ch1 , ch2 , fimax1 = False , fimax2 = False , fimax_filter = [ -3/35 , 12/35 , 17/35 , 12/35 , -3/35 ] , profile = None , progress = None , quiet = False , cancel = None , resume = None ):
 
     """
     align( path_target , path_reference , ch1 , ch2 , ):
@@ -188,15 +217,30 @@ def align( path_target , path_reference , ch1 , ch2 , fimax1 = False , fimax2 =
     setting fimax1 and fimax2 to True, respectively. If fimax1 and/or fimax2 are true, then fimax_filer
     is used to compute where the peak of fluorescence intensity is. If no filter is desired, set 
     fimax_filer = [ 1 ].
+    If 'profile' is True or a Profile (see trajalign.instrument), the time spent in each stage of the 
+    alignment and the calls of the kernels are measured and align returns the Profile.
+    'progress' is a function, or a Progress (see trajalign.progress), to which the progress of the alignments is 
+    reported. With 'quiet' = True, the alignments are not printed. If the CancelToken 'cancel' is cancelled, 
+    the run stops before the next alignment and raises Cancelled, which carries the transformations computed 
+    so far: pass them as 'resume' to continue.
     """
 
+    with instrument.profiling( profile ) as p :
+        _align( path_target , path_reference , ch1 , ch2 , fimax1 , fimax2 , fimax_filter , progress , quiet , cancel , resume )
+
+    return p
+
+def _align( path_target , path_reference , ch1 , ch2 , fimax1 , fimax2 , fimax_filter , progress , quiet , cancel , resume ):
+
+    #see align
     header() 
 
-    target_trajectory = Traj()
-    target_trajectory.load( path_target )
+    with instrument.stage( 'load' ) :
+        target_trajectory = Traj()
+        target_trajectory.load( path_target )
 
-    reference_trajectory = Traj()
-    reference_trajectory.load( path_reference )
+        reference_trajectory = Traj()
+        reference_trajectory.load( path_reference )
     
     #################################################################################################################
     #average trajectories are centered on their center of mass and must have been previously lied down 
@@ -245,37 +289,59 @@ def align( path_target , path_reference , ch1 , ch2 , fimax1 = False , fimax2 =
     #define the dictionary where the transformations will be stored
     T = { 'angle' : [] , 'translation' : [] , 'lag' : [] }
 
+    #the transformations computed in the run that is resumed, which must have the same trajectories
+    fingerprints = [ t.fingerprint() for t in [ t1 , t2 ] + ch1 + ch2 ]
+    if resume is not None :
+        if ( resume[ 'fingerprints' ] != fingerprints ) or ( resume[ 'fimax' ] != ( fimax1 , fimax2 , tuple( fimax_filter ) ) ) :
+            raise AttributeError( 'The run to resume was computed on different trajectories or with different fimax options' )
+        T = cp.deepcopy( resume[ 'T' ] )
+
+    #find where fimax cuts the trajectories, all at once
+    with instrument.stage( 'fimax' ) :
+        if ( fimax1 ) : fimax_indices( ch1 , fimax_filter )
+        if ( fimax2 ) : fimax_indices( ch2 , fimax_filter )
+
+    progress = as_progress( progress )
+    progress.update( 'align' , len( T[ 'lag' ] ) , l )
+
     #compute the transformations that align t1 and t2 together.
-    for i in range( l ) :
+    for i in range( len( T[ 'lag' ] ) , l ) :
 
-        print( "Align " + path_target + " to " + ch1[ i ].annotations()[ 'file' ] + " and " + path_reference + " to " + ch2[ i ].annotations()[ 'file' ] ) 
+        if ( cancel is not None ) and cancel.cancelled() :
+            raise Cancelled( { 'fingerprints' : fingerprints , 'fimax' : ( fimax1 , fimax2 , tuple( fimax_filter ) ) , 'T' : T } )
+
+        if not quiet :
+            print( "Align " + path_target + " to " + ch1[ i ].annotations()[ 'file' ] + " and " + path_reference + " to " + ch2[ i ].annotations()[ 'file' ] ) 
 
         #spline the trajectories, to reduce the noise
-        if ( fimax1 ) :
-            spline_t1 , spline_ch1 = spline( t1 , ch1[ i ].fimax( fimax_filter ) )
-        else :
-            spline_t1 , spline_ch1 = spline( t1 , ch1[ i ] )
-
-        if ( fimax2 ) :
-            spline_t2 , spline_ch2 = spline( t2 , ch2[ i ].fimax( fimax_filter ) )
-        else :
-            spline_t2 , spline_ch2 = spline( t2 , ch2[ i ] )
-
-        #lag t1
-        ch1_lag = cc( spline_t1 , spline_ch1 )
-        spline_ch1.input_values( 't' , spline_ch1.t() + ch1_lag )
-        
-        #lag t2
-        ch2_lag = cc( spline_t2 , spline_ch2 )
-        spline_ch2.input_values( 't' , spline_ch2.t() + ch2_lag )
+        with instrument.stage( 'spline' ) :
+            if ( fimax1 ) :
+                spline_t1 , spline_ch1 = spline( t1 , ch1[ i ].fimax( fimax_filter ) )
+            else :
+                spline_t1 , spline_ch1 = spline( t1 , ch1[ i ] )
+
+            if ( fimax2 ) :
+                spline_t2 , spline_ch2 = spline( t2 , ch2[ i ].fimax( fimax_filter ) )
+            else :
+                spline_t2 , spline_ch2 = spline( t2 , ch2[ i ] )
+
+        with instrument.stage( 'cc' ) :
+            #lag t1
+            ch1_lag = cc( spline_t1 , spline_ch1 )
+            spline_ch1.input_values( 't' , spline_ch1.t() + ch1_lag )
+            
+            #lag t2
+            ch2_lag = cc( spline_t2 , spline_ch2 )
+            spline_ch2.input_values( 't' , spline_ch2.t() + ch2_lag )
 
         #unify the start and the end of the trajectory splines that are paired to compute the rotation and translation.
         unify_start_and_end( spline_t1 , spline_ch1 )
         unify_start_and_end( spline_t2 , spline_ch2 )
     
         #NOTE: the weight used in Picco et al., 2015 is slightly different. To use the same weight one should replace spline_t1.f() with spline_t1.f() / ( spline_t1.coord_err()[ 0 ] * spline_t1.coord_err()[ 1 ] )
-        align_ch1_to_t1 = MSD( spline_t1 , spline_ch1 ) 
-        align_ch2_to_t2 = MSD( spline_t2 , spline_ch2 )
+        with instrument.stage( 'MSD' ) :
+            align_ch1_to_t1 = MSD( spline_t1 , spline_ch1 ) 
+            align_ch2_to_t2 = MSD( spline_t2 , spline_ch2 )
 
         #The tranformation that aligns t1 to t2 will be the transformation that align ch2 to t2 and the 
         #inverse of the transformation that aligns ch1 to t1.
@@ -323,6 +389,7 @@ def align( path_target , path_reference , ch1 , ch2 , fimax1 = False , fimax2 =
                         + align_ch2_to_t2[ 'rc' ] + t2_center_mass 
                 )[ 0 ] ) #the [ 0 ] is because otherwise it would be [[ x , y ]] instead of [ x , y ]
         T[ 'lag' ].append( ch2_lag - ch1_lag )
+        progress.update( 'align' , i + 1 , l )
     
     #compute the median and the standard error (SE) of the transformations.
     #NOTE that if fimax2 is used, the center of mass of reference trajectory does not 
@@ -352,9 +419,10 @@ def align( path_target , path_reference , ch1 , ch2 , fimax1 = False , fimax2 =
             )
     target_trajectory.input_values( 't' , target_trajectory.t() + T_median[ 'lag' ] )
 
-    dot_positions = [ i for i in range(len( path_target )) if path_target[i] == '.' ]
+    target_name , compression = split_compression( path_target ) #the aligned trajectory is compressed as the target
+    dot_positions = [ i for i in range(len( target_name )) if target_name[i] == '.' ]
     file_ending = dot_positions[ len(dot_positions) - 1 ] #there could be more than one dot in the file name. Pick the last.
-    file_name =  path_target[ 0 : file_ending ] + '_aligned' + path_target[ file_ending : len( path_target ) ]
+    file_name =  target_name[ 0 : file_ending ] + '_aligned' + target_name[ file_ending : len( target_name ) ] + compression
 
     # annotations
     target_trajectory.annotations( 'aligned_to' , str( path_reference ) )
@@ -366,11 +434,12 @@ def align( path_target , path_reference , ch1 , ch2 , fimax1 = False , fimax2 =
     target_trajectory.annotations( 'alignment_lag' , str( T_median[ 'lag' ] ) + ' ' + target_trajectory.annotations()[ 't_unit' ] )
     target_trajectory.annotations( 'alignment_lag_SE' , str( T_median[ 'lag_SE' ] ) + ' ' + target_trajectory.annotations()[ 't_unit' ] )
 
-    target_trajectory.save( file_name )
+    with instrument.stage( 'save' ) :
+        target_trajectory.save( file_name )
 
     print( 'The trajectory aligned to ' + path_reference + ' has been saved as ' + file_name )
 
-def align_raw( path_reference , ch1 , ch2 , fimax2 = False , fimax_filter = [ -3/35 , 12/35 , 17/35 , 12/35 , -3/35 ] , destination_folder = 'aligned' ):
+def align_raw( path_reference , ch1 , ch2 , fimax2 = False , fimax_filter = [ -3/35 , 12/35 , 17/35 , 12/35 , -3/35 ] , destination_folder = 'aligned' , profile = None , progress = None , quiet = False , cancel = None , resume = None ):
 
     """
     align( path_reference , ch1 , ch2 , ):
@@ -386,16 +455,33 @@ def align_raw( path_reference , ch1 , ch2 , fimax2 = False , fimax_filter = [ -3
     setting fimax1 and fimax2 to True, respectively. If fimax1 and/or fimax2 are true, then fimax_filer
     is used to compute where the peak of fluorescence intensity is. If no filter is desired, set 
     fimax_filer = [ 1 ].
+    If 'profile' is True or a Profile (see trajalign.instrument), the time spent in each stage of the 
+    alignment and the calls of the kernels are measured and align_raw returns the Profile.
+    'progress' is a function, or a Progress (see trajalign.progress), to which the progress of the alignments is 
+    reported. With 'quiet' = True, the alignments are not printed. The aligned trajectories are saved in batches,
+    as they are aligned. If the CancelToken 'cancel' is cancelled, the run saves the trajectories aligned so far, 
+    stops before the next alignment and raises Cancelled, which carries the transformations computed so far: 
+    pass them as 'resume', with ch1 and ch2 as they were given (e.g. loaded again from their files), to align 
+    and save the other trajectories. 
     """
 
+    with instrument.profiling( profile ) as p :
+        _align_raw( path_reference , ch1 , ch2 , fimax2 , fimax_filter , destination_folder , progress , quiet , cancel , resume )
+
+    return p
+
+def _align_raw( path_reference , ch1 , ch2 , fimax2 , fimax_filter , destination_folder , progress , quiet , cancel , resume ):
+
+    #see align_raw
     header() 
    
     d = os.listdir()
     if destination_folder not in d : 
         os.mkdir( destination_folder )
     
-    reference_trajectory = Traj()
-    reference_trajectory.load( path_reference )
+    with instrument.stage( 'load' ) :
+        reference_trajectory = Traj()
+        reference_trajectory.load( path_reference )
     
     #################################################################################################################
     #average trajectories are centered on their center of mass and must have been previously lied down 
@@ -429,50 +515,112 @@ def align_raw( path_reference , ch1 , ch2 , fimax2 = False , fimax_filter = [ -3
     #define the dictionary where the transformations will be stored
     T = { 'angle' : [] , 'translation' : [] , 'lag' : [] }
 
+    #find where fimax cuts the trajectories, all at once
+    with instrument.stage( 'fimax' ) :
+        if ( fimax2 ) : fimax_indices( ch2 , fimax_filter )
+
+    #the rotations, translations and lags that align ch1 and ch2. They are applied, together with the 
+    #annotations, to batches of aligned trajectories, which are then saved (see flush)
+    angles = []
+    translations = []
+    lags = []
+
+    #the fingerprints of the trajectories as they are given, before they are aligned, so that a run 
+    #can be resumed with the same trajectories loaded again
+    fingerprints = [ t.fingerprint() for t in [ t2 ] + ch1 + ch2 ]
+
+    #the transformations computed in the run that is resumed. The trajectories aligned in that run were 
+    #saved, hence only the reference trajectory and the trajectories that are not aligned yet must be the same.
+    if resume is not None :
+        n = len( resume[ 'angles' ] )
+        pending = lambda x : [ x[ 0 ] ] + x[ 1 + n : 1 + l ] + x[ 1 + l + n : ]
+        if ( len( resume[ 'fingerprints' ] ) != len( fingerprints ) ) or ( pending( resume[ 'fingerprints' ] ) != pending( fingerprints ) ) or ( resume[ 'fimax' ] != ( fimax2 , tuple( fimax_filter ) ) ) :
+            raise AttributeError( 'The run to resume was computed on different trajectories or with different fimax options' )
+        fingerprints = list( resume[ 'fingerprints' ] )
+        angles = list( resume[ 'angles' ] )
+        translations = list( resume[ 'translations' ] )
+        lags = list( resume[ 'lags' ] )
+
+    def flush( first , last ) :
+        #lag, annotate, rotate, translate and save the aligned trajectories from first to last (excluded),
+        #so that they are not lost if the run is cancelled or fails afterwards. Returns last.
+        if first == last :
+            return last
+
+        for i in range( first , last ) :
+            for ch in [ ch1[ i ] , ch2[ i ] ] :
+                ch.input_values( 't' , ch.t() + lags[ i ] )
+
+                # annotations
+                ch.annotations( 'aligned_to' , str( path_reference ) )
+                ch.annotations( 'alignment_angle' , str( angles[ i ] ) + ' rad' )
+                ch.annotations( 'alignment_translation' , str( translations[ i ] ) + ' ' + reference_trajectory.annotations()[ 'coord_unit' ] )
+                ch.annotations( 'alignment_lag' , str( lags[ i ] ) + ' ' + reference_trajectory.annotations()[ 't_unit' ] )
+
+        #rotate and translate ch1 and ch2
+        with instrument.stage( 'transform' ) :
+            rotate_all( ch1[ first : last ] + ch2[ first : last ] , angles[ first : last ] * 2 )
+            translate_all( ch1[ first : last ] + ch2[ first : last ] , translations[ first : last ] * 2 )
+            apply_all( ch1[ first : last ] + ch2[ first : last ] )
+
+        with instrument.stage( 'save' ) :
+            for i in range( first , last ) :
+
+                # saving
+                ch1[ i ].save( destination_folder + '/' + ch1[ i ].annotations()[ 'file' ] )
+                ch2[ i ].save( destination_folder + '/' + ch2[ i ].annotations()[ 'file' ] )
+
+        return last
+
+    #the number of aligned trajectory pairs that are transformed and saved together
+    batch = 16
+    saved = len( angles )
+
+    progress = as_progress( progress )
+    progress.update( 'align' , len( angles ) , l )
+
     #compute the transformations that align t1 and t2 together.
-    for i in range( l ) :
+    for i in range( len( angles ) , l ) :
+
+        if ( cancel is not None ) and cancel.cancelled() :
+            flush( saved , i )
+            raise Cancelled( { 'fingerprints' : fingerprints , 'fimax' : ( fimax2 , tuple( fimax_filter ) ) , 
+                'angles' : angles , 'translations' : translations , 'lags' : lags } )
         
-        print( "Align " + ch1[ i ].annotations()[ 'file' ] + " by aligning " + ch2[ i ].annotations()[ 'file' ] + " to " + path_reference ) 
+        if not quiet :
+            print( "Align " + ch1[ i ].annotations()[ 'file' ] + " by aligning " + ch2[ i ].annotations()[ 'file' ] + " to " + path_reference ) 
 
         #spline the trajectories, to reduce the noise
-        if ( fimax2 ) :
-            spline_t2 , spline_ch2 = spline( t2 , ch2[ i ].fimax( fimax_filter ) )
-        else :
-            spline_t2 , spline_ch2 = spline( t2 , ch2[ i ] )
+        with instrument.stage( 'spline' ) :
+            if ( fimax2 ) :
+                spline_t2 , spline_ch2 = spline( t2 , ch2[ i ].fimax( fimax_filter ) )
+            else :
+                spline_t2 , spline_ch2 = spline( t2 , ch2[ i ] )
 
         #lag t2
-        ch_lag = cc( spline_t2 , spline_ch2 )
-        spline_ch2.input_values( 't' , spline_ch2.t() + ch_lag )
+        with instrument.stage( 'cc' ) :
+            ch_lag = cc( spline_t2 , spline_ch2 )
+            spline_ch2.input_values( 't' , spline_ch2.t() + ch_lag )
 
         #unify the start and the end of the trajectory splines that are paired to compute the rotation and translation.
         unify_start_and_end( spline_t2 , spline_ch2 )
     
         #NOTE: the weight used in Picco et al., 2015 is slightly different. To use the same weight one should replace spline_t1.f() with spline_t1.f() / ( spline_t1.coord_err()[ 0 ] * spline_t1.coord_err()[ 1 ] )
-        align_ch2_to_t2 = MSD( spline_t2 , spline_ch2 )
+        with instrument.stage( 'MSD' ) :
+            align_ch2_to_t2 = MSD( spline_t2 , spline_ch2 )
 
-        ch1[ i ].rotate( align_ch2_to_t2[ 'angle' ] )
-        ch2[ i ].rotate( align_ch2_to_t2[ 'angle' ] )
         T = np.array( align_ch2_to_t2[ 'rc' ] + t2_center_mass\
             - R( align_ch2_to_t2[ 'angle' ] ) @ ( align_ch2_to_t2[ 'lc' ] )
             )[ 0 ] #the [ 0 ] is because otherwise it would be [[ x , y ]] instead of [ x , y ]
-        ch1[ i ].translate( T )
-        ch2[ i ].translate( T )
-        ch1[ i ].input_values( 't' , ch1[ i ].t() + ch_lag )
-        ch2[ i ].input_values( 't' , ch2[ i ].t() + ch_lag )
-
-        # annotations
-        ch1[ i ].annotations( 'aligned_to' , str( path_reference ) )
-        ch1[ i ].annotations( 'alignment_angle' , str( align_ch2_to_t2[ 'angle' ] ) + ' rad' )
-        ch1[ i ].annotations( 'alignment_translation' , str( T ) + ' ' + reference_trajectory.annotations()[ 'coord_unit' ] )
-        ch1[ i ].annotations( 'alignment_lag' , str( ch_lag ) + ' ' + reference_trajectory.annotations()[ 't_unit' ] )
-
-        ch2[ i ].annotations( 'aligned_to' , str( path_reference ) )
-        ch2[ i ].annotations( 'alignment_angle' , str( align_ch2_to_t2[ 'angle' ] ) + ' rad' )
-        ch2[ i ].annotations( 'alignment_translation' , str( T ) + ' ' + reference_trajectory.annotations()[ 'coord_unit' ] )
-        ch2[ i ].annotations( 'alignment_lag' , str( ch_lag ) + ' ' + reference_trajectory.annotations()[ 't_unit' ] )
-
-        # saving
-        ch1[ i ].save( destination_folder + '/' + ch1[ i ].annotations()[ 'file' ] )
-        ch2[ i ].save( destination_folder + '/' + ch2[ i ].annotations()[ 'file' ] )
+        angles.append( align_ch2_to_t2[ 'angle' ] )
+        translations.append( T )
+        lags.append( ch_lag )
+
+        if i + 1 - saved >= batch :
+            saved = flush( saved , i + 1 )
+
+        progress.update( 'align' , i + 1 , l )
+
+    flush( saved , l )
 
     print( 'The trajectories aligned to ' + path_reference + ' have been saved in ' + destination_folder )
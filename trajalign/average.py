@@ -10,9 +10,25 @@
 
 import os 
 from trajalign.traj import Traj
+from trajalign.traj import read_annotation
+from trajalign.traj import split_compression
+from trajalign.traj import open_file
+from trajalign.traj import rotate_all
+from trajalign.traj import translate_all
+from trajalign.traj import apply_all
+from trajalign.traj import fimax_indices
+from trajalign.cache import TrajCache
+from trajalign import instrument
+from trajalign import kernels
+from trajalign.progress import as_progress
+from trajalign.progress import as_checkpoint
+from trajalign.progress import load_state
+from trajalign.progress import Cancelled
 import copy as cp
 import numpy as np
 import warnings as wr
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from sklearn import linear_model
 
@@ -34,10 +50,136 @@ def header( version = 1.99 , year = 2018 , printit = True ) :
         raise AttributeError('Please, if you want to print the header (printit = True) or if you want to return the verion number only (printit = False).')
 
 
-def load_directory(path , pattern = '.txt' , sep = None , comment_char = '#' , dt = None , t_unit = '' , coord_unit = '' , intensity_normalisation = 'None' , **attrs ):
+def _check_load_options( attrs , dt , t_unit , coord_unit , intensity_normalisation , dtype = 'float64' ) :
+
+    #check the load options once, before any file is read
+    if ('coord' in attrs.keys()) & (len(coord_unit) == 0): 
+        raise AttributeError('Please, specify the coordinate unit \'coord_unit\'')
+    if ('t' in attrs.keys()) & (len(t_unit) == 0): 
+        raise AttributeError('Please, specify the time unit \'t_unit\'')
+    if (dt != None) & (len(t_unit) == 0): 
+        raise AttributeError('Please, specify the time unit \'t_unit\'')
+    if (dt != None) & ('t' in attrs.keys()):
+        raise AttributeError('Time is already loaded by the trajectories, you cannot also compute it from frames. Please, either remove the dt option or do not load the \'t\' column from the trajectories')
+    if intensity_normalisation not in ( 'None' , 'Integral' , 'Absolute' ) :
+        raise AttributeError( "load_directory: Please, choose a value for the variable intensity_normalisation between 'None' (no normalisation, default), 'Integral' (normalise over the integral of the fluorescence intensity), or 'Absolute' (normalise the fluorescence intensity values between 0 and 1)" )
+    if dtype not in ( 'float32' , 'float64' ) :
+        raise TypeError( "load_directory: dtype must be either 'float32' or 'float64'" )
+
+def _list_files( path , pattern ) :
+
+    #the pattern is matched on the file names without their compression suffix
+    if ( pattern[ len( pattern ) - 1 ] == '$' ) : 
+        return [ f for f in sorted( os.listdir(path) ) if split_compression( f )[ 0 ].endswith( pattern[ : - 1 ] ) ] #list all the files in path that have pattern
+    else : 
+        return [ f for f in sorted( os.listdir(path) ) if pattern in split_compression( f )[ 0 ] ] #list all the files in path that have pattern
+
+def _prepare_trajectory( trajectory , dt , t_unit , coord_unit , intensity_normalisation , attrs , dtype = 'float64' ) :
+
+    #the time, unit, normalisation and fill steps shared by all the loaders
+    if (dt != None):
+        trajectory.time(dt,t_unit)
+    if ('coord' in attrs.keys()):
+
+        trajectory.annotations('coord_unit',coord_unit)
+
+    if intensity_normalisation == 'Integral' :
+        
+        trajectory.scale_f()
+
+    elif intensity_normalisation == 'Absolute' :
+    
+        trajectory.norm_f()
+
+    trajectory.annotations( 'intensity_normalisation' , intensity_normalisation )
+    trajectory.fill()
+    trajectory.set_dtype( dtype )
+
+    return trajectory
+
+def _load_trajectory( path , file , sep , comment_char , dt , t_unit , coord_unit , intensity_normalisation , attrs , cache = None , dtype = 'float64' ) :
+
+    if cache is not None :
+        #the key covers everything that changes the prepared trajectory, including 
+        #the 'path' annotation, which depends on the working directory
+        key = cache.key( path+'/'+file , ( path , os.getcwd() , sep , comment_char , dt , t_unit , coord_unit , intensity_normalisation , sorted( attrs.items() ) , dtype ) )
+        trajectory = cache.get( key )
+        if trajectory is not None :
+            return trajectory
+
+    trajectory = Traj(experiment = path, path = os.getcwd()+'/'+path, file = file)
+    trajectory.load(path+'/'+file,sep = sep, comment_char = comment_char, **attrs)
+    _prepare_trajectory( trajectory , dt , t_unit , coord_unit , intensity_normalisation , attrs , dtype )
+
+    if cache is not None :
+        cache.put( key , trajectory )
+
+    return trajectory
+
+def iter_directory( path , pattern = '.txt' , sep = None , comment_char = '#' , dt = None , t_unit = '' , coord_unit = '' , intensity_normalisation = 'None' , prefetch = 2 , workers = 1 , cache = None , files = None , dtype = 'float64' , **attrs ):
 
     """
-    load_directory(path , pattern = '.txt' , sep = None , comment_char = '#' , dt = None , t_unit = '' , coord_unit = '' , intensity_normalisation = 'None' , **attrs ):
+    iter_directory(path , pattern = '.txt' , sep = None , comment_char = '#' , dt = None , t_unit = '' , coord_unit = '' , intensity_normalisation = 'None' , prefetch = 2 , workers = 1 , cache = None , files = None , dtype = 'float64' , **attrs ):
+    same as load_directory, but yields the trajectories one at a time, in the same order, 
+    instead of returning the whole list. The files are read ahead by 'workers' background 
+    threads and at most 'prefetch' trajectories are held in memory waiting to be consumed, 
+    so that the memory used does not grow with the number of files and the parsing of the 
+    next trajectories overlaps with the computations done on the current one.
+    'cache' is an optional TrajCache (see trajalign/cache.py), or the directory where 
+    to keep one: trajectories whose files did not change since the last time they 
+    were loaded with the same options are read from the cache instead of being parsed.
+    'files' is an optional list of file names in 'path' to be loaded instead of all the 
+    files with 'pattern' (e.g. a selection made with scan_directory).
+    """
+
+    _check_load_options( attrs , dt , t_unit , coord_unit , intensity_normalisation , dtype )
+
+    if prefetch < 1 : 
+        raise AttributeError( 'iter_directory: prefetch must be at least 1' )
+
+    if files is None :
+        files = _list_files( path , pattern )
+
+    if isinstance( cache , str ) :
+        cache = TrajCache( cache )
+
+    def load( executor , file ) :
+
+        return executor.submit( _load_trajectory , path , file , sep , comment_char , dt , t_unit , coord_unit , intensity_normalisation , attrs , cache , dtype )
+
+    def iterate() :
+
+        executor = ThreadPoolExecutor( max_workers = workers )
+        pending = deque()
+        queued = iter( files )
+
+        try :
+
+            #fill the read-ahead queue, then keep it full while trajectories are consumed
+            for file in queued :
+                pending.append( load( executor , file ) )
+                if len( pending ) >= prefetch : break
+
+            while pending :
+                trajectory = pending.popleft().result()
+                for file in queued :
+                    pending.append( load( executor , file ) )
+                    break
+                yield trajectory
+
+        finally :
+
+            #if the consumer stops early, do not parse the files left in the queue
+            for future in pending :
+                future.cancel()
+            executor.shutdown( wait = False )
+
+    return iterate()
+
+def load_directory(path , pattern = '.txt' , sep = None , comment_char = '#' , dt = None , t_unit = '' , coord_unit = '' , intensity_normalisation = 'None' , workers = 1 , cache = None , files = None , dtype = 'float64' , **attrs ):
+
+    """
+    load_directory(path , pattern = '.txt' , sep = None , comment_char = '#' , dt = None , t_unit = '' , coord_unit = '' , intensity_normalisation = 'None' , workers = 1 , cache = None , files = None , dtype = 'float64' , **attrs ):
     loads all the trajectories listed in 'path', which have the same 'pattern'.
     columns are separated by 'sep' (default is None: a indefinite number of 
     white spaces). Comments in the trajectory start with 'comment_char'.
@@ -50,51 +192,202 @@ def load_directory(path , pattern = '.txt' , sep = None , comment_char = '#' , d
     If the time interval is added (and 't' is not called in the **attrs) 
     then the time column 't' is added, and the 't_unit' can be set.
     If 'coord' is called then the unit must be added.
+
+    Files compressed with gzip, bzip2 or xz (.gz, .bz2 or .xz) are read 
+    transparently and the 'pattern' ignores the compression suffix.
+
+    'workers' is the number of threads that read (and decompress) the files in parallel. 
+    To process the trajectories one at a time, without loading them all 
+    in memory, see iter_directory.
+
+    'cache' is an optional TrajCache, or a directory name, used to avoid 
+    parsing again the files that did not change (see iter_directory).
+    'files' is an optional list of file names in 'path' to be loaded instead
+    of all the files with 'pattern' (see scan_directory).
+
+    'dtype' is the floating point type in which the trajectory attributes 
+    are stored: 'float64' (default) or 'float32', which halves the memory 
+    (see Traj.set_dtype).
     """
 
-    if ('coord' in attrs.keys()) & (len(coord_unit) == 0): 
-        raise AttributeError('Please, specify the coordinate unit \'coord_unit\'')
-    if ('t' in attrs.keys()) & (len(t_unit) == 0): 
-        raise AttributeError('Please, specify the time unit \'t_unit\'')
-    if (dt != None) & (len(t_unit) == 0): 
-        raise AttributeError('Please, specify the time unit \'t_unit\'')
-    if (dt != None) & ('t' in attrs.keys()):
-        raise AttributeError('Time is already loaded by the trajectories, you cannot also compute it from frames. Please, either remove the dt option or do not load the \'t\' column from the trajectories')
+    with instrument.stage( 'load_directory' ) :
+        trajectories = list( iter_directory( path , pattern = pattern , sep = sep , comment_char = comment_char , dt = dt , t_unit = t_unit , coord_unit = coord_unit , intensity_normalisation = intensity_normalisation , prefetch = 2 * workers , workers = workers , cache = cache , files = files , dtype = dtype , **attrs ) ) #the list of trajectories
+    
+    print( "\n >> load_directory: The 'intensity_normalisation' applied to the trajectories is '" + intensity_normalisation + "' <<\n" )
 
-    trajectories = [] #the list of trajectories
-    if ( pattern[ len( pattern ) - 1 ] == '$' ) : 
-        files = [ f for f in sorted( os.listdir(path) ) if f.endswith( pattern[ : - 1 ] ) ] #list all the files in path that have pattern
-    else : 
-        files = [ f for f in sorted( os.listdir(path) ) if pattern in f] #list all the files in path that have pattern
+    return trajectories 
+
+def scan_directory( path , pattern = '.txt' , comment_char = '#' , sep = None , frames = 0 ) :
 
-    for file in files:
-        trajectory = Traj(experiment = path, path = os.getcwd()+'/'+path, file = file)
-        trajectory.load(path+'/'+file,sep = sep, comment_char = comment_char, **attrs)
-        if (dt != None):
-            trajectory.time(dt,t_unit)
-        if ('coord' in attrs.keys()):
+    """
+    scan_directory( path , pattern = '.txt' , comment_char = '#' , sep = None , frames = 0 ): reads only the 
+    commented lines of the trajectory files in 'path' that have 'pattern' and counts their data rows, without 
+    converting the data. Returns a list with one dictionary per file:
+        { 'file' : file name , 'rows' : number of data rows , 'first_frame' : first frame , 'last_frame' : last frame , 
+        'annotations' : dictionary of the annotations in the file }
+    'frames' is the column containing the frame numbers; if frames = None, first_frame and last_frame are not read.
+    The files selected from the list can then be loaded with load_directory( path , files = [ ... ] , ... ).
+
+    example of usage:
+    table = scan_directory( 'raw_trajectories' , pattern = '.data' , comment_char = '%' )
+    selection = [ s[ 'file' ] for s in table if s[ 'rows' ] > 30 ]
+    """
 
-            trajectory.annotations('coord_unit',coord_unit)
+    table = []
 
-        if intensity_normalisation == 'Integral' :
+    for file in _list_files( path , pattern ) :
+
+        rows = 0
+        first = None
+        last = None
+        annotations = {}
+
+        with open_file( path + '/' + file , 'r' ) as f :
             
-            trajectory.scale_f()
+            for line in f :
+
+                if line.lstrip()[ 0:len( comment_char ) ] == comment_char :
+                    #annotations are split with spaces
+                    annotation = read_annotation( line.split( None ) )
+                    if annotation is not None :
+                        annotations[ annotation[ 0 ] ] = annotation[ 1 ]
+
+                elif line.strip() :
+                    #only the first and the last data rows are split
+                    if rows == 0 :
+                        first = line
+                    last = line
+                    rows += 1
+
+        entry = { 'file' : file , 'rows' : rows , 'first_frame' : None , 'last_frame' : None , 'annotations' : annotations }
+        if ( frames is not None ) & ( rows > 0 ) :
+            entry[ 'first_frame' ] = int( float( first.split( sep )[ frames ] ) )
+            entry[ 'last_frame' ] = int( float( last.split( sep )[ frames ] ) )
+
+        table.append( entry )
+
+    return table
+
+def _traj_from_rows( trajectory , rows , attrs ) :
+
+    #input the columns of rows (a 2D array) in the trajectory following the column 
+    #mapping in attrs, in the same order as Traj.load does
+    columns = [ a for a in attrs.keys() if '_'+a in trajectory._attribute_slots ]
+
+    if 'frames' in columns :
+        try:
+            trajectory.input_values( 'frames' , rows[ : , attrs[ 'frames' ] ].astype( 'int64' ) )
+        except:
+            raise AttributeError('iter_tracks: chronological disorder in the track "' + trajectory.annotations()[ 'track' ] + '".')
+    if 't' in columns :
+        trajectory.input_values( 't' , rows[ : , attrs[ 't' ] ] )
+    for a in columns :
+        if a in ( 'coord' , 'coord_err' ) :
+            trajectory.input_values( a , [ rows[ : , attrs[ a ][ 0 ] ] , rows[ : , attrs[ a ][ 1 ] ] ] )
+        elif a not in ( 'frames' , 't' ) :
+            trajectory.input_values( a , rows[ : , attrs[ a ] ] )
+    for a in [ a for a in attrs.keys() if a not in columns ] :
+        trajectory.annotations( a , attrs[ a ] )
+
+    return trajectory
+
+def iter_tracks( file_name , track , sep = None , comment_char = '#' , dt = None , t_unit = '' , coord_unit = '' , intensity_normalisation = 'None' , chunk_size = 10000 , closed_after = None , dtype = 'float64' , **attrs ) :
 
-        elif intensity_normalisation == 'Absolute' :
-        
-            trajectory.norm_f()
+    """
+    iter_tracks( file_name , track , sep = None , comment_char = '#' , dt = None , t_unit = '' , coord_unit = '' , intensity_normalisation = 'None' , chunk_size = 10000 , closed_after = None , dtype = 'float64' , **attrs ):
+    yields the trajectories stored in a single table that contains many tracks, such as the export of 
+    a tracker for a whole movie. 'track' is the column with the track identifiers. The file is read in 
+    chunks of 'chunk_size' rows, which are grouped by track, and each trajectory is yielded as soon as 
+    its track is complete. The other options are the same as in load_directory and **attrs maps 
+    the columns to the trajectory attributes (frames, t, coord, f, ...) and adds annotations.
+
+    By default the rows of each track must be contiguous in the file (i.e. the table is sorted by track).
+    If the table is instead sorted by frame, set 'closed_after' to the number of frames after its last 
+    row after which a track is considered complete (the 'frames' column is then required). Either way, 
+    only the tracks that are still open are held in memory.
+
+    example of usage:
+    for trajectory in iter_tracks( 'movie.txt' , track = 0 , dt = 0.1045 , t_unit = 's' , coord_unit = 'pxl' , frames = 1 , coord = ( 2 , 3 ) , f = 4 ) :
+        print( trajectory.annotations()[ 'track' ] , len( trajectory ) )
+    """
 
-        elif intensity_normalisation != 'None' :
+    _check_load_options( attrs , dt , t_unit , coord_unit , intensity_normalisation , dtype )
 
-            raise AttributeError( "load_directory: Please, choose a value for the variable intensity_normalisation between 'None' (no normalisation, default), 'Integral' (normalise over the integral of the fluorescence intensity), or 'Absolute' (normalise the fluorescence intensity values between 0 and 1)" )
+    if ( closed_after is not None ) & ( 'frames' not in attrs.keys() ) :
+        raise AttributeError( 'iter_tracks: closed_after requires the \'frames\' column' )
 
-        trajectory.annotations( 'intensity_normalisation' , intensity_normalisation )
-        trajectory.fill()
-        trajectories.append(trajectory)
-    
-    print( "\n >> load_directory: The 'intensity_normalisation' applied to the trajectories is '" + intensity_normalisation + "' <<\n" )
+    def new_trajectory( track_id , rows , annotations ) :
 
-    return trajectories 
+        if track_id == int( track_id ) : track_id = int( track_id )
+        trajectory = Traj( experiment = file_name , path = os.getcwd()+'/'+file_name , file = file_name + '.track' + str( track_id ) , track = str( track_id ) )
+        trajectory.annotations( dict( annotations ) )
+        _traj_from_rows( trajectory , np.concatenate( rows ) , attrs )
+        return _prepare_trajectory( trajectory , dt , t_unit , coord_unit , intensity_normalisation , attrs , dtype )
+
+    def chunks( f , annotations ) :
+
+        lines = []
+        for line in f :
+            if line.lstrip()[ 0:len( comment_char ) ] == comment_char :
+                annotation = read_annotation( line.split( None ) )
+                if annotation is not None : 
+                    annotations[ annotation[ 0 ] ] = annotation[ 1 ]
+            elif line.strip() :
+                lines.append( line )
+                if len( lines ) == chunk_size :
+                    yield np.loadtxt( lines , delimiter = sep , ndmin = 2 )
+                    lines = []
+        if len( lines ) :
+            yield np.loadtxt( lines , delimiter = sep , ndmin = 2 )
+
+    def iterate() :
+
+        annotations = {}
+        open_tracks = {} #track id -> list of the blocks of rows read so far
+        closed = set()
+
+        with open_file( file_name , 'r' ) as f :
+
+            for data in chunks( f , annotations ) :
+
+                ids = data[ : , track ]
+
+                if closed_after is None :
+
+                    #the rows of a track are contiguous: split the chunk where the track id changes
+                    bounds = np.concatenate( [ [ 0 ] , np.flatnonzero( ids[ 1: ] != ids[ :-1 ] ) + 1 , [ len( ids ) ] ] )
+                    for b0 , b1 in zip( bounds[ :-1 ] , bounds[ 1: ] ) :
+                        track_id = ids[ b0 ]
+                        if track_id not in open_tracks :
+                            #a new track starts, hence the previous one is complete
+                            for previous in list( open_tracks.keys() ) :
+                                yield new_trajectory( previous , open_tracks.pop( previous ) , annotations )
+                                closed.add( previous )
+                            if track_id in closed :
+                                raise AttributeError( 'iter_tracks: the rows of the track ' + str( track_id ) + ' are not contiguous; if the table is sorted by frame use closed_after' )
+                            open_tracks[ track_id ] = []
+                        open_tracks[ track_id ].append( data[ b0:b1 ] )
+
+                else :
+
+                    #group the rows of the chunk by track, keeping their order
+                    order = np.argsort( ids , kind = 'stable' )
+                    track_ids , starts = np.unique( ids[ order ] , return_index = True )
+                    for track_id , rows in zip( track_ids , np.split( data[ order ] , starts[ 1: ] ) ) :
+                        if track_id in closed :
+                            raise AttributeError( 'iter_tracks: the track ' + str( track_id ) + ' has rows more than closed_after frames apart' )
+                        open_tracks.setdefault( track_id , [] ).append( rows )
+
+                    #the table is sorted by frame: tracks with no rows in the last closed_after frames are complete
+                    last_frame = data[ -1 , attrs[ 'frames' ] ]
+                    for track_id in [ t for t in open_tracks.keys() if open_tracks[ t ][ -1 ][ -1 , attrs[ 'frames' ] ] + closed_after < last_frame ] :
+                        yield new_trajectory( track_id , open_tracks.pop( track_id ) , annotations )
+                        closed.add( track_id )
+
+        for track_id in list( open_tracks.keys() ) :
+            yield new_trajectory( track_id , open_tracks.pop( track_id ) , annotations )
+
+    return iterate()
 
 def MSD(input_t1 , input_t2):
 
@@ -103,55 +396,23 @@ def MSD(input_t1 , input_t2):
     Adapted from Horn, 1987, to the 2D case with means weighted on the product of the fluorescence intensities.
     """
 
-    msdt1 = cp.deepcopy(input_t1)
-    msdt2 = cp.deepcopy(input_t2)
+    instrument.count( 'MSD' )
 
+    #the sums are computed in double precision, also for trajectories stored in single precision.
+    #The trajectories are not copied, as the kernel does not change the arrays
+    f1 = input_t1.f().astype( 'float64' , copy = False )
+    f2 = input_t2.f().astype( 'float64' , copy = False )
 
-    if (len(msdt1.f()) == 0) | (len(msdt2.f()) == 0): 
+    if (len(f1) == 0) | (len(f2) == 0): 
         raise AttributeError('MSD(msdt1,msdt2) requires that trajectories msdt1 and msdt2 have values for the fluorescence intensity')
 
-    #the following code follow Horn's (1987) nomenclature. msdt1 is what is 
+    #the following code follow Horn's (1987) nomenclature. input_t1 is what is 
     #called in the paper as 'right coordinates'. 
-    #msdt2 is what is called as 'left coordinates'
-    
-    with wr.catch_warnings():
-        # if both f() are 0 or if their product is 0,  a warning about invalid true divide is output. Here we suppress such warnings.
-        wr.simplefilter("ignore", category=RuntimeWarning)
-        w = msdt1.f() * msdt2.f() / np.nansum( msdt1.f() * msdt2.f() )
-    #computed the center of mass, weigthed on the fluorescence intensity product
-    rc = np.array([ np.nansum( w * msdt1.coord()[0] ), np.nansum( w * msdt1.coord()[1] )])
-    lc = np.array([ np.nansum( w * msdt2.coord()[0] ), np.nansum( w * msdt2.coord()[1] )])
-
-    #translate the trajecotries to their weigthed center of mass
-    msdt1.translate( -1 * rc )
-    msdt2.translate( -1 * lc )
-
-    Sxx = np.nansum( w * msdt2.coord()[0] * msdt1.coord()[0] )
-    Sxy = np.nansum( w * msdt2.coord()[0] * msdt1.coord()[1] )
-    Syx = np.nansum( w * msdt2.coord()[1] * msdt1.coord()[0] )
-    Syy = np.nansum( w * msdt2.coord()[1] * msdt1.coord()[1] )
-
-    A = ( Syx - Sxy )
-    B = ( Sxx + Syy )
-
-    if ( ( A == 0 ) & ( B == 0 ) ):
-        theta = np.nan
-    else : 
-        theta = np.arctan2( - A , B )
-#        M = - A / B
-#
-#        theta1 = np.arctan( M )
-#        theta2 = theta1 + np.pi
-#        
-#        if B * np.cos(theta1) >= A * np.sin(theta1) :
-#            theta = theta1
-#        else:
-#            theta = theta2
-
-    msdt2.rotate( theta )
-
-    #the 'score' is the mean square displacement weighted on the cross correlation of the fluorescence intensities
-    score = np.nansum( w * ( msdt1.coord()[0] - msdt2.coord()[0] )**2 + w * ( msdt1.coord()[1] - msdt2.coord()[1] )**2 )
+    #input_t2 is what is called as 'left coordinates'. The centers of mass rc and lc are
+    #weigthed on the fluorescence intensity product (see kernels.horn)
+    theta , rc , lc , score = kernels.horn( 
+            input_t1.coord().astype( 'float64' , copy = False ) , f1 , 
+            input_t2.coord().astype( 'float64' , copy = False ) , f2 )
     
     #when the min_w is small and the software is sampling the start or end of trajectories,
     #which often have a large number of nan, then theta can become nan as M is the 
@@ -159,12 +420,12 @@ def MSD(input_t1 , input_t2):
     if theta != theta: 
         score = np.inf
 
-    return({ 
+    return( { 
         'angle' : theta,
         'rc' : rc,
         'lc' : lc,
         'score' : score
-        })
+        } )
 
 def nanMAD( x , axis = None , k = 1.4826):
     MAD = np.nanmedian( np.absolute( x - np.nanmedian( x , axis ) ) , axis )
@@ -212,116 +473,238 @@ def compute_average_start_and_end( trajectories_time_span , aligned_trajectories
 #-------------------------------------END-OF-DEFINITIONS-in-compute_average_start_and_end-----------------------------------
 def trajectory_average( aligned_trajectories_to_average , r , median , fimax ) :    
 
-    #define the trajectory where the average will be stored
-    t = Traj()
-
     #inherit the annotations from the reference trajectory
+    annotations = {}
     for a in aligned_trajectories_to_average[ r ].annotations().keys():
 
         if a == 'file':
-            t.annotations( 'reference_file' , aligned_trajectories_to_average[ r ].annotations()[ a ])
+            annotations[ 'reference_file' ] = aligned_trajectories_to_average[ r ].annotations()[ a ]
+        elif a in ( 'affine_transform' , 'time_shift' ) :
+            pass #the transformations applied to the reference do not apply to the average
         else :
-            t.annotations( a , aligned_trajectories_to_average[ r ].annotations()[ a ]) 
+            annotations[ a ] = aligned_trajectories_to_average[ r ].annotations()[ a ]
 
     if fimax :
-        t.annotations( 'fimax' , 'TRUE' )
+        annotations[ 'fimax' ] = 'TRUE'
 
     #group all the attributes of the aligned trajectories...
     attributes = [ a for a in aligned_trajectories_to_average[ r ].attributes() if a not in ('t','frames')] 
-    #create an empy dictionary where all the attributes that will be then averaged are stored
-    attributes_to_be_averaged = {}
+
+    #...and assign to each of them its rows in the buffer where the attributes of all 
+    #the trajectories are stored ('coord' has two rows, the other attributes one).
+    rows = {}
+    n_rows = 0
     for a in attributes:
-        attributes_to_be_averaged[a] = []
 
-    #merge all the trajectory attributes into the dictionary attributes_to_be_averaged.
-    for j in range( len( aligned_trajectories_to_average ) ):
+        if a[ len( a ) - 4 : len( a ) ] == '_err' :
+            
+            raise AttributeError('The trajectories to be averaged have already an non empty error element, suggeting that they are already the result of an average. These error currently are not propagated. Check that your trajectories are correct')
         
-        for a in attributes:
+        #if _a_err is in the trajectories slots, it means that the attribute a is not 
+        #an error attribute (i.e. an attribute ending by _err; in fact if a would end by '_err'
+        #then _a_err would have twice the appendix _err (i.e. _err_err) and would have 
+        #no equivalent in the trajectory __slots__. If _a_err is then in the trajectory
+        #slots, then both the mean and the sem can be computed. There is no sem without mean.
+
+        if '_' + a + '_err' not in Traj.__slots__:
+
+            raise AttributeError( 'The attribute ' + a + ' is not recongnised as an attribute' )
 
-            attributes_to_be_averaged[a].append(getattr(aligned_trajectories_to_average[ j ],'_'+a))
+        rows[ a ] = ( n_rows , getattr( aligned_trajectories_to_average[ r ] , a )().ndim ) 
+        n_rows += rows[ a ][ 1 ]
 
     #all the aligned trajectories are set to start at the same  mean_start and finish at mean_end computed from
     #trajectories_time_span in compute_average().Hence, the time interval is the same
-    t.input_values( 't' , aligned_trajectories_to_average[ r ].t()) 
+    values = { 't' : np.array( aligned_trajectories_to_average[ r ].t() , dtype = 'float64' ) }
+    l = len( aligned_trajectories_to_average[ r ] )
+
+    #merge all the trajectory attributes into one buffer of shape ( trajectories , rows , time points ).
+    attributes_to_be_averaged = np.empty( ( len( aligned_trajectories_to_average ) , n_rows , l ) )
+    for j in range( len( aligned_trajectories_to_average ) ):
         
-    #average the attributes of the trajectories and assign 
-    #them to the average trajectory [ r ]
+        for a in attributes:
+
+            x = getattr( aligned_trajectories_to_average[ j ] , a )()
+            if x.shape[ x.ndim - 1 ] != l :
+                raise IndexError( 'The aligned trajectories to be averaged must have the same length' )
+            attributes_to_be_averaged[ j , rows[ a ][ 0 ] : rows[ a ][ 0 ] + rows[ a ][ 1 ] ] = x
+
+    #average the attributes of the trajectories and compute their spread (MAD or standard
+    #deviation) in the same pass, reusing the centre and the number of not-nan data points
     with wr.catch_warnings():
         
         # if a line is made only of nan that are averaged, then a waring is outputed. Here we suppress such warnings.
         wr.simplefilter("ignore", category=RuntimeWarning)
+
+        valid = ~ np.isnan( attributes_to_be_averaged )
+        n = valid.sum( axis = 0 )
+
+        if median :
+
+            centre = np.nanmedian( attributes_to_be_averaged , axis = 0 )
+            spread = 1.4826 * np.nanmedian( np.absolute( attributes_to_be_averaged - centre ) , axis = 0 ) #see nanMAD
+
+        else :
+
+            x = np.where( valid , attributes_to_be_averaged , 0 )
+            centre = x.sum( axis = 0 ) / n
+            x = np.where( valid , attributes_to_be_averaged - centre , 0 )
+            spread = np.sqrt( ( x * x ).sum( axis = 0 ) / n )
+
+    #the number of not-nan data points is that of the first attribute, which 
+    #in case of two dims (as 'coord') is the first of its rows. 
+    if attributes :
+        n = n[ 0 ].astype( 'float64' )
+        n[ n == 0 ] = np.nan
+        values[ 'n' ] = n
+
+    for a in attributes: 
+
+        if rows[ a ][ 1 ] == 2 :
+            i = slice( rows[ a ][ 0 ] , rows[ a ][ 0 ] + 2 )
+        else :
+            i = rows[ a ][ 0 ]
+
+        values[ a ] = centre[ i ]
+
+        #compute the errors as standard errors of the mean/median
+        values[ a + '_err' ] = spread[ i ] / np.sqrt( values[ 'n' ] )
+
+    #the arrays are computed here, with the same length, hence the
+    #trajectory where the average is stored is created without validating them
+    return( Traj.from_arrays( annotations = annotations , validate = False , **values ) )
+#-------------------------------------END-OF-DEFINITION-of-trajectory_average-----------------------------------
+
+def _padded( x ) :
+
+    #stack the rows in x in a 2D array, padding the shorter ones with NaN
+    output = np.full( ( len( x ) , max( [ len( i ) for i in x ] + [ 0 ] ) ) , np.nan )
+    for i in range( len( x ) ) :
+        output[ i , : len( x[ i ] ) ] = x[ i ]
+    return output
+
+def theil_sen_slopes( x , y , max_pairs = 2**24 ) :
+
+    """
+    theil_sen_slopes( x , y ) returns the Theil-Sen estimate of the slope of the line y = a + b x for each 
+    row of the 2D arrays x and y: the median of the slopes of all the pairs of points in the row. NaN 
+    are ignored, so that rows of different lengths can be padded with NaN. The pairs are computed for 
+    several rows at once, up to 'max_pairs' pairs at the time.
+    """
+
+    x = np.atleast_2d( np.asarray( x , dtype = 'float64' ) )
+    y = np.atleast_2d( np.asarray( y , dtype = 'float64' ) )
+
+    i , j = np.triu_indices( x.shape[ 1 ] , 1 )
+    slopes = np.full( x.shape[ 0 ] , np.nan )
+    rows = max( 1 , max_pairs // max( len( i ) , 1 ) )
+
+    with wr.catch_warnings():
+        # pairs with a NaN or with the same x have no slope. Here we suppress the warnings.
+        wr.simplefilter("ignore", category=RuntimeWarning)
+        for k in range( 0 , x.shape[ 0 ] , rows ) :
+            dx = x[ k : k + rows , j ] - x[ k : k + rows , i ]
+            dy = y[ k : k + rows , j ] - y[ k : k + rows , i ]
+            dx[ dx == 0 ] = np.nan
+            slopes[ k : k + rows ] = np.nanmedian( dy / dx , axis = 1 )
     
-        for a in attributes: 
+    return slopes
 
-            if a[ len( a ) - 4 : len( a ) ] == '_err' :
-                
-                raise AttributeError('The trajectories to be averaged have already an non empty error element, suggeting that they are already the result of an average. These error currently are not propagated. Check that your trajectories are correct')
-            
-            #if _a_err is in the trajectories slots, it means that the attribute a is not 
-            #an error attribute (i.e. an attribute ending by _err; in fact if a would end by '_err'
-            #then _a_err would have twice the appendix _err (i.e. _err_err) and would have 
-            #no equivalent in the trajectory __slots__. If _a_err is then in the trajectory
-            #slots, then both the mean and the sem can be computed. There is no sem without mean.
+def lie_down_all( trajectories , method = 'ransac' ) :
 
-            if '_' + a + '_err' in t.__slots__:
-                
-                if median :
+    """
+    lie_down_all( trajectories , method = 'ransac' ) lies down all the trajectories in the list, 
+    as lie_down does, and returns the list of their transformations. The trajectories are processed
+    together, except for the RANSAC fits, which are computed one trajectory at the time.
+    """
 
-                    t.input_values( a ,
-                            np.nanmedian( attributes_to_be_averaged[ a ], axis = 0 )
-                        )
+    if method not in ( 'ransac' , 'theil_sen' ) :
+        raise AttributeError( 'The lie_down method must be either \'ransac\' or \'theil_sen\'' )
 
-                else :
+    n = len( trajectories )
 
-                    t.input_values( a ,
-                            np.nanmean( attributes_to_be_averaged[ a ], axis = 0 )
-                        )
+    #center the trajectories on the median of their coordinates
+    x = _padded( [ t.coord()[ 0 ] for t in trajectories ] )
+    y = _padded( [ t.coord()[ 1 ] for t in trajectories ] )
+    translation_vectors = [ ( - np.nanmedian( x[ i , : len( trajectories[ i ] ) ] ) , - np.nanmedian( y[ i , : len( trajectories[ i ] ) ] ) ) for i in range( n ) ]
+    translate_all( trajectories , translation_vectors )
+    apply_all( trajectories )
 
-                #if there is no n defined yet, it computes it
-                if not t.n().any() : 
-                    #compute the number of not-nan data points by dividing
-                    #the nansum by the nanmean. The operation is performed
-                    #on the last attribute in the loop that can either have 
-                    #two dimensions (as 'coord') or one. In case of two dims
-                    #only one is used to compute '_n'.
-                    
-                    x = np.nanmean( attributes_to_be_averaged[ a ] , axis = 0 )
-                    y = np.nansum( attributes_to_be_averaged[a] , axis = 0 )
-            
-                    if len(x) == 2:
-                        t.input_values( 'n' , y[0]/x[0] )
-                    else:
-                        with wr.catch_warnings():
-                            # if both y[i] and x[i] are 0, then a waring is outputed. Here we suppress such warnings.
-                            wr.simplefilter("ignore", category=RuntimeWarning)
-                            t.input_values( 'n' , y/x )
-
-                #compute the errors as standard errors of the mean/median
-                try :
-                    if median :
-
-                        t.input_values( a + '_err' ,
-                            nanMAD( attributes_to_be_averaged[ a ], axis = 0 ) / np.sqrt( t.n() )
-                            )
+    #orient their principal axis along x
+    x = _padded( [ t.coord()[ 0 ] for t in trajectories ] )
+    y = _padded( [ t.coord()[ 1 ] for t in trajectories ] )
+    f = _padded( [ t.f() for t in trajectories ] )
 
-                    else :
+    I_xx = np.nansum( f * y ** 2 , axis = 1 )
+    I_yy = np.nansum( f * x ** 2 , axis = 1 )
+    I_xy = np.nansum( f * x * y , axis = 1 )
+    
+    theta = np.arctan2( 2 * I_xy , I_xx - I_yy ) / 2
 
-                        t.input_values( a + '_err' ,
-                            np.nanstd( attributes_to_be_averaged[ a ], axis = 0 ) / np.sqrt( t.n() )
-                            )
+    I_x = I_xx + I_xy * np.tan( theta ) 
+    I_y = I_yy - I_xy * np.tan( theta )
 
-                except :
+    theta = np.where( I_x > I_y , theta - np.pi/2 , theta )
+    rotate_all( trajectories , theta )
+    apply_all( trajectories )
 
-                    raise AttributeError( 'The attribute ' + a + ' cannot have its error assigned' )
+    #and so that they point towards positive x
+    x = _padded( [ t.coord()[ 0 ] for t in trajectories ] )
 
-            else :
+    with wr.catch_warnings():
+        # if a row has no positive (or negative) coordinate a waring is outputed. Here we suppress such warnings.
+        wr.simplefilter("ignore", category=RuntimeWarning)
+        A = np.nanmedian( np.where( x > 0 , x ** 2 , np.nan ) , axis = 1 )
+        B = np.nanmedian( np.where( x < 0 , x ** 2 , np.nan ) , axis = 1 )
 
-                raise AttributeError( 'The attribute ' + a + ' is not recongnised as an attribute' )
+    flip = [ i for i in range( n ) if B[ i ] > A[ i ] ]
+    rotate_all( [ trajectories[ i ] for i in flip ] , np.pi )
+    apply_all( trajectories )
+    theta[ flip ] = theta[ flip ] + np.pi #to ouptput the angle
 
-    return( t )
-#-------------------------------------END-OF-DEFINITION-of-trajectory_average-----------------------------------
+    #fit a line through the coordinates, robust to outliers
+    x = _padded( [ t.coord()[ 0 ] for t in trajectories ] )
+    y = _padded( [ t.coord()[ 1 ] for t in trajectories ] )
+    valid = ~ np.isnan( x ) & ~ np.isnan( y )
+
+    if method == 'ransac' :
+
+        slopes = np.zeros( n )
+        for i in range( n ) :
+
+            model = linear_model.LinearRegression()    
+            model_RANSACR = linear_model.RANSACRegressor( model , random_state = 42 )
+
+            #the points are passed in reverse order, as they have always been
+            with wr.catch_warnings():
+                # also a bug warning occurs from linear models, RANSACR.
+                wr.simplefilter("ignore", category=RuntimeWarning)
+                model_RANSACR.fit( x[ i , valid[ i ] ][ ::-1 , np.newaxis ] , y[ i , valid[ i ] ][ ::-1 ] )
+
+            slopes[ i ] = model_RANSACR.estimator_.coef_[0]
+
+    else :
+
+        slopes = theil_sen_slopes( np.where( valid , x , np.nan ) , np.where( valid , y , np.nan ) )
+
+    rotate_all( trajectories , - np.arctan( slopes ) )
+    apply_all( trajectories )
+
+    return [ { 'translation' :  translation_vectors[ i ] , 'angle' : theta[ i ] - np.arctan( slopes[ i ] ) } for i in range( n ) ]
+
+def lie_down( t , method = 'ransac' ) :
+
+    """
+    lie_down( t , method = 'ransac' ) lies down the trajectory t: t is centered on the median of its coordinates
+    and rotated so that its principal axis lies along x, pointing towards positive x. The orientation is 
+    then refined by fitting a line through the coordinates, robust to outliers: 'ransac' uses the RANSAC 
+    regressor of scikit-learn, 'theil_sen' uses the Theil-Sen estimator, which is deterministic and faster.
+    lie_down returns the transformation applied to t as a dictionary { 'translation' : ... , 'angle' : ... }.
+    """
+
+    return lie_down_all( [ t ] , method )[ 0 ]
 
-def average_trajectories( trajectory_list , output_file = 'average' , median = False , unify_start_end = True , max_frame=[] , fimax = False , fimax_filter = [ -3/35 , 12/35 , 17/35 , 12/35 , -3/35 ] ):
+def average_trajectories( trajectory_list , output_file = 'average' , median = False , unify_start_end = True , max_frame=[] , fimax = False , fimax_filter = [ -3/35 , 12/35 , 17/35 , 12/35 , -3/35 ] , lie_down_method = 'ransac' , profile = None , progress = None , quiet = False , cancel = None , resume = None , checkpoint = None ):
 
     """
     average_trajectories( trajectory_list , max_frame = 500 , output_file = 'average' , median = False ): align all the 
@@ -331,8 +714,33 @@ def average_trajectories( trajectory_list , output_file = 'average' , median = F
     a directory with all the raw trajectories that have been used to compute the average aligned together in space and time.
     median is an option to compute the median instead of the average of the aligned trajectories. It is useful in case 
     of noisy datasets.
+    If 'output_file' ends with .gz, .bz2 or .xz, all the outputs are compressed accordingly and the directory is named 
+    after 'output_file' without the compression suffix.
+    'lie_down_method' is the robust line fit used to orient the average trajectory: 'ransac' or 'theil_sen' (see lie_down).
+    If 'profile' is True or a Profile (see trajalign.instrument), the time spent in each stage of the average and the 
+    calls of the kernels are measured and the Profile is returned after the aligned trajectories.
+    'progress' is a function, or a Progress (see trajalign.progress), to which the progress of the alignments of the 
+    pairs of trajectories and of the averages is reported. With 'quiet' = True, the alignments of the pairs and the 
+    alignment precisions are not printed. If the CancelToken 'cancel' is cancelled, the run stops before the next 
+    alignment and raises Cancelled, which carries the alignments computed so far: pass them as 'resume' to continue.
+    'checkpoint' is a file name, or a Checkpoint (see trajalign.progress), where the alignments of the pairs of 
+    trajectories computed so far are saved periodically (every 60 s by default), when the run is cancelled and when 
+    all the pairs are aligned. If the run dies, pass the file name as 'resume' to align only the missing pairs. 
+    The trajectories must be the same, as verified by their fingerprints (see Traj.fingerprint).
     """
 
+    with instrument.profiling( profile ) as p :
+        output = _average_trajectories( trajectory_list , output_file , median , unify_start_end , max_frame , fimax , fimax_filter , lie_down_method , progress , quiet , cancel , resume , checkpoint )
+
+    if p is None :
+        return output
+    else :
+        return output + ( p , )
+
+def _average_trajectories( trajectory_list , output_file , median , unify_start_end , max_frame , fimax , fimax_filter , lie_down_method , progress , quiet , cancel , resume , checkpoint ):
+
+    #see average_trajectories
+
     if len(trajectory_list) == 0 : 
 
         raise IndexError('There are not tajectories in the list; check that the trajectories were loaded correctly') 
@@ -340,6 +748,10 @@ def average_trajectories( trajectory_list , output_file = 'average' , median = F
     if not max_frame :
 
         raise TypeError('You need to specify the max_frame, which is the frame number in your movies')
+
+    if lie_down_method not in ( 'ransac' , 'theil_sen' ) :
+
+        raise AttributeError( 'The lie_down_method must be either \'ransac\' or \'theil_sen\'' )
     
     def R(alpha):
         """
@@ -429,58 +841,6 @@ def average_trajectories( trajectory_list , output_file = 'average' , median = F
                         alignments[ len( alignments ) - 1 ][ 'score' ] / np.sqrt( len( sel_t1 ) )
         return()
 
-    def lie_down( t ):
-        translation_vector = ( - np.nanmedian( t.coord()[0] ) ,- np.nanmedian( t.coord()[1] ) )
-        t.translate( translation_vector )
-        
-        I_xx = np.nansum( t.f() * t.coord()[1] ** 2 )
-        I_yy = np.nansum( t.f() * t.coord()[0] ** 2 )
-        I_xy = np.nansum( t.f() * t.coord()[0] * t.coord()[1] )
-        
-        theta = np.arctan2( 2 * I_xy , I_xx - I_yy ) / 2
-
-        I_x = I_xx + I_xy * np.tan( theta ) 
-        I_y = I_yy - I_xy * np.tan( theta )
-    
-        if I_x > I_y : theta = theta - np.pi/2
-        t.rotate( theta )
-
-        with wr.catch_warnings():
-            # if a coord has nan then a waring is outputed when nan > 0 or nan < 0 is asked. Here we suppress such warnings.
-            wr.simplefilter("ignore", category=RuntimeWarning)
-            A = np.nanmedian( t.coord()[0][ t.coord()[0] > 0 ] ** 2 )
-            B = np.nanmedian( t.coord()[0][ t.coord()[0] < 0 ] ** 2 )
-
-            if B > A : 
-                t.rotate( np.pi )
-                theta = theta + np.pi #to ouptput the angle
-        
-        model = linear_model.LinearRegression()    
-        model_RANSACR = linear_model.RANSACRegressor( model , random_state = 42 )
-        
-        l = len( t )
-        
-        j = 0
-        for i in range( l ) :
-            
-            if ( not np.isnan( t.coord()[ 0 ][ i ] ) ) & ( not np.isnan( t.coord()[ 1 ][ i ] ) ) :
-                if j == 0 :
-                    X = np.array( [[ t.coord()[ 0 ][ i ] ]] )
-                    y = np.array( [ t.coord()[ 1 ][ i ] ] )
-                else :
-                    X = np.insert( X , 0 , t.coord()[ 0 ][ i ] , axis = 0 )
-                    y = np.insert( y , 0 , t.coord()[ 1 ][ i ] , axis = 0 )
-                j += 1
-
-        with wr.catch_warnings():
-            # also a bug warning occurs from linear models, RANSACR.
-            wr.simplefilter("ignore", category=RuntimeWarning)
-            model_RANSACR.fit( X , y )
-        
-        t.rotate( - np.arctan( model_RANSACR.estimator_.coef_[0] ) )
-
-        return( { 'translation' :  translation_vector , 'angle' : theta - np.arctan( model_RANSACR.estimator_.coef_[0] ) } )
-    
     #-------------------------------------END-OF-DEFINITIONS-in-average_trajectories-----------------------------------
 
     def compute_transformations( t1 , t1_index , trajectory_list , fimax , fimax_filter ) :
@@ -509,11 +869,23 @@ def average_trajectories( trajectory_list , output_file = 'average' , median = F
     
                 else :
 
+                    j = trajectory_list.index( traj2 )
+                    if ( t1_index , j ) in partial[ 'pairs' ] :
+                        #the pair was aligned in the run that is resumed
+                        selected_alignments.append( partial[ 'pairs' ][ ( t1_index , j ) ] )
+                        continue
+
+                    if ( cancel is not None ) and cancel.cancelled() :
+                        if checkpoint is not None :
+                            checkpoint.save( partial , force = True )
+                        raise Cancelled( partial )
+
                     t2 = cp.deepcopy( traj2 )
                     #t2.norm_f()
 
-                    print( 'ref. traj.:\t' + t1.annotations()['file'] )
-                    print( 'aligned traj.:\t' + t2.annotations()['file'] )
+                    if not quiet :
+                        print( 'ref. traj.:\t' + t1.annotations()['file'] )
+                        print( 'aligned traj.:\t' + t2.annotations()['file'] )
 
                     alignments = []
     
@@ -581,13 +953,19 @@ def average_trajectories( trajectory_list , output_file = 'average' , median = F
     
                     refined_s_2 = [  a['score'] for a in refined_alignments_2 ]
                 
-                    selected_alignments.append( refined_alignments_2[ refined_s_2.index( min( refined_s_2 ) ) ] )
+                    partial[ 'pairs' ][ ( t1_index , j ) ] = refined_alignments_2[ refined_s_2.index( min( refined_s_2 ) ) ]
+                    selected_alignments.append( partial[ 'pairs' ][ ( t1_index , j ) ] )
+                    if checkpoint is not None :
+                        checkpoint.save( partial )
+                    progress.update( 'compute_transformations' , len( partial[ 'pairs' ] ) , n_pairs )
     
-            if ( fimax ) :
+            if not quiet :
 
-                print('\nfimax = True; Transformations were computed using only the trajectory information up to the max in fluorescence intensity.')
+                if ( fimax ) :
+
+                    print('\nfimax = True; Transformations were computed using only the trajectory information up to the max in fluorescence intensity.')
     
-            print('________________')
+                print('________________')
             
             return( selected_alignments )
 
@@ -607,7 +985,11 @@ def average_trajectories( trajectory_list , output_file = 'average' , median = F
 
         l = len(transformations['angles'])
         #reference trajectories are indexed with r
+        progress.update( 'compute_average' , 0 , l )
         for r in range( l ) :
+
+            if cancel is not None : 
+                cancel.check( partial )
         
             #define a dictionary used to store the starts and ends of the aligned
             #trajectories to compute the start of the average trajectory
@@ -632,6 +1014,7 @@ def average_trajectories( trajectory_list , output_file = 'average' , median = F
             ##################################################    
             #align the trajectoris together in space and time
             ##################################################    
+            l_cms = []
             for j in range(l):
             
                 trajectories_time_span[ 'old_start' ].append(aligned_trajectories[ r ][ j ].start())
@@ -639,25 +1022,30 @@ def average_trajectories( trajectory_list , output_file = 'average' , median = F
                 
                 #compute the center of mass of the full trajectory
     
-                l_cm = np.mean([rcs[ j , r ] for r in range(l) if r != j ] , axis=0 )
-        
-                # the following is equivalent to
-                #
-                # R( m_angles ) @ aligned_trajectories + T
-                #
-                # where R would be the rotation matrix computed from m_angles
-                # and T is the translation computed as
-                #
-                # r_cm - R( m_angles ) @ l_cm
-                #
-                # see Horn 1987 for details.
-                aligned_trajectories[ r ][ j ].translate( - l_cm )
-                aligned_trajectories[ r ][ j ].rotate( m_angles[ j ] )
-    
-                aligned_trajectories[ r ][ j ].translate( r_cm )
+                l_cms.append( np.mean([rcs[ j , r ] for r in range(l) if r != j ] , axis=0 ) )
+
+            # the following is equivalent to
+            #
+            # R( m_angles ) @ aligned_trajectories + T
+            #
+            # where R would be the rotation matrix computed from m_angles
+            # and T is the translation computed as
+            #
+            # r_cm - R( m_angles ) @ l_cm
+            #
+            # see Horn 1987 for details.
+            #
+            # The transformations of all the trajectories are computed together.
+            translate_all( aligned_trajectories[ r ] , - np.array( l_cms ) )
+            rotate_all( aligned_trajectories[ r ] , m_angles )
+            translate_all( aligned_trajectories[ r ] , r_cm )
+            apply_all( aligned_trajectories[ r ] )
+
+            for j in range(l):
+
                 aligned_trajectories[ r ][ j ].lag( m_lags[ j ] )
 
-                aligned_trajectories[ r ][ j ].annotations()[ 'l_cm' ] = tuple( l_cm )
+                aligned_trajectories[ r ][ j ].annotations()[ 'l_cm' ] = tuple( l_cms[ j ] )
                 aligned_trajectories[ r ][ j ].annotations()[ 'r_cm' ] = tuple( r_cm )
                 aligned_trajectories[ r ][ j ].annotations()[ 'm_angle' ] = m_angles[ j ]
                 aligned_trajectories[ r ][ j ].annotations()[ 'm_lag' ] = m_lags[ j ]
@@ -724,24 +1112,27 @@ def average_trajectories( trajectory_list , output_file = 'average' , median = F
                         )
                     )
             alignment_precision.append(mean_precision)
+            progress.update( 'compute_average' , r + 1 , l )
         
-        print('ALIGNMENT PRECISIONS.\nMIN is the alignment\nselected for the average\n----------------------')
-        for a in alignment_precision :
-            
-            if a == min( alignment_precision ) :
+        if not quiet :
 
-                print( 'MIN>>\t' + str( a ) )
+            print('ALIGNMENT PRECISIONS.\nMIN is the alignment\nselected for the average\n----------------------')
+            for a in alignment_precision :
+                
+                if a == min( alignment_precision ) :
+
+                    print( 'MIN>>\t' + str( a ) )
+                
+                elif a == max( alignment_precision ) :
             
-            elif a == max( alignment_precision ) :
-        
-                print( 'MAX>>\t' + str( a ) )
+                    print( 'MAX>>\t' + str( a ) )
+                
+                else :
             
-            else :
-        
-                print( '\t' + str( a ) )
+                    print( '\t' + str( a ) )
 
-        print('----------------------')
-        print( 'MEAN:\t' + str( np.mean( alignment_precision ) ) )
+            print('----------------------')
+            print( 'MEAN:\t' + str( np.mean( alignment_precision ) ) )
 
         return( aligned_trajectories , average_trajectory , alignment_precision )
     
@@ -749,6 +1140,24 @@ def average_trajectories( trajectory_list , output_file = 'average' , median = F
 
     header() 
 
+    progress = as_progress( progress )
+    checkpoint = as_checkpoint( checkpoint )
+
+    #the alignments of the pairs of trajectories computed so far, indexed by ( reference , aligned ). They are
+    #carried by Cancelled if the run is cancelled, and can be passed as 'resume' to continue the run.
+    partial = {
+            'fingerprints' : [ t.fingerprint() for t in trajectory_list ] ,
+            'fimax' : ( fimax , tuple( fimax_filter ) ) ,
+            'pairs' : {}
+            }
+    if resume is not None :
+        resume = load_state( resume )
+        if ( resume[ 'fingerprints' ] != partial[ 'fingerprints' ] ) or ( resume[ 'fimax' ] != partial[ 'fimax' ] ) :
+            raise AttributeError( 'The run to resume was computed on different trajectories or with different fimax options' )
+        partial[ 'pairs' ].update( resume[ 'pairs' ] )
+
+    n_pairs = len( trajectory_list ) * ( len( trajectory_list ) - 1 ) // 2
+
     #define the list where transformations are stored
     transformations = {
             'angles' : np.array( [] ),
@@ -758,6 +1167,14 @@ def average_trajectories( trajectory_list , output_file = 'average' , median = F
             'lag_units' : np.array( [] )
             }
 
+    if fimax :
+
+        #find where fimax cuts each trajectory once for all, as the trajectories are cut
+        #in each row of the transformation matrix
+        with instrument.stage( 'fimax' ) :
+            fimax_indices( trajectory_list , fimax_filter )
+
+    progress.update( 'compute_transformations' , len( partial[ 'pairs' ] ) , n_pairs )
     for traj1 in trajectory_list:
 
         #t1 is the reference trajectory to which all the other trajectories are alinged
@@ -773,7 +1190,8 @@ def average_trajectories( trajectory_list , output_file = 'average' , median = F
         t1_index = trajectory_list.index(traj1)     
         #t1.norm_f()
 
-        selected_alignments = compute_transformations( t1 , t1_index , trajectory_list , fimax , fimax_filter )
+        with instrument.stage( 'compute_transformations' ) :
+            selected_alignments = compute_transformations( t1 , t1_index , trajectory_list , fimax , fimax_filter )
 
         #Create a matrix with all the transformations: angle, lag and center of masses. 
         #As a convention the element i,j in the matrix contains the elements for the
@@ -816,6 +1234,10 @@ def average_trajectories( trajectory_list , output_file = 'average' , median = F
                     )
                 ])
 
+    #all the pairs are aligned
+    if checkpoint is not None :
+        checkpoint.save( partial , force = True )
+
     transformations['angles'] = transformations['angles'] - np.transpose(transformations['angles'])
     transformations['lags'] = transformations['lags'] - np.transpose(transformations['lags'])
     
@@ -824,55 +1246,60 @@ def average_trajectories( trajectory_list , output_file = 'average' , median = F
         transformations['lcs'][ i , i ] = [ 0 , 0 ]
     
     #compute the average transformation using each trajectory as possible reference
-    aligned_trajectories , average_trajectory , alignment_precision = compute_average( trajectory_list , transformations , median , fimax , max_frame , unify_start_end )
+    with instrument.stage( 'compute_average' ) :
+        aligned_trajectories , average_trajectory , alignment_precision = compute_average( trajectory_list , transformations , median , fimax , max_frame , unify_start_end )
 
     best_average = alignment_precision.index( np.nanmin( alignment_precision ) ) 
     worst_average = alignment_precision.index( np.nanmax( alignment_precision ) ) 
 
-    if not unify_start_end :
+    with instrument.stage( 'lie_down' ) :
 
-        # compute the lie_down only on the part of the trajectory that represents
-        # most of the average trajectories. That would be the part of average trajectory 
-        # chosen if unify_start_end = True, i.e. the part of trajectory comprised between
-        # the annotations unified_start and unified_end
-        average_trajectory_tmp = cp.deepcopy( average_trajectory[ best_average ] )
-        average_trajectory_tmp.start( float( average_trajectory_tmp.annotations()[ 'unified_start' ] ) )
-        average_trajectory_tmp.end( float( average_trajectory_tmp.annotations()[ 'unified_end' ] ) )
-        lie_down_transform = lie_down( average_trajectory_tmp )
+        if not unify_start_end :
 
-        # lie_down modified average_trajectory_tmp with the transformations in dict lie_down_transform
-        # we apply these transformations to average_trajectory[ best_average ]
-        average_trajectory[ best_average ].translate( lie_down_transform[ 'translation' ] )
-        average_trajectory[ best_average ].rotate( lie_down_transform[ 'angle' ] )
+            # compute the lie_down only on the part of the trajectory that represents
+            # most of the average trajectories. That would be the part of average trajectory 
+            # chosen if unify_start_end = True, i.e. the part of trajectory comprised between
+            # the annotations unified_start and unified_end
+            average_trajectory_tmp = cp.deepcopy( average_trajectory[ best_average ] )
+            average_trajectory_tmp.start( float( average_trajectory_tmp.annotations()[ 'unified_start' ] ) )
+            average_trajectory_tmp.end( float( average_trajectory_tmp.annotations()[ 'unified_end' ] ) )
+            lie_down_transform = lie_down( average_trajectory_tmp , lie_down_method )
 
-    else :
-    
-        lie_down_transform = lie_down( average_trajectory[ best_average ] )
-
-    average_trajectory[ best_average ].annotations()[ 'trajalign_version' ] = header( printit = False )
-    average_trajectory[ best_average ].save( output_file )
-
-    #save the trajectories use to compute the average, lied down as the average trajectory
-    for i in range(l):
-        aligned_trajectories[ best_average ][ i ].translate( lie_down_transform[ 'translation' ] )
-        aligned_trajectories[ best_average ][ i ].rotate( lie_down_transform[ 'angle' ] )
-        aligned_trajectories[ best_average ][ i ].annotations()[ 'trajalign_version' ] = header( printit = False )
-        aligned_trajectories[ best_average ][ i ].annotations()[ 'lie_down_angle' ] = lie_down_transform[ 'angle' ]
-        aligned_trajectories[ best_average ][ i ].annotations()[ 'lie_down_translation' ] = tuple( lie_down_transform[ 'translation' ] )
+            # lie_down modified average_trajectory_tmp with the transformations in dict lie_down_transform
+            # we apply these transformations to average_trajectory[ best_average ]
+            average_trajectory[ best_average ].translate( lie_down_transform[ 'translation' ] )
+            average_trajectory[ best_average ].rotate( lie_down_transform[ 'angle' ] )
 
-        filename = "./" + output_file + "/" + aligned_trajectories[ best_average ][ i ].annotations()[ 'file' ]
-        if i == 0 :
-            directory = os.path.dirname( filename )
-            if not os.path.exists( directory ) :
-                os.makedirs( directory )
-        aligned_trajectories[ best_average ][ i ].save( filename )
+        else :
     
-    with open( "./" + output_file + "/alignment_precision.txt" , 'w' ) as f :
-
-        for ap in alignment_precision :    
-            f.write( repr( ap ) + '\n' )
+            lie_down_transform = lie_down( average_trajectory[ best_average ] , lie_down_method )
+
+    with instrument.stage( 'save' ) :
+
+        average_trajectory[ best_average ].annotations()[ 'trajalign_version' ] = header( printit = False )
+        average_trajectory[ best_average ].save( output_file )
+
+        #save the trajectories use to compute the average, lied down as the average trajectory
+        output_name , compression = split_compression( output_file )
+        translate_all( aligned_trajectories[ best_average ] , lie_down_transform[ 'translation' ] )
+        rotate_all( aligned_trajectories[ best_average ] , lie_down_transform[ 'angle' ] )
+        apply_all( aligned_trajectories[ best_average ] )
+        for i in range(l):
+            aligned_trajectories[ best_average ][ i ].annotations()[ 'trajalign_version' ] = header( printit = False )
+            aligned_trajectories[ best_average ][ i ].annotations()[ 'lie_down_angle' ] = lie_down_transform[ 'angle' ]
+            aligned_trajectories[ best_average ][ i ].annotations()[ 'lie_down_translation' ] = tuple( lie_down_transform[ 'translation' ] )
+
+            filename = "./" + output_name + "/" + split_compression( aligned_trajectories[ best_average ][ i ].annotations()[ 'file' ] )[ 0 ] + compression
+            if i == 0 :
+                directory = os.path.dirname( filename )
+                if not os.path.exists( directory ) :
+                    os.makedirs( directory )
+            aligned_trajectories[ best_average ][ i ].save( filename )
     
-    f.close()
+        with open_file( "./" + output_name + "/alignment_precision.txt" + compression , 'w' ) as f :
+
+            for ap in alignment_precision :    
+                f.write( repr( ap ) + '\n' )
 
     return( average_trajectory[ best_average ] , average_trajectory[ worst_average ] , aligned_trajectories[ best_average ] )
 
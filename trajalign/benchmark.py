@@ -0,0 +1,253 @@
+# All the software here is distributed under the terms of the GNU General Public License Version 3, June 2007.
+# Trajalign is a free software and comes with ABSOLUTELY NO WARRANTY.
+#
+# You are welcome to redistribute the software. However, we appreciate is use of such software would result in citations of
+# Picco, A., Kaksonen, M., _Precise tracking of the dynamics of multiple proteins in endocytic events_,  Methods in Cell Biology, Vol. 139, pages 51-68 (2017)
+# http://www.sciencedirect.com/science/article/pii/S0091679X16301546
+#
+# Author: Andrea Picco (https://github.com/apicco)
+# Year: 2017
+
+"""
+Micro-benchmarks of the kernels of trajalign, on synthetic trajectories (see trajalign.synthetic), which
+run offline. Each kernel is timed on trajectories of increasing length and the results report the seconds
+per call, the calls per second and the scaling exponent of the kernel, i.e. the slope of log( seconds ) vs
+log( length ). The results are saved as JSON, so that runs can be compared. The memoization of the results
+(see trajalign.memo) is disabled while the kernels are timed.
+
+EXAMPLE:
+
+python -m trajalign.benchmark --lengths 25 50 100 200 --output new.json --compare old.json
+
+or, from python:
+
+from trajalign import benchmark
+results = benchmark.run( lengths = [ 25 , 50 , 100 , 200 ] , kernels = [ 'MSD' , 'cc' ] )
+benchmark.save( results , 'new.json' )
+print( benchmark.table( results , benchmark.load( 'old.json' ) ) )
+"""
+
+import json
+import time
+import platform
+import argparse
+import copy as cp
+import numpy as np
+
+from trajalign import memo
+from trajalign.kernels import backend
+from trajalign.align import spline , cc
+from trajalign.average import MSD , lie_down
+from trajalign.synthetic import synthetic_trajectories
+
+#the kernels: name -> ( function , whether the function modifies its input trajectories ).
+#Each function is called on two synthetic trajectories t1 and t2 of the same length.
+_kernels = {
+        'MSD' : ( lambda t1 , t2 : MSD( t1 , t2 ) , False ) ,
+        'cc' : ( lambda t1 , t2 : cc( t1 , t2 ) , False ) , #on the splines of the trajectories, as in align
+        'spline' : ( lambda t1 , t2 : spline( t1 , t2 ) , False ) ,
+        'fill' : ( lambda t1 , t2 : t1.fill() , True ) ,
+        'start' : ( lambda t1 , t2 : t1.start( t1.start() + t1.lifetime() / 4 ) , True ) ,
+        'end' : ( lambda t1 , t2 : t1.end( t1.end() - t1.lifetime() / 4 ) , True ) ,
+        'extract' : ( lambda t1 , t2 : t1.extract( list( range( len( t1 ) // 4 , 3 * len( t1 ) // 4 ) ) ) , False ) ,
+        'msd' : ( lambda t1 , t2 : t1.msd() , True ) ,
+        'fimax' : ( lambda t1 , t2 : t1.fimax( [ -3/35 , 12/35 , 17/35 , 12/35 , -3/35 ] ) , True ) , #fimax caches its result in the trajectory
+        'lie_down' : ( lambda t1 , t2 : lie_down( t1 ) , True )
+        }
+
+def kernels() :
+
+    """
+    kernels() returns the names of the kernels that can be benchmarked.
+    """
+
+    return list( _kernels.keys() )
+
+def environment( **options ) :
+
+    """
+    environment( **options ) returns the date, the versions of python and numpy, the machine and the backend
+    of the kernels (see trajalign.kernels) of a benchmark run, together with its 'options'.
+    """
+
+    output = {
+            'date' : time.strftime( '%Y-%m-%d %H:%M:%S' ) ,
+            'python' : platform.python_version() ,
+            'numpy' : np.__version__ ,
+            'machine' : platform.machine() ,
+            'processor' : platform.processor() ,
+            'backend' : backend()
+            }
+    output.update( options )
+
+    return output
+
+def exponent( x , seconds ) :
+
+    """
+    exponent( x , seconds ) returns the scaling exponent of the seconds vs x, i.e. the slope of log( seconds ) vs log( x ).
+    """
+
+    return float( np.polyfit( np.log( x ) , np.log( seconds ) , 1 )[ 0 ] )
+
+def _measure( function , t1 , t2 , copies , min_time , repeat ) :
+
+    """
+    _measure( function , t1 , t2 , copies , min_time , repeat ): the seconds per call of function( t1 , t2 ). The
+    number of calls is doubled until they last at least min_time seconds, and the best of 'repeat' runs is returned.
+    If 'copies' is True each call is done on new copies of t1 and t2, which are made before the timing starts.
+    """
+
+    def timed( n ) :
+
+        if copies :
+            inputs = [ ( cp.deepcopy( t1 ) , cp.deepcopy( t2 ) ) for i in range( n ) ]
+        else :
+            inputs = [ ( t1 , t2 ) ] * n
+
+        t0 = time.perf_counter()
+        for a , b in inputs :
+            function( a , b )
+        return time.perf_counter() - t0
+
+    n = 1
+    seconds = timed( n )
+    while seconds < min_time :
+        n = 2 * n
+        seconds = timed( n )
+
+    for r in range( repeat - 1 ) :
+        seconds = min( seconds , timed( n ) )
+
+    return seconds / n
+
+def run( lengths = [ 25 , 50 , 100 , 200 , 400 ] , kernels = None , min_time = 0.2 , repeat = 3 , seed = 0 ) :
+
+    """
+    run( lengths = [ 25 , 50 , 100 , 200 , 400 ] , kernels = None , min_time = 0.2 , repeat = 3 , seed = 0 ) times
+    the kernels (all of them if None, see kernels()) on synthetic trajectories of each length and returns the results:
+    { 'meta' : { ... } , 'kernels' : { name : { 'lengths' , 'seconds' , 'ops_per_s' , 'exponent' } } }
+    """
+
+    if kernels is None :
+        kernels = list( _kernels.keys() )
+    for name in kernels :
+        if name not in _kernels :
+            raise AttributeError( 'Unknown kernel ' + repr( name ) + ', the kernels are: ' + ', '.join( _kernels.keys() ) )
+    if len( lengths ) < 2 :
+        raise AttributeError( 'At least two lengths are needed to compute the scaling exponents' )
+
+    #the trajectories, with NaN and, for fill, with missing time points and, for cc, splined
+    trajectories = {}
+    for l in lengths :
+        trajectories[ l ] = synthetic_trajectories( 2 , length = l , template_length = l , seed = seed )[ 0 ]
+        trajectories[ ( 'missing' , l ) ] = synthetic_trajectories( 2 , length = l , template_length = l , missing_fraction = 0.1 , seed = seed )[ 0 ]
+        trajectories[ ( 'spline' , l ) ] = spline( *trajectories[ l ] )
+
+    results = {
+            'meta' : environment( min_time = min_time , repeat = repeat , seed = seed ) ,
+            'kernels' : {}
+            }
+
+    size = memo.size()
+    memo.set_size( 0 )
+    try :
+        for name in kernels :
+            function , copies = _kernels[ name ]
+            seconds = []
+            for l in lengths :
+                if name == 'fill' :
+                    t1 , t2 = trajectories[ ( 'missing' , l ) ]
+                elif name == 'cc' :
+                    t1 , t2 = trajectories[ ( 'spline' , l ) ]
+                else :
+                    t1 , t2 = trajectories[ l ]
+                seconds.append( _measure( function , t1 , t2 , copies , min_time , repeat ) )
+            results[ 'kernels' ][ name ] = {
+                    'lengths' : list( lengths ) ,
+                    'seconds' : seconds ,
+                    'ops_per_s' : [ 1 / s for s in seconds ] ,
+                    'exponent' : exponent( lengths , seconds )
+                    }
+    finally :
+        memo.set_size( size )
+
+    return results
+
+def save( results , file_name ) :
+
+    """
+    save( results , file_name ) saves the results of run in the JSON file 'file_name'.
+    """
+
+    with open( file_name , 'w' ) as f :
+        json.dump( results , f , indent = 2 )
+
+def load( file_name ) :
+
+    """
+    load( file_name ) loads the results of run saved in the JSON file 'file_name'.
+    """
+
+    with open( file_name , 'r' ) as f :
+        return json.load( f )
+
+def compare( results , previous ) :
+
+    """
+    compare( results , previous ) returns, for each kernel and length timed in both results, the ratio between
+    the seconds per call in 'results' and in 'previous': { name : { length : ratio } }. Ratios larger than 1
+    mean that the kernel got slower.
+    """
+
+    ratios = {}
+    for name , r in results[ 'kernels' ].items() :
+        if name in previous[ 'kernels' ] :
+            p = previous[ 'kernels' ][ name ]
+            old = dict( zip( p[ 'lengths' ] , p[ 'seconds' ] ) )
+            ratios[ name ] = { l : s / old[ l ] for l , s in zip( r[ 'lengths' ] , r[ 'seconds' ] ) if l in old }
+    return ratios
+
+def table( results , previous = None ) :
+
+    """
+    table( results , previous = None ) returns the results as a table of calls per second, with the scaling
+    exponents and, if the results of a previous run are given, the ratios of the seconds per call (see compare).
+    """
+
+    lengths = sorted( set( l for r in results[ 'kernels' ].values() for l in r[ 'lengths' ] ) )
+    if previous is not None :
+        ratios = compare( results , previous )
+
+    output = '%-10s' % 'ops/s' + ''.join( '%12s' % ( 'L=' + str( l ) ) for l in lengths ) + '%10s' % 'exponent' + '\n'
+    for name , r in results[ 'kernels' ].items() :
+        ops = dict( zip( r[ 'lengths' ] , r[ 'ops_per_s' ] ) )
+        output += '%-10s' % name + ''.join( '%12.1f' % ops[ l ] if l in ops else '%12s' % '-' for l in lengths ) + '%10.2f' % r[ 'exponent' ] + '\n'
+        if ( previous is not None ) and ( name in ratios ) :
+            output += '%-10s' % '  vs prev' + ''.join( '%12s' % ( '%.2fx' % ratios[ name ][ l ] ) if l in ratios[ name ] else '%12s' % '-' for l in lengths ) + '\n'
+    return output
+
+def main( argv = None ) :
+
+    parser = argparse.ArgumentParser( prog = 'python -m trajalign.benchmark' , description = 'Micro-benchmarks of the kernels of trajalign on synthetic trajectories.' )
+    parser.add_argument( '--lengths' , type = int , nargs = '+' , default = [ 25 , 50 , 100 , 200 , 400 ] , help = 'the lengths of the trajectories' )
+    parser.add_argument( '--kernels' , nargs = '+' , default = None , choices = kernels() , help = 'the kernels to time (default all)' )
+    parser.add_argument( '--min-time' , type = float , default = 0.2 , help = 'the minimum seconds of each timing' )
+    parser.add_argument( '--repeat' , type = int , default = 3 , help = 'the number of timings, of which the best is kept' )
+    parser.add_argument( '--seed' , type = int , default = 0 , help = 'the seed of the synthetic trajectories' )
+    parser.add_argument( '--output' , default = 'trajalign_benchmark.json' , help = 'the JSON file where the results are saved' )
+    parser.add_argument( '--compare' , default = None , help = 'the JSON file of a previous run to compare with' )
+    args = parser.parse_args( argv )
+
+    results = run( args.lengths , args.kernels , args.min_time , args.repeat , args.seed )
+    save( results , args.output )
+
+    previous = None
+    if args.compare is not None :
+        previous = load( args.compare )
+
+    print( table( results , previous ) )
+    print( 'Results saved in ' + args.output )
+
+if __name__ == '__main__' :
+    main()
@@ -0,0 +1,139 @@
+# All the software here is distributed under the terms of the GNU General Public License Version 3, June 2007.
+# Trajalign is a free software and comes with ABSOLUTELY NO WARRANTY.
+#
+# You are welcome to redistribute the software. However, we appreciate is use of such software would result in citations of
+# Picco, A., Kaksonen, M., _Precise tracking of the dynamics of multiple proteins in endocytic events_,  Methods in Cell Biology, Vol. 139, pages 51-68 (2017)
+# http://www.sciencedirect.com/science/article/pii/S0091679X16301546
+#
+# Author: Andrea Picco (https://github.com/apicco)
+# Year: 2017
+
+import os
+import pickle
+import hashlib
+import tempfile
+import threading
+
+#bump the version whenever the way trajectories are prepared or stored changes,
+#so that old cache entries are not reused
+_version = 4
+
+class TrajCache:
+    """
+    TrajCache( directory , max_size = 2**30 ) -> on-disk cache of the trajectories
+    prepared by load_directory and iter_directory. Each entry is keyed by the path,
+    the size and the modification time of the file and by the options used to load it,
+    so that a trajectory is parsed again only if its file or the load options changed.
+    Entries are stored in pickle binary form in 'directory'. When the entries exceed
+    'max_size' bytes, the least recently used ones are removed.
+
+    EXAMPLE:
+
+    cache = TrajCache( '.trajalign_cache' , max_size = 500 * 2**20 )
+    trajectory_list = load_directory( path = 'raw_trajectories' , pattern = '.data' , cache = cache , ... )
+    cache.clear() #remove all the entries
+    """
+
+    def __init__( self , directory , max_size = 2**30 ) :
+
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+        if not os.path.exists( directory ) :
+            os.makedirs( directory )
+
+        self._size = sum( e[ 2 ] for e in self._entries() )
+
+    def __repr__( self ) :
+
+        return 'TrajCache(' + repr( self.directory ) + ', max_size = ' + str( self.max_size ) + ', size = ' + str( self._size ) + ')'
+
+    def _entries( self ) :
+
+        #list the entries as ( file , last use , size )
+        entries = []
+        for f in os.listdir( self.directory ) :
+            if f.endswith( '.traj' ) :
+                try :
+                    s = os.stat( os.path.join( self.directory , f ) )
+                    entries.append( ( f , s.st_mtime , s.st_size ) )
+                except FileNotFoundError :
+                    pass #removed in the meantime by another process
+        return entries
+
+    def key( self , file_name , options ) :
+
+        """
+        .key( file_name , options ) returns the key of the entry for the file 'file_name' loaded with 'options'.
+        """
+
+        s = os.stat( file_name )
+        return hashlib.sha1( repr( ( _version , os.path.abspath( file_name ) , s.st_size , s.st_mtime_ns , options ) ).encode() ).hexdigest()
+
+    def get( self , key ) :
+
+        """
+        .get( key ) returns the trajectory stored with 'key', or None if there is no such entry.
+        """
+
+        entry = os.path.join( self.directory , key + '.traj' )
+
+        try :
+            with open( entry , 'rb' ) as f :
+                trajectory = pickle.load( f )
+        except ( FileNotFoundError , EOFError , pickle.UnpicklingError ) :
+            return None
+
+        #mark the entry as recently used
+        try :
+            os.utime( entry )
+        except FileNotFoundError :
+            pass
+
+        return trajectory
+
+    def put( self , key , trajectory ) :
+
+        """
+        .put( key , trajectory ) stores 'trajectory' with 'key' and evicts the least recently used entries if the cache is too big.
+        """
+
+        #write to a temporary file first, so that an entry is never read half written
+        fd , tmp = tempfile.mkstemp( dir = self.directory , suffix = '.tmp' )
+        with os.fdopen( fd , 'wb' ) as f :
+            pickle.dump( trajectory , f , protocol = pickle.HIGHEST_PROTOCOL )
+        size = os.path.getsize( tmp )
+        os.replace( tmp , os.path.join( self.directory , key + '.traj' ) )
+
+        with self._lock :
+            self._size += size
+            if self._size > self.max_size :
+                self._evict()
+
+    def _evict( self ) :
+
+        entries = sorted( self._entries() , key = lambda e : e[ 1 ] )
+        self._size = sum( e[ 2 ] for e in entries )
+        for f , last_use , size in entries :
+            if self._size <= self.max_size :
+                break
+            try :
+                os.remove( os.path.join( self.directory , f ) )
+            except FileNotFoundError :
+                pass
+            self._size -= size
+
+    def clear( self ) :
+
+        """
+        .clear() removes all the entries of the cache.
+        """
+
+        with self._lock :
+            for f , last_use , size in self._entries() :
+                try :
+                    os.remove( os.path.join( self.directory , f ) )
+                except FileNotFoundError :
+                    pass
+            self._size = 0
@@ -0,0 +1,301 @@
+# All the software here is distributed under the terms of the GNU General Public License Version 3, June 2007.
+# Trajalign is a free software and comes with ABSOLUTELY NO WARRANTY.
+#
+# You are welcome to redistribute the software. However, we appreciate is use of such software would result in citations of
+# Picco, A., Kaksonen, M., _Precise tracking of the dynamics of multiple proteins in endocytic events_,  Methods in Cell Biology, Vol. 139, pages 51-68 (2017)
+# http://www.sciencedirect.com/science/article/pii/S0091679X16301546
+#
+# Author: Andrea Picco (https://github.com/apicco)
+# Year: 2017
+
+"""
+Opt-in instrumentation of the pipelines. While a Profile is active (see profiling), the time spent
+in each stage of load_directory, average_trajectories, align and align_raw is measured and the calls
+of the kernels (MSD, cc, spline, fimax, start, end, extract and the copies of the trajectories) are
+counted. Without an active Profile, stage and count do nothing. With Profile( memory = True ) the memory
+allocated in each stage is also measured with tracemalloc, the resident memory (RSS) of the process is sampled
+and the call sites that hold the most memory at the end of the stages are reported.
+
+EXAMPLE:
+
+from trajalign.instrument import Profile, profiling
+profile = Profile( cprofile = 'profiles' ) #also dump the cProfile statistics of each stage in the directory 'profiles'
+with profiling( profile ) :
+    trajectory_list = load_directory( ... )
+best , worst , aligned , profile = average_trajectories( trajectory_list , max_frame = 500 , profile = profile )
+print( profile )
+profile.to_json( 'profile.json' )
+
+#the memory of the average, as the stages of the profile
+best , worst , aligned , profile = average_trajectories( trajectory_list , max_frame = 500 , profile = Profile( memory = True ) )
+print( profile.report()[ 'memory' ] )
+"""
+
+import os
+import json
+import time
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+_active = None #the Profile that is currently measured
+
+def _rss() :
+
+    #the resident memory of the process, in bytes, or None where /proc is not available
+    try :
+        with open( '/proc/self/statm' , 'r' ) as f :
+            return int( f.read().split()[ 1 ] ) * os.sysconf( 'SC_PAGE_SIZE' )
+    except ( OSError , ValueError , AttributeError ) :
+        return None
+
+class Profile:
+    """
+    Profile( cprofile = None , memory = False , interval = 0.01 , top = 10 ) -> the timers of the stages and the counters
+    of the kernels of a run. If 'cprofile' is the name of a directory, each stage is also profiled with cProfile and its
+    statistics are saved in the directory as <stage>.prof (they can be read with pstats), when the profiling ends. 
+    Stages within stages are timed, but only the outermost is profiled by cProfile.
+    If 'memory' is True, the memory allocated in each stage is traced with tracemalloc (which slows the run down) and
+    the resident memory of the process is sampled every 'interval' seconds. For each stage, the net memory allocated 
+    ('allocated') and, for the outermost stages, the peak of the memory traced ('peak') and of the resident memory 
+    ('rss_peak') above the memory at the start of the stage are reported, in bytes. The 'top' call sites that hold the
+    most memory at the end of the outermost stages are also reported.
+    """
+
+    def __init__( self , cprofile = None , memory = False , interval = 0.01 , top = 10 ) :
+
+        self.cprofile = cprofile
+        self.memory = memory
+        self.interval = interval
+        self.top = top
+        self.seconds = 0.0 #the time spent while the profile was active
+        self._stages = {}
+        self._counters = {}
+        self._profilers = {}
+        self._depth = 0
+        self._peak = 0 #the peak of the memory traced
+        self._rss_peak = None #the peak of the resident memory
+        self._stage_rss = None #the peak of the resident memory in the outermost stage
+        self._sites = {} #call site -> ( size , count ), the largest at the end of the stages
+
+    def __repr__( self ) :
+
+        output = 'Profile(' + str( round( self.seconds , 3 ) ) + ' s)\nstages:\n'
+        for name , s in self._stages.items() :
+            output += '  ' + name + ': ' + str( round( s[ 'seconds' ] , 3 ) ) + ' s in ' + str( s[ 'calls' ] ) + ' calls\n'
+        output += 'counters:\n'
+        for name , n in self._counters.items() :
+            output += '  ' + name + ': ' + str( n ) + ' calls\n'
+        if self.memory :
+            output += 'memory: peak ' + _mb( self._peak ) + ', RSS peak ' + _mb( self._rss_peak ) + '\n'
+            for name , s in self._stages.items() :
+                output += '  ' + name + ': ' + _mb( s.get( 'allocated' ) ) + ' allocated, peak ' + _mb( s.get( 'peak' ) ) + ', RSS peak ' + _mb( s.get( 'rss_peak' ) ) + '\n'
+            output += 'top call sites:\n'
+            for site in self._top_sites() :
+                output += '  ' + site[ 'site' ] + ': ' + _mb( site[ 'size' ] ) + ' in ' + str( site[ 'count' ] ) + ' blocks\n'
+        return output
+
+    @contextmanager
+    def stage( self , name ) :
+
+        """
+        .stage( name ) is a context manager that adds the time spent within it to the stage 'name'.
+        """
+
+        outermost = ( self._depth == 0 )
+        profiler = None
+        if ( self.cprofile is not None ) and outermost :
+            profiler = self._profilers.setdefault( name , cProfile.Profile() )
+            profiler.enable()
+        traced = self.memory and tracemalloc.is_tracing()
+        if traced :
+            if outermost :
+                #the peak is measured from the start of the stage
+                self._peak = max( self._peak , tracemalloc.get_traced_memory()[ 1 ] )
+                tracemalloc.reset_peak()
+                rss0 = _rss()
+                self._stage_rss = rss0
+            current0 = tracemalloc.get_traced_memory()[ 0 ]
+        self._depth += 1
+
+        t0 = time.perf_counter()
+        try :
+            yield self
+        finally :
+            elapsed = time.perf_counter() - t0
+            self._depth -= 1
+            if profiler is not None :
+                profiler.disable()
+            s = self._stages.setdefault( name , { 'calls' : 0 , 'seconds' : 0.0 } )
+            s[ 'calls' ] += 1
+            s[ 'seconds' ] += elapsed
+            if traced :
+                current , peak = tracemalloc.get_traced_memory()
+                s[ 'allocated' ] = s.get( 'allocated' , 0 ) + current - current0
+                if outermost :
+                    self._peak = max( self._peak , peak )
+                    s[ 'peak' ] = max( s.get( 'peak' , 0 ) , peak - current0 )
+                    rss = self._stage_rss
+                    self._stage_rss = None
+                    if ( rss0 is not None ) and ( rss is not None ) :
+                        s[ 'rss_peak' ] = max( s.get( 'rss_peak' , 0 ) , rss - rss0 )
+                    self._snapshot()
+
+    def _snapshot( self ) :
+
+        #keep the call sites that hold the most memory, at their largest
+        snapshot = tracemalloc.take_snapshot().filter_traces( ( tracemalloc.Filter( False , tracemalloc.__file__ ) , tracemalloc.Filter( False , __file__ ) ) )
+        for statistic in snapshot.statistics( 'lineno' )[ : 10 * self.top ] :
+            frame = statistic.traceback[ 0 ]
+            site = frame.filename + ':' + str( frame.lineno )
+            if statistic.size > self._sites.get( site , ( 0 , 0 ) )[ 0 ] :
+                self._sites[ site ] = ( statistic.size , statistic.count )
+
+    def _top_sites( self ) :
+
+        sites = sorted( self._sites.items() , key = lambda s : s[ 1 ][ 0 ] , reverse = True )[ : self.top ]
+        return [ { 'site' : site , 'size' : size , 'count' : count } for site , ( size , count ) in sites ]
+
+    def _sample( self , stop ) :
+
+        #sample the resident memory until 'stop' is set
+        while not stop.wait( self.interval ) :
+            rss = _rss()
+            if rss is None :
+                return
+            self._rss_peak = max( self._rss_peak or 0 , rss )
+            stage_rss = self._stage_rss #which the stage can reset meanwhile
+            if stage_rss is not None :
+                self._stage_rss = max( stage_rss , rss )
+
+    def count( self , name , n = 1 ) :
+
+        """
+        .count( name , n = 1 ) adds n calls to the counter 'name'.
+        """
+
+        self._counters[ name ] = self._counters.get( name , 0 ) + n
+
+    def dump( self ) :
+
+        """
+        .dump() saves the cProfile statistics of the stages in the directory 'cprofile' and returns their files.
+        """
+
+        files = {}
+        if self.cprofile is not None :
+            if not os.path.exists( self.cprofile ) :
+                os.makedirs( self.cprofile )
+            for name , profiler in self._profilers.items() :
+                files[ name ] = os.path.join( self.cprofile , name + '.prof' )
+                profiler.dump_stats( files[ name ] )
+        return files
+
+    def report( self ) :
+
+        """
+        .report() returns the timers and the counters as a dictionary:
+        { 'seconds' : ... , 'stages' : { stage : { 'calls' : ... , 'seconds' : ... } } , 'counters' : { kernel : calls } , 'cprofile' : { stage : file } }
+        With memory = True, the stages also report their memory and the dictionary has the item
+        'memory' : { 'peak' : ... , 'rss_peak' : ... , 'top' : [ { 'site' : 'file:line' , 'size' : ... , 'count' : ... } ] }
+        """
+
+        output = {
+                'seconds' : self.seconds ,
+                'stages' : { name : dict( s ) for name , s in self._stages.items() } ,
+                'counters' : dict( self._counters ) ,
+                'cprofile' : { name : os.path.join( self.cprofile , name + '.prof' ) for name in self._profilers.keys() }
+                }
+        if self.memory :
+            output[ 'memory' ] = { 'peak' : self._peak , 'rss_peak' : self._rss_peak , 'top' : self._top_sites() }
+
+        return output
+
+    def to_json( self , file_name ) :
+
+        """
+        .to_json( file_name ) saves the report in the JSON file 'file_name'.
+        """
+
+        with open( file_name , 'w' ) as f :
+            json.dump( self.report() , f , indent = 2 )
+
+def _mb( size ) :
+
+    #the size in bytes as MB, for printing
+    if size is None :
+        return '-'
+    return str( round( size / 2**20 , 1 ) ) + ' MB'
+
+@contextmanager
+def profiling( profile = True ) :
+
+    """
+    profiling( profile = True ) is a context manager that activates 'profile' (a Profile, or True for a new
+    one) within it and yields it. If 'profile' is None or False it does nothing and yields None.
+    """
+
+    global _active
+
+    if ( profile is None ) or ( profile is False ) :
+        yield None
+        return
+
+    if profile is True :
+        profile = Profile()
+
+    if profile is _active : #already active, e.g. when the pipelines are profiled as a whole
+        yield profile
+        return
+
+    previous = _active
+    _active = profile
+
+    #trace the memory, unless it is already traced (e.g. by the user)
+    started = False
+    if profile.memory :
+        if not tracemalloc.is_tracing() :
+            tracemalloc.start()
+            started = True
+        tracemalloc.reset_peak()
+        profile._rss_peak = _rss()
+        stop = threading.Event()
+        sampler = threading.Thread( target = profile._sample , args = ( stop , ) , daemon = True )
+        sampler.start()
+
+    t0 = time.perf_counter()
+    try :
+        yield profile
+    finally :
+        profile.seconds += time.perf_counter() - t0
+        _active = previous
+        if profile.memory :
+            stop.set()
+            sampler.join()
+            profile._peak = max( profile._peak , tracemalloc.get_traced_memory()[ 1 ] )
+            if started :
+                tracemalloc.stop()
+        profile.dump()
+
+@contextmanager
+def stage( name ) :
+
+    """
+    stage( name ) times the stage 'name' in the active Profile, if any.
+    """
+
+    if _active is None :
+        yield None
+    else :
+        with _active.stage( name ) as profile :
+            yield profile
+
+def count( name , n = 1 ) :
+
+    """
+    count( name , n = 1 ) adds n calls to the counter 'name' of the active Profile, if any.
+    """
+
+    if _active is not None :
+        _active.count( name , n )
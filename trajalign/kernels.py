@@ -0,0 +1,593 @@
+# All the software here is distributed under the terms of the GNU General Public License Version 3, June 2007.
+# Trajalign is a free software and comes with ABSOLUTELY NO WARRANTY.
+#
+# You are welcome to redistribute the software. However, we appreciate is use of such software would result in citations of
+# Picco, A., Kaksonen, M., _Precise tracking of the dynamics of multiple proteins in endocytic events_,  Methods in Cell Biology, Vol. 139, pages 51-68 (2017)
+# http://www.sciencedirect.com/science/article/pii/S0091679X16301546
+#
+# Author: Andrea Picco (https://github.com/apicco)
+# Year: 2017
+
+"""
+The kernels of the loops of trajalign that are sequential or branchy: the NaN aware sums of Horn's method
+in MSD, the cross correlation of the fluorescence intensities in cc, the times of the time points added by
+Traj.fill and the cumulative sums of Traj.integral. Each kernel has two backends:
+
+'numpy' : numpy implementations, which give the same results as the code they replaced;
+'numba' : the loops compiled by numba (https://numba.pydata.org), if numba is installed. The compiled
+          kernels are cached on disk (numba.njit( cache = True )), hence they are compiled only once
+          and not every time trajalign is imported. Their results equal those of the numpy backend up
+          to rounding errors, as the sums are done in a different order.
+
+The backend is chosen with set_backend. By default ('auto') the numba backend is used if numba is installed,
+and the numpy backend otherwise. compare_backends checks that the backends give the same results and times them.
+Without numba, the loops of the numba backend are compared as plain python functions ('python'), so that they
+are checked also where they cannot be compiled. python -m trajalign.kernels exits with status 1 if a backend
+differs from the numpy backend by more than a tolerance (see mismatches).
+
+EXAMPLE:
+
+from trajalign import kernels
+print( kernels.available() ) #e.g. [ 'numpy' , 'numba' ]
+kernels.set_backend( 'numpy' )
+print( kernels.table( kernels.compare_backends() ) )
+
+or, from the shell:
+
+python -m trajalign.kernels --lengths 25 100 400
+"""
+
+import sys
+import time
+import argparse
+import warnings as wr
+import numpy as np
+
+#numpy backend
+
+def _horn_numpy( x1 , f1 , x2 , f2 ) :
+
+    with wr.catch_warnings():
+        # if both f are 0 or if their product is 0,  a warning about invalid true divide is output. Here we suppress such warnings.
+        wr.simplefilter("ignore", category=RuntimeWarning)
+        w = f1 * f2 / np.nansum( f1 * f2 )
+
+    rc = np.array([ np.nansum( w * x1[0] ), np.nansum( w * x1[1] )])
+    lc = np.array([ np.nansum( w * x2[0] ), np.nansum( w * x2[1] )])
+
+    #the coordinates translated to their centers, computed as the translations of Traj (see traj.apply_all)
+    c1 = np.array( [ 1.0 * x1[ 0 ] + 0.0 * x1[ 1 ] - rc[ 0 ] , 0.0 * x1[ 0 ] + 1.0 * x1[ 1 ] - rc[ 1 ] ] )
+    c2 = np.array( [ 1.0 * x2[ 0 ] + 0.0 * x2[ 1 ] - lc[ 0 ] , 0.0 * x2[ 0 ] + 1.0 * x2[ 1 ] - lc[ 1 ] ] )
+
+    Sxx = np.nansum( w * c2[0] * c1[0] )
+    Sxy = np.nansum( w * c2[0] * c1[1] )
+    Syx = np.nansum( w * c2[1] * c1[0] )
+    Syy = np.nansum( w * c2[1] * c1[1] )
+
+    A = ( Syx - Sxy )
+    B = ( Sxx + Syy )
+
+    if ( ( A == 0 ) & ( B == 0 ) ):
+        theta = np.nan
+    else :
+        theta = np.arctan2( - A , B )
+
+    #the coordinates of the second trajectory rotated by theta, as Traj.rotate does
+    R = np.array( [[ np.cos( theta ) , - np.sin( theta ) ] , [ np.sin( theta ) , np.cos( theta ) ]] , dtype = 'float64' )
+    r2 = np.array( [ R[ 0 , 0 ] * c2[ 0 ] + R[ 0 , 1 ] * c2[ 1 ] + 0.0 , R[ 1 , 0 ] * c2[ 0 ] + R[ 1 , 1 ] * c2[ 1 ] + 0.0 ] )
+
+    #the 'score' is the mean square displacement weighted on the cross correlation of the fluorescence intensities
+    score = np.nansum( w * ( c1[0] - r2[0] )**2 + w * ( c1[1] - r2[1] )**2 )
+
+    return theta , rc , lc , score
+
+def _correlate_numpy( f1 , f2 , first ) :
+
+    output = np.zeros( len( first ) )
+    for i in range( len( f2 ) ) :
+        output = output + f1[ first + i ] * f2[ i ]
+    return output
+
+def _fill_time_numpy( t , missing ) :
+
+    output = np.empty( len( t ) + int( missing.sum() ) )
+    positions = np.arange( len( t ) ) + np.concatenate( ( [ 0 ] , np.cumsum( missing ) ) )
+    output[ positions ] = t
+
+    gaps = np.flatnonzero( missing )
+    if len( gaps ) == 0 :
+        return output
+
+    #the step is the shortest interval between the time points, after each point is added. The shortest
+    #interval is the minimum of the intervals that are not gaps, of the gaps that are not yet filled (the
+    #gaps are filled from the last one) and of the intervals created by the points added so far
+    d = np.diff( t )
+    steps = d[ missing == 0 ]
+    step_min = steps.min() if len( steps ) > 0 else np.inf
+    gap_min = np.minimum.accumulate( d[ gaps ] )
+    created = np.inf
+    for k in range( len( gaps ) - 1 , -1 , -1 ) :
+        i = gaps[ k ]
+        if k > 0 :
+            lower = min( step_min , gap_min[ k - 1 ] )
+        else :
+            lower = step_min
+        following = t[ i + 1 ]
+        for m in range( missing[ i ] ) :
+            delta_t = min( lower , created , following - t[ i ] )
+            x = following - delta_t
+            created = min( created , following - x )
+            following = x
+            output[ positions[ i + 1 ] - 1 - m ] = x
+        created = min( created , following - t[ i ] )
+
+    return output
+
+def _fill_time_step_numpy( t , missing , delta_t ) :
+
+    output = np.empty( len( t ) + int( missing.sum() ) )
+    positions = np.arange( len( t ) ) + np.concatenate( ( [ 0 ] , np.cumsum( missing ) ) )
+    output[ positions ] = t
+
+    for i in np.flatnonzero( missing ) :
+        following = t[ i + 1 ]
+        for m in range( missing[ i ] ) :
+            following = following - delta_t
+            output[ positions[ i + 1 ] - 1 - m ] = following
+
+    return output
+
+def _nan_cumsum_numpy( x ) :
+
+    valid = x == x
+    output = np.cumsum( np.where( valid , x , 0 ) )
+    output[ ~ valid ] = np.nan
+    return output
+
+#numba backend: the loops, which are compiled by numba
+
+def _horn_loops( x1 , f1 , x2 , f2 ) :
+
+    n = f1.shape[ 0 ]
+
+    s = 0.0
+    for i in range( n ) :
+        p = f1[ i ] * f2[ i ]
+        if p == p :
+            s += p
+
+    w = np.empty( n )
+    rc = np.zeros( 2 )
+    lc = np.zeros( 2 )
+    for i in range( n ) :
+        w[ i ] = f1[ i ] * f2[ i ] / s
+        for k in range( 2 ) :
+            v = w[ i ] * x1[ k , i ]
+            if v == v :
+                rc[ k ] += v
+            v = w[ i ] * x2[ k , i ]
+            if v == v :
+                lc[ k ] += v
+
+    #a NaN in one coordinate makes both coordinates NaN, as in the translations of Traj
+    c1 = np.empty( ( 2 , n ) )
+    c2 = np.empty( ( 2 , n ) )
+    for i in range( n ) :
+        if ( x1[ 0 , i ] == x1[ 0 , i ] ) and ( x1[ 1 , i ] == x1[ 1 , i ] ) :
+            c1[ 0 , i ] = x1[ 0 , i ] - rc[ 0 ]
+            c1[ 1 , i ] = x1[ 1 , i ] - rc[ 1 ]
+        else :
+            c1[ 0 , i ] = np.nan
+            c1[ 1 , i ] = np.nan
+        if ( x2[ 0 , i ] == x2[ 0 , i ] ) and ( x2[ 1 , i ] == x2[ 1 , i ] ) :
+            c2[ 0 , i ] = x2[ 0 , i ] - lc[ 0 ]
+            c2[ 1 , i ] = x2[ 1 , i ] - lc[ 1 ]
+        else :
+            c2[ 0 , i ] = np.nan
+            c2[ 1 , i ] = np.nan
+
+    Sxx = 0.0
+    Sxy = 0.0
+    Syx = 0.0
+    Syy = 0.0
+    for i in range( n ) :
+        v = w[ i ] * c2[ 0 , i ] * c1[ 0 , i ]
+        if v == v :
+            Sxx += v
+        v = w[ i ] * c2[ 0 , i ] * c1[ 1 , i ]
+        if v == v :
+            Sxy += v
+        v = w[ i ] * c2[ 1 , i ] * c1[ 0 , i ]
+        if v == v :
+            Syx += v
+        v = w[ i ] * c2[ 1 , i ] * c1[ 1 , i ]
+        if v == v :
+            Syy += v
+
+    A = ( Syx - Sxy )
+    B = ( Sxx + Syy )
+
+    if ( A == 0 ) and ( B == 0 ) :
+        theta = np.nan
+    else :
+        theta = np.arctan2( - A , B )
+
+    c = np.cos( theta )
+    s = np.sin( theta )
+    score = 0.0
+    for i in range( n ) :
+        v = w[ i ] * ( c1[ 0 , i ] - c * c2[ 0 , i ] + s * c2[ 1 , i ] ) ** 2 + w[ i ] * ( c1[ 1 , i ] - s * c2[ 0 , i ] - c * c2[ 1 , i ] ) ** 2
+        if v == v :
+            score += v
+
+    return theta , rc , lc , score
+
+def _correlate_loops( f1 , f2 , first ) :
+
+    output = np.zeros( first.shape[ 0 ] )
+    for j in range( first.shape[ 0 ] ) :
+        for i in range( f2.shape[ 0 ] ) :
+            output[ j ] += f1[ first[ j ] + i ] * f2[ i ]
+    return output
+
+def _fill_time_loops( t , missing ) :
+
+    n = t.shape[ 0 ]
+    output = np.empty( n + missing.sum() )
+    positions = np.empty( n , dtype = np.int64 )
+    p = 0
+    for i in range( n ) :
+        positions[ i ] = p
+        output[ p ] = t[ i ]
+        if i < n - 1 :
+            p += 1 + missing[ i ]
+
+    #see _fill_time_numpy
+    step_min = np.inf
+    gap_min = np.empty( n )
+    lower = np.inf
+    for i in range( n - 1 ) :
+        gap_min[ i ] = lower
+        if missing[ i ] == 0 :
+            step_min = min( step_min , t[ i + 1 ] - t[ i ] )
+        else :
+            lower = min( lower , t[ i + 1 ] - t[ i ] )
+    created = np.inf
+    for i in range( n - 2 , -1 , -1 ) :
+        if missing[ i ] > 0 :
+            following = t[ i + 1 ]
+            for m in range( missing[ i ] ) :
+                delta_t = min( min( step_min , gap_min[ i ] ) , min( created , following - t[ i ] ) )
+                x = following - delta_t
+                created = min( created , following - x )
+                following = x
+                output[ positions[ i + 1 ] - 1 - m ] = x
+            created = min( created , following - t[ i ] )
+
+    return output
+
+def _fill_time_step_loops( t , missing , delta_t ) :
+
+    n = t.shape[ 0 ]
+    output = np.empty( n + missing.sum() )
+    p = 0
+    for i in range( n ) :
+        output[ p ] = t[ i ]
+        if i < n - 1 :
+            following = t[ i + 1 ]
+            for m in range( missing[ i ] ) :
+                following = following - delta_t
+                output[ p + missing[ i ] - m ] = following
+            p += 1 + missing[ i ]
+
+    return output
+
+def _nan_cumsum_loops( x ) :
+
+    output = np.empty_like( x )
+    s = 0.0
+    for i in range( x.shape[ 0 ] ) :
+        if x[ i ] == x[ i ] :
+            s += x[ i ]
+            output[ i ] = s
+        else :
+            output[ i ] = np.nan
+    return output
+
+_numpy = {
+        'horn' : _horn_numpy ,
+        'correlate' : _correlate_numpy ,
+        'fill_time' : _fill_time_numpy ,
+        'fill_time_step' : _fill_time_step_numpy ,
+        'nan_cumsum' : _nan_cumsum_numpy
+        }
+
+_loops = {
+        'horn' : _horn_loops ,
+        'correlate' : _correlate_loops ,
+        'fill_time' : _fill_time_loops ,
+        'fill_time_step' : _fill_time_step_loops ,
+        'nan_cumsum' : _nan_cumsum_loops
+        }
+
+_backends = { 'numpy' : _numpy } #the numba backend is added when it is first used (see _numba)
+_kernels = None #the kernels of the backend in use
+_name = None
+
+def _numba() :
+
+    #the kernels of the numba backend, compiled when they are first called or loaded from the cache on disk.
+    #The floating point errors follow numpy (e.g. division by zero gives inf or NaN instead of an exception).
+    if 'numba' not in _backends :
+        import numba
+        _backends[ 'numba' ] = { k : numba.njit( cache = True , error_model = 'numpy' )( f ) for k , f in _loops.items() }
+    return _backends[ 'numba' ]
+
+def available() :
+
+    """
+    available() returns the names of the backends that can be used: 'numpy' and, if numba is installed, 'numba'.
+    """
+
+    output = [ 'numpy' ]
+    try :
+        _numba()
+        output.append( 'numba' )
+    except ImportError :
+        pass
+    return output
+
+def set_backend( name = 'auto' ) :
+
+    """
+    set_backend( name = 'auto' ) sets the backend of the kernels: 'numpy', 'numba' or 'auto', which is 'numba'
+    if numba is installed and 'numpy' otherwise. Raises ImportError if the backend is 'numba' and numba is not
+    installed.
+    """
+
+    global _kernels , _name
+
+    if name not in ( 'auto' , 'numpy' , 'numba' ) :
+        raise AttributeError( 'Unknown backend ' + repr( name ) + ', the backends are: auto, numpy, numba' )
+
+    if name == 'auto' :
+        name = available()[ -1 ]
+
+    if name == 'numba' :
+        try :
+            _kernels = _numba()
+        except ImportError :
+            raise ImportError( 'The numba backend requires numba, which is not installed' )
+    else :
+        _kernels = _backends[ name ]
+    _name = name
+
+def backend() :
+
+    """
+    backend() returns the name of the backend in use.
+    """
+
+    if _name is None :
+        set_backend()
+    return _name
+
+def _kernel( name ) :
+
+    if _kernels is None :
+        set_backend()
+    return _kernels[ name ]
+
+def warm_up() :
+
+    """
+    warm_up() calls each kernel of the backend in use once, on small inputs, so that the numba kernels are compiled,
+    or loaded from the cache on disk, before they are used.
+    """
+
+    x = np.array( [ [ 0.0 , 1.0 , np.nan , 3.0 ] , [ 0.0 , 1.0 , np.nan , 2.0 ] ] )
+    f = np.array( [ 1.0 , 2.0 , np.nan , 1.0 ] )
+    horn( x , f , x , f )
+    correlate( f , f[ 0:2 ] , np.array( [ 0 , 1 ] , dtype = 'int64' ) )
+    fill_time( np.array( [ 0.0 , 0.1 , 0.4 ] ) , np.array( [ 0 , 2 ] , dtype = 'int64' ) )
+    fill_time_step( np.array( [ 0.0 , 0.1 , 0.4 ] ) , np.array( [ 0 , 2 ] , dtype = 'int64' ) , 0.1 )
+    nan_cumsum( f )
+
+#the kernels
+
+def horn( x1 , f1 , x2 , f2 ) :
+
+    """
+    horn( x1 , f1 , x2 , f2 ) -> ( theta , rc , lc , score ): the rototranslation that minimises the mean square
+    displacement between the coordinates x1 and x2 (2 x n arrays), weighted on the product of the fluorescence
+    intensities f1 and f2, as in Horn (1987) (see average.MSD). rc and lc are the weighted centers of x1 and x2,
+    theta is the angle that rotates x2 - lc onto x1 - rc and score is the weighted mean square displacement
+    after the rotation. NaN do not contribute to the sums. The inputs must be float64 arrays.
+    """
+
+    return _kernel( 'horn' )( x1 , f1 , x2 , f2 )
+
+def correlate( f1 , f2 , first ) :
+
+    """
+    correlate( f1 , f2 , first ) -> the array of sum( f1[ first[ j ] : first[ j ] + len( f2 ) ] * f2 ) for each j,
+    i.e. the cross correlation of f2 with f1 at the lags where f2 starts at f1[ first[ j ] ] (see align.cc).
+    f1 and f2 must be float64 arrays without NaN, and first an int64 array.
+    """
+
+    return _kernel( 'correlate' )( f1 , f2 , first )
+
+def fill_time( t , missing ) :
+
+    """
+    fill_time( t , missing ) -> the time t with missing[ i ] time points added between t[ i ] and t[ i + 1 ], as
+    Traj.fill does for missing frames: the gaps are filled from the last one and each added time point precedes
+    the following one by the shortest interval between the time points. t must be a float64 array and missing an
+    int64 array of length len( t ) - 1.
+    """
+
+    return _kernel( 'fill_time' )( t , missing )
+
+def fill_time_step( t , missing , delta_t ) :
+
+    """
+    fill_time_step( t , missing , delta_t ) -> the time t with missing[ i ] time points added between t[ i ] and
+    t[ i + 1 ], each preceding the following one by delta_t, as Traj.fill does for trajectories without frames.
+    t must be a float64 array and missing an int64 array of length len( t ) - 1.
+    """
+
+    return _kernel( 'fill_time_step' )( t , missing , delta_t )
+
+def nan_cumsum( x ) :
+
+    """
+    nan_cumsum( x ) -> the cumulative sum of the one dimensional array x, where NaN are not summed and are NaN
+    in the output (see Traj.integral).
+    """
+
+    return _kernel( 'nan_cumsum' )( x )
+
+#comparison of the backends
+
+def _inputs( l , rng ) :
+
+    #the inputs of each kernel, for trajectories of length l
+    x1 = np.cumsum( rng.normal( 0 , 10 , ( 2 , l ) ) , axis = 1 )
+    x2 = np.cumsum( rng.normal( 0 , 10 , ( 2 , l ) ) , axis = 1 )
+    f1 = rng.uniform( 0 , 100 , l )
+    f2 = rng.uniform( 0 , 100 , l )
+    nans = rng.choice( l , size = l // 20 , replace = False )
+    x1[ : , nans ] = np.nan
+    f2[ nans[ 0 : len( nans ) // 2 ] ] = np.nan
+
+    delta_t = 0.1045
+    frames = np.sort( rng.choice( 3 * l , size = l , replace = False ) )
+    missing = np.diff( frames ) - 1
+    t = frames * delta_t
+
+    return {
+            'horn' : ( x1 , f1 , x2 , f2 ) ,
+            'correlate' : ( np.nan_to_num( np.concatenate( ( np.zeros( l ) , f1 , np.zeros( l ) ) ) ) , np.nan_to_num( f2 ) , np.arange( 2 * l , dtype = 'int64' ) ) ,
+            'fill_time' : ( t , missing ) ,
+            'fill_time_step' : ( t , missing , delta_t ) ,
+            'nan_cumsum' : ( np.where( np.isnan( f2 ) , np.nan , f1 ) , )
+            }
+
+def _difference( x , y ) :
+
+    #the largest difference between the outputs x and y of a kernel, relative to the magnitude of x
+    x = np.concatenate( [ np.ravel( np.asarray( a , dtype = 'float64' ) ) for a in ( x if isinstance( x , tuple ) else ( x , ) ) ] )
+    y = np.concatenate( [ np.ravel( np.asarray( a , dtype = 'float64' ) ) for a in ( y if isinstance( y , tuple ) else ( y , ) ) ] )
+    if x.shape != y.shape :
+        return np.inf
+    if ( np.isnan( x ) != np.isnan( y ) ).any() :
+        return np.inf
+    valid = ~ np.isnan( x )
+    if not valid.any() :
+        return 0.0
+    return float( np.max( np.abs( x[ valid ] - y[ valid ] ) ) / max( np.max( np.abs( x[ valid ] ) ) , np.finfo( 'float64' ).tiny ) )
+
+def _seconds( function , args , min_time ) :
+
+    #the seconds per call of function( *args ), doubling the number of calls until they last min_time seconds
+    n = 1
+    while True :
+        t0 = time.perf_counter()
+        for i in range( n ) :
+            function( *args )
+        seconds = time.perf_counter() - t0
+        if seconds >= min_time :
+            return seconds / n
+        n = 2 * n
+
+def compare_backends( lengths = [ 25 , 100 , 400 ] , backends = None , min_time = 0.05 , seed = 0 ) :
+
+    """
+    compare_backends( lengths = [ 25 , 100 , 400 ] , backends = None , min_time = 0.05 , seed = 0 ) runs each kernel
+    with each backend on random inputs of each length, and returns the largest difference between the outputs of 
+    each backend and those of the numpy backend, relative to their magnitude, and the seconds per call: 
+    { kernel : { 'lengths' , 'difference' : { backend : [ ... ] } , 'seconds' : { backend : [ ... ] } } }.
+    The backends are 'numpy', 'numba' and 'python', the loops of the numba backend run without compiling them. 
+    If 'backends' is None, they are the available backends and, if numba is not installed, 'python'. The numba 
+    kernels are compiled, or loaded from the cache, before they are timed.
+    """
+
+    if backends is None :
+        backends = available()
+        if 'numba' not in backends :
+            backends.append( 'python' )
+    for b in backends :
+        if b not in ( 'numpy' , 'numba' , 'python' ) :
+            raise AttributeError( 'Unknown backend ' + repr( b ) + ', the backends are: numpy, numba, python' )
+    backends = [ 'numpy' ] + [ b for b in backends if b != 'numpy' ]
+    kernels = { 'numpy' : _numpy , 'python' : _loops }
+    if 'numba' in backends :
+        kernels[ 'numba' ] = _numba()
+
+    rng = np.random.default_rng( seed )
+    inputs = [ _inputs( l , rng ) for l in lengths ]
+
+    results = {}
+    for name in _numpy.keys() :
+        results[ name ] = { 'lengths' : list( lengths ) , 'difference' : { b : [] for b in backends } , 'seconds' : { b : [] for b in backends } }
+        for x in inputs :
+            reference = _numpy[ name ]( *x[ name ] )
+            for b in backends :
+                output = kernels[ b ][ name ]( *x[ name ] ) #also compiles the numba kernel
+                results[ name ][ 'difference' ][ b ].append( _difference( reference , output ) )
+                results[ name ][ 'seconds' ][ b ].append( _seconds( kernels[ b ][ name ] , x[ name ] , min_time ) )
+
+    return results
+
+def mismatches( results , tolerance = 1e-9 ) :
+
+    """
+    mismatches( results , tolerance = 1e-9 ) returns the list of the kernels, backends and lengths of the results 
+    of compare_backends whose relative difference from the numpy backend is larger than 'tolerance'. The sums of
+    the numba backend are done in a different order, which changes the results by about 1e-15.
+    """
+
+    found = []
+    for name , r in results.items() :
+        for b , differences in r[ 'difference' ].items() :
+            for l , d in zip( r[ 'lengths' ] , differences ) :
+                if not d <= tolerance :
+                    found.append( name + ' ' + b + ' L=' + str( l ) + ': difference ' + '%.1e' % d + ' > ' + '%.1e' % tolerance )
+    return found
+
+def table( results ) :
+
+    """
+    table( results ) returns the results of compare_backends as a table of the microseconds per call of each
+    backend, with the largest relative difference from the numpy backend.
+    """
+
+    output = ''
+    for name , r in results.items() :
+        output += '%-16s' % name + ''.join( '%12s' % ( 'L=' + str( l ) ) for l in r[ 'lengths' ] ) + '%12s' % 'difference' + '\n'
+        for b in r[ 'seconds' ].keys() :
+            output += '%-16s' % ( '  ' + b + ' (us)' ) + ''.join( '%12.1f' % ( 1e6 * s ) for s in r[ 'seconds' ][ b ] ) + '%12.1e' % max( r[ 'difference' ][ b ] ) + '\n'
+    return output
+
+def main( argv = None ) :
+
+    parser = argparse.ArgumentParser( prog = 'python -m trajalign.kernels' , description = 'Compare the backends of the kernels of trajalign.' )
+    parser.add_argument( '--lengths' , type = int , nargs = '+' , default = [ 25 , 100 , 400 ] , help = 'the lengths of the inputs' )
+    parser.add_argument( '--min-time' , type = float , default = 0.05 , help = 'the minimum seconds of each timing' )
+    parser.add_argument( '--seed' , type = int , default = 0 , help = 'the seed of the random inputs' )
+    parser.add_argument( '--tolerance' , type = float , default = 1e-9 , help = 'the largest relative difference from the numpy backend' )
+    args = parser.parse_args( argv )
+
+    print( 'backends: ' + ', '.join( available() ) )
+    results = compare_backends( args.lengths , None , args.min_time , args.seed )
+    print( table( results ) )
+
+    found = mismatches( results , args.tolerance )
+    if len( found ) > 0 :
+        print( 'Backends that differ from numpy:\n' + '\n'.join( found ) )
+        sys.exit( 1 )
+    else :
+        print( 'All the backends agree with numpy within ' + '%.1e' % args.tolerance )
+
+if __name__ == '__main__' :
+    main()
@@ -0,0 +1,136 @@
+# All the software here is distributed under the terms of the GNU General Public License Version 3, June 2007.
+# Trajalign is a free software and comes with ABSOLUTELY NO WARRANTY.
+#
+# You are welcome to redistribute the software. However, we appreciate is use of such software would result in citations of
+# Picco, A., Kaksonen, M., _Precise tracking of the dynamics of multiple proteins in endocytic events_,  Methods in Cell Biology, Vol. 139, pages 51-68 (2017)
+# http://www.sciencedirect.com/science/article/pii/S0091679X16301546
+#
+# Author: Andrea Picco (https://github.com/apicco)
+# Year: 2017
+
+"""
+In-process memoization of the results of spline, cc and fimax. The results are stored in a
+least recently used (LRU) table, keyed by the name of the function, its options and the fingerprints
+of the input trajectories (see Traj.fingerprint), so that the same computation on trajectories with
+the same data is done only once. Copies of the results are stored and returned, hence the results can
+be modified without changing the stored ones. The memoization is disabled by default (size 0): it pays
+off when the same trajectories are aligned again, e.g. when align is run more than once on the same data.
+
+EXAMPLE:
+
+from trajalign import memo
+memo.set_size( 1000 ) #the number of results kept, 0 disables the memoization
+... #align or average the trajectories
+print( memo.info() ) #the number of results kept and the hits and misses of each function
+memo.clear()
+"""
+
+import copy as cp
+import threading
+from collections import OrderedDict
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+_size = 0
+_hits = {}
+_misses = {}
+
+def set_size( size ) :
+
+    """
+    set_size( size ): sets the number of results kept. The least recently used results beyond 'size' are
+    removed. If 'size' is 0 the memoization is disabled.
+    """
+
+    global _size
+
+    if size < 0 :
+        raise AttributeError( 'The size of the memoization table cannot be negative' )
+
+    with _lock :
+        _size = size
+        while len( _entries ) > _size :
+            _entries.popitem( last = False )
+
+def size() :
+
+    """
+    size(): returns the number of results that can be kept.
+    """
+
+    return _size
+
+def info() :
+
+    """
+    info(): returns a dictionary with the size of the memoization table, the number of results kept ('entries')
+    and, for each function, the number of results found in the table ('hits') and computed ('misses').
+    """
+
+    with _lock :
+        return { 'size' : _size , 'entries' : len( _entries ) , 'hits' : dict( _hits ) , 'misses' : dict( _misses ) }
+
+def clear() :
+
+    """
+    clear(): removes all the results and resets the hit and miss counters.
+    """
+
+    with _lock :
+        _entries.clear()
+        _hits.clear()
+        _misses.clear()
+
+def key( name , trajectories , annotations = ( 'delta_t' , ) , options = () ) :
+
+    """
+    key( name , trajectories , annotations = ( 'delta_t' , ) , options = () ): the key of the result of the
+    function 'name' computed on the list of trajectories with 'options' (hashable). 'annotations' are the
+    annotations of the trajectories the result depends on (None for all of them). Returns None if the
+    memoization is disabled, so that the fingerprints are not computed.
+    """
+
+    if _size == 0 :
+        return None
+
+    return ( name , options ) + tuple( t.fingerprint( annotations ) for t in trajectories )
+
+def get( key ) :
+
+    """
+    get( key ): returns a copy of the result stored with 'key', or None if there is no such result.
+    """
+
+    if key is None :
+        return None
+
+    with _lock :
+        if key in _entries :
+            _entries.move_to_end( key )
+            _hits[ key[ 0 ] ] = _hits.get( key[ 0 ] , 0 ) + 1
+            value = _entries[ key ]
+        else :
+            _misses[ key[ 0 ] ] = _misses.get( key[ 0 ] , 0 ) + 1
+            return None
+
+    return cp.deepcopy( value )
+
+def put( key , value ) :
+
+    """
+    put( key , value ): stores a copy of 'value' with 'key' and removes the least recently used results
+    if the table is full. Returns 'value'.
+    """
+
+    if key is None :
+        return value
+
+    stored = cp.deepcopy( value )
+
+    with _lock :
+        _entries[ key ] = stored
+        _entries.move_to_end( key )
+        while len( _entries ) > _size :
+            _entries.popitem( last = False )
+
+    return value
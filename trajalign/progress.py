@@ -0,0 +1,228 @@
+# All the software here is distributed under the terms of the GNU General Public License Version 3, June 2007.
+# Trajalign is a free software and comes with ABSOLUTELY NO WARRANTY.
+#
+# You are welcome to redistribute the software. However, we appreciate is use of such software would result in citations of
+# Picco, A., Kaksonen, M., _Precise tracking of the dynamics of multiple proteins in endocytic events_,  Methods in Cell Biology, Vol. 139, pages 51-68 (2017)
+# http://www.sciencedirect.com/science/article/pii/S0091679X16301546
+#
+# Author: Andrea Picco (https://github.com/apicco)
+# Year: 2017
+
+"""
+Progress reports, cancellation and checkpoints of long runs of average_trajectories, align and align_raw.
+
+EXAMPLE:
+
+from trajalign.progress import Progress, CancelToken, Cancelled, Checkpoint
+
+def show( event ) :
+    print( event[ 'stage' ] , event[ 'done' ] , '/' , event[ 'total' ] , 'ETA' , event[ 'eta' ] , 's' )
+
+cancel = CancelToken() #cancel.cancel(), e.g. from another thread, stops the run
+try :
+    average_trajectories( trajectory_list , max_frame = 500 , progress = Progress( show , interval = 10 ) , quiet = True , cancel = cancel )
+except Cancelled as c :
+    #the alignments computed so far are not lost
+    average_trajectories( trajectory_list , max_frame = 500 , resume = c.partial )
+
+#the alignments of the pairs of trajectories are saved every 10 minutes in 'run.checkpoint'. If the
+#run dies, it is continued from the last checkpoint
+average_trajectories( trajectory_list , max_frame = 500 , checkpoint = Checkpoint( 'run.checkpoint' , interval = 600 ) )
+average_trajectories( trajectory_list , max_frame = 500 , resume = 'run.checkpoint' )
+"""
+
+import os
+import time
+import pickle
+import tempfile
+import threading
+
+class Cancelled( Exception ) :
+    """
+    Cancelled( partial ) -> raised when a run is stopped by its CancelToken. 'partial' is the state
+    computed so far, which can be passed as 'resume' to the same function to continue the run.
+    """
+
+    def __init__( self , partial = None ) :
+
+        Exception.__init__( self , 'The run has been cancelled' )
+        self.partial = partial
+
+class CancelToken :
+    """
+    CancelToken() -> a token that stops a run when .cancel() is called, also from another thread.
+    The run stops before the next alignment and raises Cancelled.
+    """
+
+    def __init__( self ) :
+
+        self._event = threading.Event()
+
+    def cancel( self ) :
+
+        """
+        .cancel() asks the run to stop.
+        """
+
+        self._event.set()
+
+    def cancelled( self ) :
+
+        """
+        .cancelled() returns True if the run was asked to stop.
+        """
+
+        return self._event.is_set()
+
+    def check( self , partial = None ) :
+
+        """
+        .check( partial = None ) raises Cancelled( partial ) if the run was asked to stop.
+        """
+
+        if self._event.is_set() :
+            raise Cancelled( partial )
+
+class Progress :
+    """
+    Progress( callback , interval = 1 ) -> reports the progress of a run to callback( event ), at most once
+    every 'interval' seconds, and always at the start and at the end of each stage. 'event' is a dictionary:
+    { 'stage' : name of the stage , 'done' : steps done , 'total' : steps of the stage , 'elapsed' : seconds
+    since the start of the stage , 'eta' : estimate of the seconds left, None until it can be computed }.
+    """
+
+    def __init__( self , callback , interval = 1 ) :
+
+        self.callback = callback
+        self.interval = interval
+        self._stage = None
+        self._t0 = None
+        self._done0 = 0
+        self._last = None
+
+    def update( self , stage , done , total ) :
+
+        """
+        .update( stage , done , total ) reports that 'done' of the 'total' steps of 'stage' are done.
+        """
+
+        if self.callback is None :
+            return
+
+        now = time.perf_counter()
+
+        if stage != self._stage :
+            #a new stage starts. The ETA is computed from the steps done in this run, which
+            #excludes the steps that are resumed from a previous run.
+            self._stage = stage
+            self._t0 = now
+            self._done0 = done
+            self._last = None
+
+        if ( self._last is not None ) and ( now - self._last < self.interval ) and ( done < total ) :
+            return
+
+        self._last = now
+        elapsed = now - self._t0
+        if done > self._done0 :
+            eta = elapsed / ( done - self._done0 ) * ( total - done )
+        else :
+            eta = None
+
+        self.callback( { 'stage' : stage , 'done' : done , 'total' : total , 'elapsed' : elapsed , 'eta' : eta } )
+
+def as_progress( progress ) :
+
+    """
+    as_progress( progress ) returns 'progress' if it is a Progress, a Progress reporting to it if it
+    is a function, or a Progress that reports nothing if it is None.
+    """
+
+    if isinstance( progress , Progress ) :
+        return progress
+    else :
+        return Progress( progress )
+
+class Checkpoint :
+    """
+    Checkpoint( file_name , interval = 60 ) -> saves the state of a run in 'file_name' at most once every
+    'interval' seconds. The state is written in a temporary file that then replaces 'file_name', so that
+    the checkpoint is never read half written, also if the run dies while it is saving.
+    """
+
+    def __init__( self , file_name , interval = 60 ) :
+
+        self.file_name = file_name
+        self.interval = interval
+        self._last = time.perf_counter()
+
+    def __repr__( self ) :
+
+        return 'Checkpoint(' + repr( self.file_name ) + ', interval = ' + str( self.interval ) + ')'
+
+    def save( self , state , force = False ) :
+
+        """
+        .save( state , force = False ) saves 'state' if 'interval' seconds passed since the last save, or
+        if 'force' is True. Returns True if the state was saved.
+        """
+
+        if ( not force ) and ( time.perf_counter() - self._last < self.interval ) :
+            return False
+
+        directory = os.path.dirname( os.path.abspath( self.file_name ) )
+        fd , tmp = tempfile.mkstemp( dir = directory , suffix = '.tmp' )
+        try :
+            with os.fdopen( fd , 'wb' ) as f :
+                pickle.dump( state , f , protocol = pickle.HIGHEST_PROTOCOL )
+                #the state must be on disk before the file replaces the checkpoint, otherwise a crash
+                #could leave an empty or truncated checkpoint under its name
+                f.flush()
+                os.fsync( f.fileno() )
+            os.replace( tmp , self.file_name )
+        except :
+            if os.path.exists( tmp ) :
+                os.remove( tmp )
+            raise
+
+        #the replacement is on disk once the directory is. Directories cannot be opened on all systems
+        #(e.g. on Windows), where the replacement is left to the operating system.
+        try :
+            fd = os.open( directory , os.O_RDONLY )
+        except OSError :
+            fd = None
+        if fd is not None :
+            try :
+                os.fsync( fd )
+            except OSError :
+                pass
+            finally :
+                os.close( fd )
+
+        self._last = time.perf_counter()
+        return True
+
+def as_checkpoint( checkpoint ) :
+
+    """
+    as_checkpoint( checkpoint ) returns 'checkpoint' if it is a Checkpoint or None, or a Checkpoint
+    saving in the file 'checkpoint' otherwise.
+    """
+
+    if ( checkpoint is None ) or isinstance( checkpoint , Checkpoint ) :
+        return checkpoint
+    else :
+        return Checkpoint( checkpoint )
+
+def load_state( state ) :
+
+    """
+    load_state( state ) returns the state saved by a Checkpoint in the file 'state', or 'state' itself
+    if it is not a file name (e.g. the 'partial' state of Cancelled).
+    """
+
+    if isinstance( state , ( str , os.PathLike ) ) :
+        with open( state , 'rb' ) as f :
+            return pickle.load( f )
+    else :
+        return state
@@ -0,0 +1,473 @@
+# All the software here is distributed under the terms of the GNU General Public License Version 3, June 2007.
+# Trajalign is a free software and comes with ABSOLUTELY NO WARRANTY.
+#
+# You are welcome to redistribute the software. However, we appreciate is use of such software would result in citations of
+# Picco, A., Kaksonen, M., _Precise tracking of the dynamics of multiple proteins in endocytic events_,  Methods in Cell Biology, Vol. 139, pages 51-68 (2017)
+# http://www.sciencedirect.com/science/article/pii/S0091679X16301546
+#
+# Author: Andrea Picco (https://github.com/apicco)
+# Year: 2017
+
+"""
+End-to-end benchmarks of average_trajectories and align. The pipelines are run on synthetic datasets (see
+trajalign.synthetic) of increasing number of trajectories N, at a fixed length, and of increasing length L,
+at a fixed N, and optionally on the raw trajectories of example/trajectory_average_example. Each run records
+the wall time, the time spent in each stage (see trajalign.instrument) and, for the synthetic datasets, the
+accuracy of the recovered transformations against the ground truth. Each pipeline is run in the variants in
+variants(), which switch the optional speedups on and off. The results report the scaling exponents of the wall
+time in N and in L, are saved as JSON and can be checked for regressions against the results of a baseline run.
+In the memory mode (--memory) the runs also measure the memory of the pipelines and of their stages, with
+tracemalloc and by sampling the resident memory, the call sites that hold the most memory and the scaling
+exponents of the peak memory, e.g. to tell O(N L) from O(N^2 L). As tracemalloc slows the runs down, their wall
+times are compared only with those of other runs in the memory mode.
+
+EXAMPLE:
+
+python -m trajalign.scaling --n 5 10 20 --lengths 25 50 100 --output new.json --baseline old.json
+python -m trajalign.scaling --n 5 10 20 40 --lengths 25 --pipelines average --variants default --memory
+
+or, from python:
+
+from trajalign import scaling
+results = scaling.run( n = [ 5 , 10 , 20 ] , lengths = [ 25 , 50 , 100 ] , variants = [ 'default' , 'memo' ] )
+print( scaling.table( results ) )
+print( scaling.regressions( results , scaling.load( 'old.json' ) ) )
+"""
+
+import io
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+
+from trajalign import memo
+from trajalign.instrument import Profile , profiling
+from trajalign.traj import Traj
+from trajalign.align import align
+from trajalign.average import average_trajectories , load_directory
+from trajalign.synthetic import endocytic_template , synthetic_trajectories , synthetic_pairs
+from trajalign.benchmark import environment , exponent , save , load
+
+#the variants of the pipelines: the memoization size ( 'memo' , see trajalign.memo ), the floating point type
+#of the trajectories ( 'dtype' , see Traj.set_dtype ) and the options of average_trajectories ( 'options' ).
+#A variant is run only on its 'pipelines'.
+_variants = {
+        'default' : { 'pipelines' : ( 'average' , 'align' , 'raw' ) } ,
+        'memo' : { 'pipelines' : ( 'average' , 'align' , 'raw' ) , 'memo' : 256 } ,
+        'float32' : { 'pipelines' : ( 'average' , 'align' , 'raw' ) , 'dtype' : 'float32' } ,
+        'theil_sen' : { 'pipelines' : ( 'average' , 'raw' ) , 'options' : { 'lie_down_method' : 'theil_sen' } }
+        }
+
+#the changes of the errors of the recovered transformations that are not considered regressions
+_accuracy_floor = { 'angle' : 0.01 , 'translation' : 1.0 , 'lag' : 0.05 }
+
+#the increase of the peak memory, in bytes, that is not considered a regression
+_memory_floor = 2**20
+
+_raw_trajectories = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ) , '..' , 'example' , 'trajectory_average_example' , 'raw_trajectories' )
+
+def variants() :
+
+    """
+    variants() returns the names of the variants of the pipelines that can be benchmarked.
+    """
+
+    return list( _variants.keys() )
+
+@contextlib.contextmanager
+def _run_directory( variant ) :
+
+    #the pipelines save their outputs in the working directory: run them in a temporary
+    #directory, which is removed afterwards, without printing and with the memoization of the variant
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp( prefix = 'trajalign_scaling_' )
+    size = memo.size()
+    memo.clear()
+    memo.set_size( _variants[ variant ].get( 'memo' , size ) )
+    try :
+        os.chdir( directory )
+        with contextlib.redirect_stdout( io.StringIO() ) :
+            yield directory
+    finally :
+        os.chdir( cwd )
+        shutil.rmtree( directory , ignore_errors = True )
+        memo.set_size( size )
+        memo.clear()
+
+def _rigid( x , y ) :
+
+    #the rotation angle and the translation b for which y = R( angle ) @ x + b, in the least squares sense,
+    #computed on the points where both x and y are not NaN (Horn, 1987)
+    valid = ~ np.isnan( x ).any( axis = 0 ) & ~ np.isnan( y ).any( axis = 0 )
+    x = x[ : , valid ]
+    y = y[ : , valid ]
+
+    xc = x - x.mean( axis = 1 , keepdims = True )
+    yc = y - y.mean( axis = 1 , keepdims = True )
+    angle = np.arctan2( np.sum( xc[ 0 ] * yc[ 1 ] - xc[ 1 ] * yc[ 0 ] ) , np.sum( xc * yc ) )
+    R = np.array( [[ np.cos( angle ) , - np.sin( angle ) ] , [ np.sin( angle ) , np.cos( angle ) ]] )
+
+    return angle , y.mean( axis = 1 ) - R @ x.mean( axis = 1 )
+
+def _median_abs( x ) :
+
+    return float( np.median( np.abs( x ) ) )
+
+def _average_accuracy( trajectories , aligned , truth , center ) :
+
+    #the errors of the alignment of the trajectories by average_trajectories. As the aligned trajectories are
+    #in the frame of reference of the average, the transformations recovered for each trajectory, composed with
+    #the true transformations, must be the same for all the trajectories: the errors are the median absolute
+    #deviations of the angles, of the positions of the 'center' of the template and of the lags from their
+    #(circular) mean and medians.
+    angles = []
+    positions = []
+    lags = []
+    for t , a , g in zip( trajectories , aligned , truth ) :
+
+        delta_t = float( t.annotations()[ 'delta_t' ] )
+        lag = a.annotations()[ 'm_lag' ] * delta_t
+
+        #the time points of the trajectory that are in the aligned trajectory
+        common , i , j = np.intersect1d( np.round( t.t() / delta_t ).astype( int ) , np.round( ( a.t() - lag ) / delta_t ).astype( int ) , return_indices = True )
+        angle , b = _rigid( t.coord()[ : , i ].astype( 'float64' ) , a.coord()[ : , j ].astype( 'float64' ) )
+
+        R = np.array( [[ np.cos( angle ) , - np.sin( angle ) ] , [ np.sin( angle ) , np.cos( angle ) ]] )
+        angles.append( angle + g[ 'angle' ] )
+        G = np.array( [[ np.cos( angles[ -1 ] ) , - np.sin( angles[ -1 ] ) ] , [ np.sin( angles[ -1 ] ) , np.cos( angles[ -1 ] ) ]] )
+        positions.append( G @ center + R @ g[ 'translation' ] + b )
+        lags.append( lag - g[ 'lag' ] )
+
+    angles = np.array( angles )
+    positions = np.array( positions )
+    lags = np.array( lags )
+
+    return {
+            'angle' : _median_abs( np.angle( np.exp( 1j * ( angles - np.angle( np.mean( np.exp( 1j * angles ) ) ) ) ) ) ) ,
+            'translation' : _median_abs( np.linalg.norm( positions - np.median( positions , axis = 0 ) , axis = 1 ) ) ,
+            'lag' : _median_abs( lags - np.median( lags ) )
+            }
+
+def _align_accuracy( target , aligned , truth ) :
+
+    #the errors of the transformation that aligns the target to the reference, found by align
+    angle , b = _rigid( target.coord() , aligned.coord() )
+
+    return {
+            'angle' : float( abs( np.angle( np.exp( 1j * ( angle - truth[ 'angle' ] ) ) ) ) ) ,
+            'translation' : float( np.linalg.norm( b - truth[ 'translation' ] ) ) ,
+            'lag' : float( abs( aligned.t()[ 0 ] - target.t()[ 0 ] - truth[ 'lag' ] ) )
+            }
+
+def _record( pipeline , variant , n , length , seconds , profile , accuracy ) :
+
+    report = profile.report()
+
+    memory = None
+    if 'memory' in report :
+        memory = dict( report[ 'memory' ] )
+        memory[ 'stages' ] = { name : { k : s[ k ] for k in ( 'allocated' , 'peak' , 'rss_peak' ) if k in s } for name , s in report[ 'stages' ].items() }
+
+    return {
+            'pipeline' : pipeline ,
+            'variant' : variant ,
+            'n' : n ,
+            'length' : length ,
+            'seconds' : seconds ,
+            'stages' : { name : s[ 'seconds' ] for name , s in report[ 'stages' ].items() } ,
+            'counters' : report[ 'counters' ] ,
+            'accuracy' : accuracy ,
+            'memory' : memory
+            }
+
+def _lengths( length ) :
+
+    #the range of the lengths of the synthetic trajectories of length 'length', and the length of their template:
+    #as in the experiments, the trajectories cover most of the endocytic event
+    return ( length - length // 10 , length ) , length
+
+def run_average( n , length , variant = 'default' , seed = 0 , memory = False ) :
+
+    """
+    run_average( n , length , variant = 'default' , seed = 0 , memory = False ) runs average_trajectories on n synthetic
+    trajectories of about 'length' time points and returns the wall time, the time of its stages, the accuracy of the
+    alignment and, if 'memory' is True, the memory of the run (see Profile).
+    """
+
+    length_range , template_length = _lengths( length )
+    trajectories , truth = synthetic_trajectories( n , length = length_range , template_length = template_length , seed = seed )
+    for t in trajectories :
+        t.set_dtype( _variants[ variant ].get( 'dtype' , 'float64' ) )
+
+    with _run_directory( variant ) :
+        t0 = time.perf_counter()
+        best , worst , aligned , profile = average_trajectories( trajectories , max_frame = 400 + template_length + 10 , quiet = True , profile = Profile( memory = memory ) , **_variants[ variant ].get( 'options' , {} ) )
+        seconds = time.perf_counter() - t0
+
+    center = endocytic_template( template_length ).coord().mean( axis = 1 )
+
+    return _record( 'average' , variant , n , length , seconds , profile , _average_accuracy( trajectories , aligned , truth , center ) )
+
+def run_align( n , length , variant = 'default' , seed = 0 , memory = False ) :
+
+    """
+    run_align( n , length , variant = 'default' , seed = 0 , memory = False ) runs align on n synthetic pairs of trajectories
+    of about 'length' time points and returns the wall time, the time of its stages, the accuracy of the alignment and, if
+    'memory' is True, the memory of the run (see Profile).
+    """
+
+    length_range , template_length = _lengths( length )
+    target , reference , ch1 , ch2 , truth = synthetic_pairs( n , length = length_range , template_length = template_length , seed = seed )
+    for t in ch1 + ch2 :
+        t.set_dtype( _variants[ variant ].get( 'dtype' , 'float64' ) )
+
+    with _run_directory( variant ) :
+        target.save( 'target.txt' )
+        reference.save( 'reference.txt' )
+        t0 = time.perf_counter()
+        profile = align( 'target.txt' , 'reference.txt' , ch1 , ch2 , quiet = True , profile = Profile( memory = memory ) )
+        seconds = time.perf_counter() - t0
+        aligned = Traj()
+        aligned.load( 'target_aligned.txt' )
+
+    return _record( 'align' , variant , n , length , seconds , profile , _align_accuracy( target , aligned , truth ) )
+
+def run_raw( n , variant = 'default' , path = _raw_trajectories , memory = False ) :
+
+    """
+    run_raw( n , variant = 'default' , path = ... , memory = False ) runs average_trajectories on the first n raw trajectories
+    of example/trajectory_average_example, loaded as in trajectory_average_example.py. There is no ground truth, hence the
+    accuracy is not measured.
+    """
+
+    if not os.path.isdir( path ) :
+        raise IndexError( 'The raw trajectories are not found in ' + path )
+
+    files = sorted( f for f in os.listdir( path ) if f.endswith( '.data' ) )[ : n ]
+
+    #the loading is profiled with the average
+    with _run_directory( variant ) , profiling( Profile( memory = memory ) ) as profile :
+        t0 = time.perf_counter()
+        trajectories = load_directory( path = os.path.abspath( path ) , pattern = '.data' , comment_char = '%' , dt = 0.1045 , t_unit = 's' , coord_unit = 'pxl' ,
+                files = files , dtype = _variants[ variant ].get( 'dtype' , 'float64' ) , frames = 0 , coord = ( 1 , 2 ) , f = 3 )
+        average_trajectories( trajectories , max_frame = 500 , median = True , quiet = True , profile = profile , **_variants[ variant ].get( 'options' , {} ) )
+        seconds = time.perf_counter() - t0
+
+    return _record( 'raw' , variant , len( files ) , None , seconds , profile , None )
+
+def run( n = [ 5 , 10 , 20 ] , lengths = [ 25 , 50 , 100 ] , fixed_n = None , fixed_length = None , pipelines = [ 'average' , 'align' ] , variants = None , raw = 0 , seed = 0 , report = None , memory = False ) :
+
+    """
+    run( n = [ 5 , 10 , 20 ] , lengths = [ 25 , 50 , 100 ] , fixed_n = None , fixed_length = None , pipelines = [ 'average' , 'align' ] ,
+    variants = None , raw = 0 , seed = 0 , report = None , memory = False ) runs the 'pipelines' ('average' and/or 'align') in the 'variants' (all of
+    them if None, see variants()) on synthetic datasets of n trajectories of length fixed_length (default, the smallest length) and of
+    fixed_n trajectories (default, the smallest n) of each length. If raw > 0 average_trajectories is also run on the first 'raw'
+    trajectories of example/trajectory_average_example. 'report' is an optional function that is called with the record of each run.
+    If 'memory' is True, the memory of the runs is also measured (see Profile).
+    Returns the results:
+    { 'meta' : { ... } , 'runs' : [ { 'pipeline' , 'variant' , 'n' , 'length' , 'seconds' , 'stages' , 'counters' , 'accuracy' , 'memory' } ] ,
+    'scaling' : { pipeline : { variant : { 'n' : exponent , 'length' : exponent , 'memory_n' : exponent , 'memory_length' : exponent } } } }
+    """
+
+    if variants is None :
+        variants = list( _variants.keys() )
+    for name in variants :
+        if name not in _variants :
+            raise AttributeError( 'Unknown variant ' + repr( name ) + ', the variants are: ' + ', '.join( _variants.keys() ) )
+    for pipeline in pipelines :
+        if pipeline not in ( 'average' , 'align' ) :
+            raise AttributeError( 'The pipelines must be either \'average\' or \'align\'' )
+
+    if fixed_n is None :
+        fixed_n = min( n )
+    if fixed_length is None :
+        fixed_length = min( lengths )
+
+    #the datasets: first the scaling in N, then the scaling in L
+    sizes = [ ( i , fixed_length ) for i in n ] + [ ( fixed_n , l ) for l in lengths if l != fixed_length ]
+
+    results = {
+            'meta' : environment( n = list( n ) , lengths = list( lengths ) , fixed_n = fixed_n , fixed_length = fixed_length , raw = raw , seed = seed , memory = memory ) ,
+            'runs' : [] ,
+            'scaling' : {}
+            }
+
+    def add( record ) :
+        results[ 'runs' ].append( record )
+        if report is not None :
+            report( record )
+
+    for pipeline in pipelines :
+        function = { 'average' : run_average , 'align' : run_align }[ pipeline ]
+        for variant in variants :
+            if pipeline in _variants[ variant ][ 'pipelines' ] :
+                for i , l in sizes :
+                    add( function( i , l , variant , seed , memory ) )
+
+    if raw > 0 :
+        for variant in variants :
+            if 'raw' in _variants[ variant ][ 'pipelines' ] :
+                add( run_raw( raw , variant , memory = memory ) )
+
+    results[ 'scaling' ] = scaling( results )
+
+    return results
+
+def scaling( results ) :
+
+    """
+    scaling( results ) returns the scaling exponents of the wall time of each pipeline and variant in the number
+    of trajectories ('n', at the fixed length) and in their length ('length', at the fixed number of trajectories)
+    and, for the runs in the memory mode, the exponents of their peak memory ('memory_n' and 'memory_length').
+    """
+
+    fixed_n = results[ 'meta' ][ 'fixed_n' ]
+    fixed_length = results[ 'meta' ][ 'fixed_length' ]
+
+    output = {}
+    for r in results[ 'runs' ] :
+        output.setdefault( r[ 'pipeline' ] , {} ).setdefault( r[ 'variant' ] , {} )
+
+    for pipeline , v in output.items() :
+        for variant in v.keys() :
+            runs = [ r for r in results[ 'runs' ] if ( r[ 'pipeline' ] == pipeline ) and ( r[ 'variant' ] == variant ) ]
+            for axis , fixed , key in ( ( 'n' , fixed_length , 'length' ) , ( 'length' , fixed_n , 'n' ) ) :
+                points = sorted( ( r[ axis ] , r[ 'seconds' ] ) for r in runs if ( r[ key ] == fixed ) and ( r[ axis ] is not None ) )
+                if len( points ) > 1 :
+                    v[ variant ][ axis ] = exponent( [ p[ 0 ] for p in points ] , [ p[ 1 ] for p in points ] )
+                points = sorted( ( r[ axis ] , r[ 'memory' ][ 'peak' ] ) for r in runs if ( r[ key ] == fixed ) and ( r[ axis ] is not None ) and r.get( 'memory' ) )
+                if len( points ) > 1 :
+                    v[ variant ][ 'memory_' + axis ] = exponent( [ p[ 0 ] for p in points ] , [ p[ 1 ] for p in points ] )
+
+    return output
+
+def regressions( results , baseline , tolerance = 0.25 ) :
+
+    """
+    regressions( results , baseline , tolerance = 0.25 ) compares the runs in 'results' with the same runs in
+    'baseline' and returns the list of the regressions found: the runs whose wall time increased by more than
+    the fraction 'tolerance', whose errors of the recovered transformations increased by more than 'tolerance'
+    and more than a minimum error (0.01 rad, 1 coordinate unit and 0.05 time units), or whose peak memory increased
+    by more than 'tolerance' and more than 1 MB. Runs in the memory mode are compared only with runs in the memory mode.
+    """
+
+    def name( r ) :
+        return ( r[ 'pipeline' ] , r[ 'variant' ] , r[ 'n' ] , r[ 'length' ] , r.get( 'memory' ) is not None )
+
+    def label( r ) :
+        return r[ 'pipeline' ] + ' ' + r[ 'variant' ] + ' N=' + str( r[ 'n' ] ) + ' L=' + str( r[ 'length' ] )
+
+    previous = { name( r ) : r for r in baseline[ 'runs' ] }
+
+    output = []
+    for r in results[ 'runs' ] :
+
+        if name( r ) not in previous :
+            continue
+        p = previous[ name( r ) ]
+
+        if r[ 'seconds' ] > ( 1 + tolerance ) * p[ 'seconds' ] :
+            output.append( label( r ) + ': ' + '%.3g' % r[ 'seconds' ] + ' s, it was ' + '%.3g' % p[ 'seconds' ] + ' s' )
+
+        if ( r[ 'accuracy' ] is not None ) and ( p[ 'accuracy' ] is not None ) :
+            for error , value in r[ 'accuracy' ].items() :
+                if value > ( 1 + tolerance ) * p[ 'accuracy' ][ error ] + _accuracy_floor[ error ] :
+                    output.append( label( r ) + ': ' + error + ' error ' + '%.3g' % value + ', it was ' + '%.3g' % p[ 'accuracy' ][ error ] )
+
+        if ( r.get( 'memory' ) is not None ) and ( p.get( 'memory' ) is not None ) :
+            if r[ 'memory' ][ 'peak' ] > ( 1 + tolerance ) * p[ 'memory' ][ 'peak' ] + _memory_floor :
+                output.append( label( r ) + ': peak memory ' + _mb( r[ 'memory' ][ 'peak' ] ) + ' MB, it was ' + _mb( p[ 'memory' ][ 'peak' ] ) + ' MB' )
+
+    return output
+
+def _mb( size ) :
+
+    if size is None :
+        return '-'
+    return '%.2f' % ( size / 2**20 )
+
+def _format( record ) :
+
+    if record[ 'accuracy' ] is None :
+        accuracy = '%30s' % '-'
+    else :
+        accuracy = '%10.4f%10.2f%10.3f' % ( record[ 'accuracy' ][ 'angle' ] , record[ 'accuracy' ][ 'translation' ] , record[ 'accuracy' ][ 'lag' ] )
+    if record.get( 'memory' ) is None :
+        memory = '%10s%10s' % ( '-' , '-' )
+    else :
+        memory = '%10s%10s' % ( _mb( record[ 'memory' ][ 'peak' ] ) , _mb( record[ 'memory' ][ 'rss_peak' ] ) )
+    slowest = max( record[ 'stages' ].items() , key = lambda s : s[ 1 ] , default = ( '-' , 0 ) )
+
+    return '%-9s%-10s%6s%6s%10.3f' % ( record[ 'pipeline' ] , record[ 'variant' ] , record[ 'n' ] , record[ 'length' ] if record[ 'length' ] is not None else '-' , record[ 'seconds' ] ) +\
+            accuracy + memory + '  ' + slowest[ 0 ] + ' ' + '%.0f%%' % ( 100 * slowest[ 1 ] / record[ 'seconds' ] )
+
+def table( results ) :
+
+    """
+    table( results ) returns the runs and the scaling exponents of the results as a table. The errors are the
+    angle (rad), the translation (coordinate units) and the lag (time units), the peak memory traced and the peak
+    resident memory are in MB, and the slowest stage is reported. In the memory mode, the call sites that hold the
+    most memory in the largest run of each pipeline are also reported.
+    """
+
+    output = '%-9s%-10s%6s%6s%10s%10s%10s%10s%10s%10s  %s\n' % ( 'pipeline' , 'variant' , 'N' , 'L' , 'seconds' , 'angle' , 'transl.' , 'lag' , 'peak MB' , 'RSS MB' , 'slowest stage' )
+    for r in results[ 'runs' ] :
+        output += _format( r ) + '\n'
+
+    output += '\nscaling exponents\n'
+    for pipeline , v in results[ 'scaling' ].items() :
+        for variant , e in v.items() :
+            if len( e ) == 0 :
+                continue
+            output += '%-9s%-10s' % ( pipeline , variant ) + '  N: ' + ( '%.2f' % e[ 'n' ] if 'n' in e else '-' ) + '  L: ' + ( '%.2f' % e[ 'length' ] if 'length' in e else '-' )
+            if ( 'memory_n' in e ) or ( 'memory_length' in e ) :
+                output += '  memory N: ' + ( '%.2f' % e[ 'memory_n' ] if 'memory_n' in e else '-' ) + '  memory L: ' + ( '%.2f' % e[ 'memory_length' ] if 'memory_length' in e else '-' )
+            output += '\n'
+
+    for pipeline in results[ 'scaling' ].keys() :
+        runs = [ r for r in results[ 'runs' ] if ( r[ 'pipeline' ] == pipeline ) and ( r.get( 'memory' ) is not None ) ]
+        if len( runs ) > 0 :
+            largest = max( runs , key = lambda r : r[ 'memory' ][ 'peak' ] )
+            output += '\ntop call sites of ' + pipeline + ' ' + largest[ 'variant' ] + ' N=' + str( largest[ 'n' ] ) + ' L=' + str( largest[ 'length' ] ) + ' (MB)\n'
+            for site in largest[ 'memory' ][ 'top' ] :
+                output += '%10s  ' % _mb( site[ 'size' ] ) + site[ 'site' ] + '\n'
+
+    return output
+
+def main( argv = None ) :
+
+    parser = argparse.ArgumentParser( prog = 'python -m trajalign.scaling' , description = 'End-to-end benchmarks of average_trajectories and align on synthetic trajectories.' )
+    parser.add_argument( '--n' , type = int , nargs = '+' , default = [ 5 , 10 , 20 ] , help = 'the numbers of trajectories' )
+    parser.add_argument( '--lengths' , type = int , nargs = '+' , default = [ 25 , 50 , 100 ] , help = 'the lengths of the trajectories' )
+    parser.add_argument( '--fixed-n' , type = int , default = None , help = 'the number of trajectories of the scaling in L (default the smallest)' )
+    parser.add_argument( '--fixed-length' , type = int , default = None , help = 'the length of the trajectories of the scaling in N (default the smallest)' )
+    parser.add_argument( '--pipelines' , nargs = '+' , default = [ 'average' , 'align' ] , choices = [ 'average' , 'align' ] , help = 'the pipelines to run' )
+    parser.add_argument( '--variants' , nargs = '+' , default = None , choices = variants() , help = 'the variants to run (default all)' )
+    parser.add_argument( '--raw' , type = int , default = 0 , help = 'also average this number of raw trajectories of the example' )
+    parser.add_argument( '--seed' , type = int , default = 0 , help = 'the seed of the synthetic trajectories' )
+    parser.add_argument( '--output' , default = 'trajalign_scaling.json' , help = 'the JSON file where the results are saved' )
+    parser.add_argument( '--baseline' , default = None , help = 'the JSON file of a baseline run to check for regressions' )
+    parser.add_argument( '--tolerance' , type = float , default = 0.25 , help = 'the fraction by which the time, the errors or the memory can increase' )
+    parser.add_argument( '--memory' , action = 'store_true' , help = 'also measure the memory of the runs, which slows them down' )
+    args = parser.parse_args( argv )
+
+    results = run( args.n , args.lengths , args.fixed_n , args.fixed_length , args.pipelines , args.variants , args.raw , args.seed , report = lambda r : print( _format( r ) , flush = True ) , memory = args.memory )
+    save( results , args.output )
+
+    print( '\n' + table( results ) )
+    print( 'Results saved in ' + args.output )
+
+    if args.baseline is not None :
+        found = regressions( results , load( args.baseline ) , args.tolerance )
+        if len( found ) > 0 :
+            print( '\nRegressions against ' + args.baseline + ':\n' + '\n'.join( found ) )
+            sys.exit( 1 )
+        else :
+            print( '\nNo regressions against ' + args.baseline )
+
+if __name__ == '__main__' :
+    main()
@@ -0,0 +1,213 @@
+# All the software here is distributed under the terms of the GNU General Public License Version 3, June 2007.
+# Trajalign is a free software and comes with ABSOLUTELY NO WARRANTY.
+#
+# You are welcome to redistribute the software. However, we appreciate is use of such software would result in citations of
+# Picco, A., Kaksonen, M., _Precise tracking of the dynamics of multiple proteins in endocytic events_,  Methods in Cell Biology, Vol. 139, pages 51-68 (2017)
+# http://www.sciencedirect.com/science/article/pii/S0091679X16301546
+#
+# Author: Andrea Picco (https://github.com/apicco)
+# Year: 2017
+
+"""
+Datasets of trajectories shared by the processes of a pool. The arrays of the trajectories are copied once in a
+block of shared memory (see multiprocessing.shared_memory), and the workers attach to it and build the trajectories
+as read only views of the block, without copies. Hence the tasks sent to the workers carry only the indexes of the
+trajectories and their results, instead of the trajectories. The process that creates the dataset owns the block
+and removes it when the dataset is closed, when it is garbage collected or when the process exits; if the process
+is killed, the block is removed by the resource tracker of multiprocessing. The workers never remove the block,
+hence a worker that crashes does not affect the dataset.
+
+EXAMPLE:
+
+from trajalign.shared import SharedDataset
+from trajalign.average import MSD
+
+with SharedDataset( trajectory_list ) as dataset :
+    #MSD is called in the workers as MSD( dataset[ i ] , dataset[ j ] ), only ( i , j ) and the result are sent
+    results = dataset.map( MSD , [ ( i , j ) for i in range( len( dataset ) ) for j in range( i + 1 , len( dataset ) ) ] , workers = 4 )
+
+or, with a pool of your own:
+
+from concurrent.futures import ProcessPoolExecutor
+from trajalign import shared
+
+def task( pair ) :
+    t1 , t2 = shared.trajectory( pair[ 0 ] ) , shared.trajectory( pair[ 1 ] )
+    ...
+
+with SharedDataset( trajectory_list ) as dataset :
+    with ProcessPoolExecutor( 4 , initializer = shared.attach , initargs = ( dataset , ) ) as pool :
+        results = list( pool.map( task , pairs ) )
+"""
+
+import os
+import weakref
+import numpy as np
+from multiprocessing import shared_memory , resource_tracker
+from concurrent.futures import ProcessPoolExecutor
+
+from trajalign.traj import Traj
+
+_align = 64 #the arrays start at multiples of 64 bytes in the block
+_attached = None #the dataset the worker is attached to (see attach)
+
+def _unlink( shm , pid ) :
+
+    #remove the block, only in the process that created it (e.g. not in the forked workers)
+    if os.getpid() != pid :
+        return
+    try :
+        shm.close()
+    except BufferError : #views on the block are still in use: the memory is released when they are deleted
+        pass
+    try :
+        shm.unlink()
+    except FileNotFoundError :
+        pass
+
+def _attach( name ) :
+
+    #attach to the block without registering it to the resource tracker, which would remove it when the worker exits
+    try :
+        return shared_memory.SharedMemory( name = name , track = False )
+    except TypeError : #python < 3.13: the workers share the resource tracker of the owner, hence the block
+        #must be neither registered nor unregistered by them
+        register = resource_tracker.register
+        resource_tracker.register = lambda name , rtype : None
+        try :
+            return shared_memory.SharedMemory( name = name )
+        finally :
+            resource_tracker.register = register
+
+class SharedDataset :
+    """
+    SharedDataset( trajectories ) -> copies the arrays of the trajectories in a block of shared memory. dataset[ i ] is
+    the i-th trajectory, rebuilt as a frozen trajectory (see Traj.freeze) whose arrays are views of the block, with its
+    annotations. The dataset is closed with .close() or at the end of a with statement. The dataset can be passed to the workers of a pool (see attach and map):
+    only the name of the block and the layout of the trajectories are pickled.
+    """
+
+    def __init__( self , trajectories ) :
+
+        #the layout of the trajectories in the block: their annotations, dtype and, for each attribute, the
+        #offset, type and shape of its array
+        self._layout = []
+        size = 0
+        arrays = []
+        for t in trajectories :
+            entry = { 'annotations' : dict( t.annotations() ) , 'dtype' : t.dtype() , 'arrays' : {} }
+            for a in t.attributes() :
+                x = np.ascontiguousarray( getattr( t , a )() )
+                entry[ 'arrays' ][ a ] = ( size , x.dtype.str , x.shape )
+                arrays.append( ( size , x ) )
+                size = size + ( x.nbytes + _align - 1 ) // _align * _align
+            self._layout.append( entry )
+
+        self._shm = shared_memory.SharedMemory( create = True , size = max( size , 1 ) )
+        for offset , x in arrays :
+            np.ndarray( x.shape , dtype = x.dtype , buffer = self._shm.buf , offset = offset )[ ... ] = x
+
+        self._finalizer = weakref.finalize( self , _unlink , self._shm , os.getpid() )
+
+    def __getstate__( self ) :
+
+        return { 'name' : self._shm.name , 'layout' : self._layout }
+
+    def __setstate__( self , state ) :
+
+        #a dataset unpickled in a worker is attached to the block, which it does not own
+        self._layout = state[ 'layout' ]
+        self._shm = _attach( state[ 'name' ] )
+        self._finalizer = None
+
+    def __enter__( self ) :
+
+        return self
+
+    def __exit__( self , *args ) :
+
+        self.close()
+
+    def __len__( self ) :
+
+        return len( self._layout )
+
+    def __getitem__( self , i ) :
+
+        entry = self._layout[ i ]
+        values = {}
+        for a , ( offset , dtype , shape ) in entry[ 'arrays' ].items() :
+            x = np.ndarray( shape , dtype = dtype , buffer = self._shm.buf , offset = offset )
+            x.flags.writeable = False
+            values[ a ] = x
+
+        return Traj.from_arrays( annotations = entry[ 'annotations' ] , dtype = entry[ 'dtype' ] , validate = False , **values ).freeze()
+
+    def name( self ) :
+
+        """
+        .name(): the name of the block of shared memory.
+        """
+
+        return self._shm.name
+
+    def nbytes( self ) :
+
+        """
+        .nbytes(): the size of the block of shared memory, in bytes.
+        """
+
+        return self._shm.size
+
+    def close( self ) :
+
+        """
+        .close() removes the block of shared memory, if the dataset owns it, or detaches from it otherwise.
+        The trajectories of the dataset cannot be used afterwards.
+        """
+
+        if self._finalizer is not None :
+            self._finalizer()
+        else :
+            try :
+                self._shm.close()
+            except BufferError :
+                pass
+
+    def map( self , function , tasks , workers = None ) :
+
+        """
+        .map( function , tasks , workers = None ) returns the list of function( dataset[ i ] , dataset[ j ] , ... ) for
+        each tuple of indexes ( i , j , ... ) in 'tasks', computed by a pool of 'workers' processes (default, the number
+        of CPUs). 'function' must be picklable, e.g. a function defined at the top level of a module. If a worker
+        crashes, concurrent.futures.process.BrokenProcessPool is raised and the dataset is unaffected.
+        """
+
+        with ProcessPoolExecutor( workers , initializer = attach , initargs = ( self , ) ) as pool :
+            return list( pool.map( _call , [ function ] * len( tasks ) , tasks ) )
+
+def attach( dataset ) :
+
+    """
+    attach( dataset ) attaches the worker to the SharedDataset 'dataset', whose trajectories are then returned by
+    trajectory( i ). It is the initializer of the workers of a pool.
+    """
+
+    global _attached
+    _attached = dataset
+
+def trajectory( i ) :
+
+    """
+    trajectory( i ) returns the i-th trajectory of the dataset the worker is attached to (see attach).
+    """
+
+    if _attached is None :
+        raise AttributeError( 'The process is not attached to a SharedDataset' )
+
+    return _attached[ i ]
+
+def _call( function , indexes ) :
+
+    #the task of map, in the worker
+    return function( *[ trajectory( i ) for i in indexes ] )
@@ -0,0 +1,147 @@
+# All the software here is distributed under the terms of the GNU General Public License Version 3, June 2007.
+# Trajalign is a free software and comes with ABSOLUTELY NO WARRANTY.
+#
+# You are welcome to redistribute the software. However, we appreciate is use of such software would result in citations of
+# Picco, A., Kaksonen, M., _Precise tracking of the dynamics of multiple proteins in endocytic events_,  Methods in Cell Biology, Vol. 139, pages 51-68 (2017)
+# http://www.sciencedirect.com/science/article/pii/S0091679X16301546
+#
+# Author: Andrea Picco (https://github.com/apicco)
+# Year: 2017
+
+from trajalign.traj import Traj
+import numpy as np
+
+def endocytic_template( length = 100 , delta_t = 0.1045 , f_peak = 0.6 , f_width = 0.22 ) :
+
+    """
+    endocytic_template( length = 100 , delta_t = 0.1045 , f_peak = 0.6 , f_width = 0.22 ) -> the trajectory of an
+    ideal endocytic event, with 'length' time points spaced by delta_t (in s). The patch does not move for most of
+    its lifetime and then moves inward by 150 nm along y, while its fluorescence intensity rises to a peak and then
+    decays. The peak is at the fraction f_peak of the lifetime and its width is the fraction f_width of the lifetime.
+    Its time starts at 0 and its coordinates are in nm.
+    """
+
+    s = np.linspace( 0 , 1 , length )
+
+    t = np.arange( length ) * delta_t
+    coord = np.array( [ 10 * s , 150 / ( 1 + np.exp( - ( s - 0.7 ) / 0.06 ) ) ] )
+    f = 100 * np.exp( - ( ( s - f_peak ) / f_width ) ** 2 )
+
+    return Traj.from_arrays( frames = np.arange( length ) , t = t , coord = coord , f = f ,
+            annotations = { 'delta_t' : str( delta_t ) , 't_unit' : 's' , 'coord_unit' : 'nm' , 'synthetic' : 'template' } )
+
+def _observe( template , window , l , first_frame , angle , translation , rng , noise , f_noise , nan_fraction , missing_fraction , annotations ) :
+
+    #the time points window, ..., window + l - 1 of the template, rotated by angle, translated by translation,
+    #starting at first_frame and with noise, NaN and missing time points (see synthetic_trajectories)
+
+    delta_t = float( template.annotations()[ 'delta_t' ] )
+
+    R = np.array( [[ np.cos( angle ) , - np.sin( angle ) ] , [ np.sin( angle ) , np.cos( angle ) ]] )
+    coord = R @ template.coord()[ : , window : window + l ] + translation[ : , None ]
+    coord = coord + rng.normal( 0 , noise , coord.shape )
+    f = template.f()[ window : window + l ] + rng.normal( 0 , f_noise , l )
+
+    #NaN time points, which are neither the first nor the last
+    nans = 1 + rng.choice( l - 2 , size = int( nan_fraction * ( l - 2 ) ) , replace = False )
+    coord[ : , nans ] = np.nan
+    f[ nans ] = np.nan
+
+    #missing time points
+    keep = np.ones( l , dtype = bool )
+    keep[ 1 + rng.choice( l - 2 , size = int( missing_fraction * ( l - 2 ) ) , replace = False ) ] = False
+
+    frames = first_frame + np.arange( l )
+    annotations.update( { 'delta_t' : str( delta_t ) , 't_unit' : 's' , 'coord_unit' : 'nm' } )
+
+    return Traj.from_arrays( frames = frames[ keep ] , t = frames[ keep ] * delta_t , coord = coord[ : , keep ] , f = f[ keep ] , annotations = annotations )
+
+def synthetic_trajectories( n , length = ( 40 , 80 ) , template_length = 100 , delta_t = 0.1045 , noise = 5 , f_noise = 5 , nan_fraction = 0.05 , missing_fraction = 0 , seed = 0 ) :
+
+    """
+    synthetic_trajectories( n , length = ( 40 , 80 ) , template_length = 100 , delta_t = 0.1045 , noise = 5 , f_noise = 5 ,
+    nan_fraction = 0.05 , missing_fraction = 0 , seed = 0 ) -> ( trajectories , truth ): n trajectories sampled from the
+    endocytic_template and the transformations used to generate them, which are the ground truth of their alignment.
+
+    Each trajectory is a window of the template of random length between length[ 0 ] and length[ 1 ] (or of 'length'
+    time points, if it is a number), which is rotated by a random angle, translated by a random vector and shifted
+    to a random frame of the movie. Then gaussian noise with standard deviation 'noise' (nm) and 'f_noise' is added
+    to the coordinates and to the fluorescence intensity, a fraction 'nan_fraction' of the time points is set to NaN
+    and a fraction 'missing_fraction' of the inner time points is removed (see Traj.fill).
+
+    truth[ i ] is the dictionary { 'angle' , 'translation' , 'lag' } for which
+    trajectories[ i ].coord() = R( angle ) @ template.coord() + translation and
+    trajectories[ i ].t() + lag is the time of the template.
+    """
+
+    rng = np.random.default_rng( seed )
+
+    if np.ndim( length ) == 0 :
+        length = ( length , length )
+    if length[ 1 ] > template_length :
+        raise AttributeError( 'The trajectories cannot be longer than the template' )
+
+    template = endocytic_template( template_length , delta_t )
+
+    trajectories = []
+    truth = []
+    for i in range( n ) :
+
+        l = int( rng.integers( length[ 0 ] , length[ 1 ] + 1 ) )
+        window = int( rng.integers( 0 , template_length - l + 1 ) ) #the first time point of the template
+        first_frame = int( rng.integers( 0 , 400 ) ) #the first frame of the trajectory in the movie
+        angle = rng.uniform( - np.pi , np.pi )
+        translation = rng.uniform( -500 , 500 , 2 )
+
+        trajectories.append( _observe( template , window , l , first_frame , angle , translation , rng , noise , f_noise , nan_fraction , missing_fraction ,
+                { 'file' : 'synthetic_' + str( i ) + '.txt' } ) )
+        truth.append( { 'angle' : angle , 'translation' : translation , 'lag' : ( window - first_frame ) * delta_t } )
+
+    return trajectories , truth
+
+def synthetic_pairs( n , length = ( 40 , 80 ) , template_length = 100 , delta_t = 0.1045 , noise = 5 , f_noise = 5 , nan_fraction = 0.05 , seed = 0 ) :
+
+    """
+    synthetic_pairs( n , length = ( 40 , 80 ) , template_length = 100 , delta_t = 0.1045 , noise = 5 , f_noise = 5 ,
+    nan_fraction = 0.05 , seed = 0 ) -> ( target , reference , ch1 , ch2 , truth ): a synthetic two colour dataset, as
+    used by align. 'target' and 'reference' are the average trajectories of two proteins of the same endocytic events:
+    the target peaks earlier than the reference. The reference is rotated, translated and shifted in time by the
+    transformation in 'truth' = { 'angle' , 'translation' , 'lag' }, which is the transformation that align must
+    find to align the target to the reference. ch1[ i ] and ch2[ i ] are the trajectories of the two proteins in
+    the same event, acquired simultaneously, as generated by synthetic_trajectories.
+    """
+
+    rng = np.random.default_rng( seed )
+
+    if np.ndim( length ) == 0 :
+        length = ( length , length )
+    if length[ 1 ] > template_length :
+        raise AttributeError( 'The trajectories cannot be longer than the template' )
+
+    target = endocytic_template( template_length , delta_t , f_peak = 0.6 , f_width = 0.22 )
+    reference = endocytic_template( template_length , delta_t , f_peak = 0.75 , f_width = 0.15 )
+
+    ch1 = []
+    ch2 = []
+    for i in range( n ) :
+
+        l = int( rng.integers( length[ 0 ] , length[ 1 ] + 1 ) )
+        window = int( rng.integers( 0 , template_length - l + 1 ) )
+        first_frame = int( rng.integers( 0 , 400 ) )
+        angle = rng.uniform( - np.pi , np.pi )
+        translation = rng.uniform( -500 , 500 , 2 )
+
+        ch1.append( _observe( target , window , l , first_frame , angle , translation , rng , noise , f_noise , nan_fraction , 0 ,
+                { 'file' : 'synthetic_ch1_' + str( i ) + '.txt' } ) )
+        ch2.append( _observe( reference , window , l , first_frame , angle , translation , rng , noise , f_noise , nan_fraction , 0 ,
+                { 'file' : 'synthetic_ch2_' + str( i ) + '.txt' } ) )
+
+    truth = { 'angle' : rng.uniform( - np.pi , np.pi ) , 'translation' : rng.uniform( -500 , 500 , 2 ) , 'lag' : int( rng.integers( -50 , 50 ) ) * delta_t }
+
+    reference.rotate( truth[ 'angle' ] )
+    reference.translate( truth[ 'translation' ] )
+    reference.input_values( 't' , reference.t() + truth[ 'lag' ] )
+    target.annotations()[ 'synthetic' ] = 'target'
+    reference.annotations()[ 'synthetic' ] = 'reference'
+
+    return target , reference , ch1 , ch2 , truth
@@ -10,7 +10,6 @@
 
 from numpy import array
 from numpy import transpose
-from numpy import matrix
 from numpy import square
 from numpy import sqrt
 from numpy import sin
@@ -29,7 +28,107 @@ from numpy import isnan
 from numpy import round
 from numpy import polyfit
 from numpy import inf
+from numpy import result_type
+from numpy import int64
+from numpy import asarray
+from numpy import broadcast_to
+from numpy import concatenate
+from numpy import repeat
+from numpy import zeros
+from numpy import full
+from numpy import count_nonzero
+from numpy import searchsorted
+from numpy import diff
+from numpy import sign
+from numpy import ceil
+from numpy import arange
+from numpy import where
+from numpy import ascontiguousarray
+from numpy.lib.stride_tricks import sliding_window_view
 import copy as cp
+from types import MappingProxyType
+from functools import wraps
+from ast import literal_eval
+from hashlib import blake2b
+import gzip
+import bz2
+import lzma
+from trajalign import memo
+from trajalign import instrument
+from trajalign import kernels
+
+#the identity matrix, used by the translations
+_identity = array( [[ 1 , 0 ] , [ 0 , 1 ]] , dtype = 'float64' )
+
+#the compressions that are read and written transparently, by file name suffix
+_compressions = { '.gz' : gzip , '.bz2' : bz2 , '.xz' : lzma }
+
+def split_compression( file_name ) :
+
+    """
+    split_compression( file_name ): returns the file name without its compression suffix 
+    (.gz, .bz2 or .xz) and the suffix, which is '' if the file is not compressed.
+    """
+
+    for suffix in _compressions.keys() :
+        if file_name.endswith( suffix ) :
+            return ( file_name[ : - len( suffix ) ] , suffix )
+
+    return ( file_name , '' )
+
+def open_file( file_name , mode = 'r' ) :
+
+    """
+    open_file( file_name , mode = 'r' ): opens a text file for reading ( mode = 'r' ) or writing 
+    ( mode = 'w' ), compressing or decompressing it if its name ends with .gz, .bz2 or .xz.
+    """
+
+    compression = split_compression( file_name )[ 1 ]
+
+    if compression :
+        return _compressions[ compression ].open( file_name , mode + 't' )
+    else :
+        return open( file_name , mode )
+
+def _format_column( x ) :
+
+    #the strings of the elements of the array x, as str( element ). The str of float64 and 
+    #int64 elements is the same as the str of the python float and int, which are faster 
+    #to format.
+    if x.dtype in ( float64 , int64 ) :
+        return list( map( str , x.tolist() ) )
+    else :
+        return x.astype( str ).tolist()
+
+def read_annotation( line_elements ) :
+
+    """
+    read_annotation( line_elements ): returns the ( name , value ) of the annotation in a commented 
+    line of a trajectory file, already split into its elements (e.g. [ '#' , 'delta_t:' , '0.1' ]), 
+    or None if the line is not an annotation.
+    """
+
+    if len( line_elements ) > 1 :
+        last_character = len( line_elements[ 1 ] ) - 1
+        if line_elements[ 1 ][ last_character ] == ":" :
+            #the last element has not space following
+            return ( line_elements[ 1 ][ 0 : last_character  ] , " ".join( str( e ) for e in line_elements[ 2 : ] ) )
+
+    return None
+
+def _copy_on_write( method ) :
+
+    #the method changes the trajectory, unless the trajectory is frozen (see Traj.freeze): then
+    #the method changes a copy of the trajectory that can be changed, which is returned
+    @wraps( method )
+    def copy_on_write( self , *args , **kwargs ) :
+        if self._frozen :
+            output = self.thaw()
+            method( output , *args , **kwargs )
+            return output
+        return method( self , *args , **kwargs )
+
+    return copy_on_write
 
 class Traj:
     """Trajectory OBJECT:
@@ -80,7 +179,8 @@ class Traj:
         .fill() fills attributes of missing frames with NaN 
         .frames() and .t() accordingly.
 
-        .save(filename) saves the trajectory as txt to the filename.
+        .save(filename) saves the trajectory as txt to the filename. If the filename ends
+        with .gz, .bz2 or .xz the file is compressed.
         
         .rotate(angle) rotates the coordinates by 'angle' expressed in radiants.
 
@@ -88,6 +188,7 @@ class Traj:
         v: v[0] shifts .x[0,] while v[1] shifts .x[1,].
 
         .load(filename,sep=None,comment_char='#',**attribute_names): loads data from a txt table.
+        Compressed tables (.gz, .bz2 or .xz) are read transparently.
         Data must be ordered in columns. Columns can be separated by spaces or
         tabs or comas (for .csv files). 
         The separator can be entered in sep as a string. The default for sep is None, 
@@ -108,6 +209,10 @@ class Traj:
         .annotations(annotation=None,string=''): output the dictionary of the annotations associate to the
         trajectory (equivalent to .__dict__()). If an annotation is inputed it changes
         the value of the annotation with string. If the annotation is not defined it defines it.
+
+        .freeze() returns a frozen trajectory, whose arrays and annotations are read only, which can be 
+        shared by threads without copies. The methods that change a frozen trajectory return a changed 
+        copy of it instead. .thaw() returns a copy of a frozen trajectory that can be changed.
         
         EXAMPLES:
 
@@ -128,12 +233,21 @@ class Traj:
         t.rotate(np.pi/2) #rotate the trajectory by pi/2 
         print(t)
 
+        t = Traj.from_arrays( frames = [0,1,2] , coord = [[0.1,0.2,0.3],[1,1.1,1.2]] , 
+                annotations = { 'name' : 'My favorite protein' } ) #creates a trajectory from its arrays at once
+
         """
     
-    __slots__ = ['_annotations','_frames','_t','_coord','_f','_mol','_n','_m2', '_t_err','_coord_err','_f_err','_mol_err' , '_m2_err' ]
+    #the slots holding the trajectory attributes (arrays). The other slots hold the annotations and 
+    #the transformations that are pending (see .translate(), .rotate(), and .lag())
+    _attribute_slots = ['_frames','_t','_coord','_f','_mol','_n','_m2', '_t_err','_coord_err','_f_err','_mol_err' , '_m2_err' ]
+    __slots__ = ['_annotations'] + _attribute_slots + [ '_pending' , '_cache' , '_dtype' , '_frozen' ]
      
 
     def __init__(self,**annotations):
+        object.__setattr__( self , '_frozen' , False ) #see freeze
+        self._cache = {} #values derived from the data, such as the fimax cuts, stored with the fingerprint of the data
+        self._dtype = 'float64' #storage type of the attributes, except frames and time (see set_dtype)
 
         #Trajectory main attributes 
         self._annotations = annotations
@@ -152,6 +266,187 @@ class Traj:
         self._mol_err = array([],dtype='float64')
         self._m2_err = array([],dtype='float64')
 
+        #transformations not yet applied to the coordinates and time
+        self._pending = None
+
+    def __setattr__( self , name , value ):
+        if self._frozen :
+            raise AttributeError( 'The trajectory is frozen, use .thaw() to get a copy that can be changed' )
+        object.__setattr__( self , name , value )
+        #changing the data invalidates the values derived from them
+        if name in Traj._attribute_slots :
+            try :
+                if self._cache : 
+                    object.__setattr__( self , '_cache' , {} )
+            except AttributeError : #_cache is not set yet, e.g. while copying
+                pass
+
+    def __deepcopy__( self , visited ):
+        if self._frozen : #the copy of a frozen trajectory can be changed, as that of any other trajectory
+            output = self.thaw()
+            visited[ id( self ) ] = output
+            return output
+        instrument.count( 'deepcopy' )
+        output = self.__class__.__new__( self.__class__ )
+        visited[ id( self ) ] = output
+        for s in self.__slots__ :
+            if s == '_cache' :
+                #the cached values are not changed in place (e.g. the fimax cuts, which are checked against 
+                #the fingerprint of the values when used), hence they can be shared
+                object.__setattr__( output , s , dict( self._cache ) )
+            else :
+                object.__setattr__( output , s , cp.deepcopy( getattr( self , s ) , visited ) )
+        return output
+
+    def __getstate__( self ):
+        #the annotations of a frozen trajectory are a read only mapping, which cannot be pickled
+        state = { s : getattr( self , s ) for s in self.__slots__ }
+        state[ '_annotations' ] = dict( self._annotations )
+        return state
+
+    def __setstate__( self , state ):
+        if isinstance( state , tuple ) : #trajectories pickled before .freeze() existed
+            state = state[ 1 ]
+        object.__setattr__( self , '_frozen' , False )
+        for s , x in state.items() :
+            object.__setattr__( self , s , x )
+        if self._frozen :
+            for s in self._attribute_slots :
+                getattr( self , s ).flags.writeable = False
+            object.__setattr__( self , '_annotations' , MappingProxyType( self._annotations ) )
+
+    def freeze( self ):
+
+        """
+        .freeze() -> a frozen trajectory with the values and annotations of this one. The arrays of a frozen trajectory 
+        are read only views of the arrays of this trajectory, without copies, and its annotations are a read only mapping, 
+        hence it can be shared by threads and passed to MSD, cc and .fimax() without the copies that protect their inputs. 
+        The methods that change the trajectory (.translate(), .rotate(), .start( t ), .fill(), ...) return a changed copy 
+        of a frozen trajectory instead, and copy.deepcopy returns a copy that can be changed (see .thaw()). The arrays of 
+        this trajectory must not be changed in place afterwards, as the frozen trajectory shares them.
+        """
+
+        if self._frozen :
+            return self
+
+        self._apply()
+        output = self.__class__.__new__( self.__class__ )
+        for s in self._attribute_slots :
+            x = getattr( self , s ).view()
+            x.flags.writeable = False
+            object.__setattr__( output , s , x )
+        object.__setattr__( output , '_annotations' , MappingProxyType( dict( self._annotations ) ) )
+        object.__setattr__( output , '_pending' , None )
+        object.__setattr__( output , '_cache' , dict( self._cache ) )
+        object.__setattr__( output , '_dtype' , self._dtype )
+        object.__setattr__( output , '_frozen' , True )
+
+        return output
+
+    def thaw( self ):
+
+        """
+        .thaw() -> a copy of the trajectory, with copies of its arrays and annotations, that can be changed.
+        """
+
+        if not self._frozen :
+            return cp.deepcopy( self )
+
+        instrument.count( 'deepcopy' )
+        output = self.__class__.__new__( self.__class__ )
+        object.__setattr__( output , '_frozen' , False )
+        for s in self._attribute_slots :
+            object.__setattr__( output , s , getattr( self , s ).copy() )
+        object.__setattr__( output , '_annotations' , cp.deepcopy( dict( self._annotations ) ) )
+        object.__setattr__( output , '_pending' , None )
+        object.__setattr__( output , '_cache' , dict( self._cache ) )
+        object.__setattr__( output , '_dtype' , self._dtype )
+
+        return output
+
+    def frozen( self ):
+
+        """
+        .frozen(): True if the trajectory is frozen (see freeze).
+        """
+
+        return self._frozen
+
+    def _working_copy( self ):
+        #a copy of the trajectory that the functions that must not change their inputs (e.g. MSD and cc) can change. 
+        #The copy of a frozen trajectory shares its read only arrays, without copies: the methods of the trajectory 
+        #replace its arrays instead of changing them in place.
+        if not self._frozen :
+            return cp.deepcopy( self )
+
+        output = self.__class__.__new__( self.__class__ )
+        object.__setattr__( output , '_frozen' , False )
+        for s in self._attribute_slots :
+            object.__setattr__( output , s , getattr( self , s ) )
+        object.__setattr__( output , '_annotations' , dict( self._annotations ) )
+        object.__setattr__( output , '_pending' , None )
+        object.__setattr__( output , '_cache' , dict( self._cache ) )
+        object.__setattr__( output , '_dtype' , self._dtype )
+
+        return output
+
+    @classmethod
+    def from_arrays( cls , frames = None , t = None , coord = None , f = None , mol = None , n = None , m2 = None , t_err = None , coord_err = None , f_err = None , mol_err = None , m2_err = None , annotations = None , dtype = 'float64' , validate = True ):
+
+        """
+        Traj.from_arrays( frames = None , t = None , coord = None , f = None , ... , annotations = None , dtype = 'float64' , validate = True ) -> 
+        creates a trajectory from the arrays of its attributes and a dictionary of annotations in one call, instead 
+        of one .input_values() per attribute. With validate = True the arrays are copied in the storage types (see 
+        set_dtype) and checked all at once: they must have the same length, 'coord' and 'coord_err' must have two 
+        rows and the frames must be in chronological order. With validate = False the arrays are stored as they 
+        are, without copies nor checks, and the caller must guarantee that they are numpy arrays of the right type 
+        and shape that are not changed afterwards.
+        """
+
+        values = { 'frames' : frames , 't' : t , 'coord' : coord , 'f' : f , 'mol' : mol , 'n' : n , 'm2' : m2 , 
+                't_err' : t_err , 'coord_err' : coord_err , 'f_err' : f_err , 'mol_err' : mol_err , 'm2_err' : m2_err }
+        values = { a : x for a , x in values.items() if x is not None }
+
+        if validate :
+
+            if dtype not in ( 'float32' , 'float64' ) :
+                raise TypeError( "The dtype must be either 'float32' or 'float64'" )
+
+            l = None
+            for a in values.keys() :
+
+                if a == 'frames' : 
+                    x = array( values[ a ] , dtype = 'int64' )
+                elif a in ( 't' , 't_err' ) : #time is always stored in double precision
+                    x = array( values[ a ] , dtype = 'float64' )
+                else :
+                    x = array( values[ a ] , dtype = dtype )
+
+                if a in ( 'coord' , 'coord_err' ) :
+                    if x.ndim != 2 or x.shape[ 0 ] != 2 :
+                        raise AttributeError( 'The attribute ' + a + ' must have two rows' )
+                elif x.ndim != 1 :
+                    raise AttributeError( 'The attribute ' + a + ' must be one dimensional' )
+
+                if l is None :
+                    l = x.shape[ x.ndim - 1 ]
+                elif x.shape[ x.ndim - 1 ] != l :
+                    raise AttributeError( 'The input length of the attribute ' + a + ' does not match that of the other attributes' )
+
+                if a == 'frames' and ( diff( x ) <= 0 ).any() :
+                    raise AttributeError( 'The chronological order of the frames is wrong' )
+
+                values[ a ] = x
+
+        output = cls()
+        output._dtype = dtype
+        if annotations is not None :
+            output._annotations = dict( annotations )
+        for a , x in values.items() :
+            object.__setattr__( output , '_' + a , x )
+
+        return output
+
 
     def __dict__(self):
         return self._annotations
@@ -161,67 +456,86 @@ class Traj:
         else: return len(self._frames)
 
     def __repr__( self , n0 = 0 , n1 = NaN ):
+        return ''.join( self._table( n0 , n1 ) )
+
+    def _columns( self ):
+        self._apply()
+        #the names and the arrays of the columns of the table, one for each coordinate
+        table = []
+        names = []
+        for s in self._attribute_slots:
+            x = getattr(self,s)
+            if (x.shape[x.ndim-1] > 0):
+                if s in ('_coord','_coord_err'):
+                    #x coord
+                    table.append(x[0])
+                    if len(self._annotations['coord_unit']) > 0:
+                        names.append('x' + s[6:] + ' (' + self._annotations['coord_unit'] + ')')
+                    else:
+                        names.append('x' + s[6:])
+                    #y coord    
+                    table.append(x[1])
+                    if len(self._annotations['coord_unit']) > 0:
+                        names.append('y' + s[6:] + ' (' + self._annotations['coord_unit'] + ')')
+                    else:
+                        names.append('y' + s[6:])
+                else: 
+                    table.append(x)
+                    if s[1:] + '_unit' in self._annotations.keys():
+                        if len(self._annotations[ s[1:] + '_unit' ]) > 0:
+                            names.append( s[1:] + ' (' + self._annotations[s[1:] + '_unit' ] + ')' )
+                        else: 
+                            names.append(s[1:])
+                    else:
+                        names.append(s[1:])
+        return names , table
+
+    def _table( self , n0 = 0 , n1 = NaN , chunk = 65536 ):
+        #generates the text of the table of the rows n0 to n1 (excluded) chunk by chunk.
+        #Each element is written as str( element ), column by column, and rows are written 
+        #with the type common to all columns, so that frames are written as floats if there 
+        #are other (float) columns. The column width is computed on the rows that are printed.
         if (len(self)) == 0 :
             output = 'The trajectory is empty!\n'
             if (len(self._annotations)):
                 output += '#' + '-' * len(output) + '\n'
                 for name, item in self._annotations.items():
                     output += '# ' + name + ': ' + str( item )+ '\n'
-            return output
+            yield output
         else :
-            table = []
-            names = []
-            output = '#'
-            for s in self.__slots__[1:]:
-                x = getattr(self,s)
-                if (x.shape[x.ndim-1] > 0):
-                    if s in ('_coord','_coord_err'):
-                        #x coord
-                        table.append(x[0])
-                        if len(self._annotations['coord_unit']) > 0:
-                            names.append('x' + s[6:] + ' (' + self._annotations['coord_unit'] + ')')
-                        else:
-                            names.append('x' + s[6:])
-                        #y coord    
-                        table.append(x[1])
-                        if len(self._annotations['coord_unit']) > 0:
-                            names.append('y' + s[6:] + ' (' + self._annotations['coord_unit'] + ')')
-                        else:
-                            names.append('y' + s[6:])
-                    else: 
-                        table.append(x)
-                        if s[1:] + '_unit' in self._annotations.keys():
-                            if len(self._annotations[ s[1:] + '_unit' ]) > 0:
-                                names.append( s[1:] + ' (' + self._annotations[s[1:] + '_unit' ] + ')' )
-                            else: 
-                                names.append(s[1:])
-                        else:
-                            names.append(s[1:])
-            #find the best column width for the table
-            table_col_width = max(len(str(elmnt)) \
-                    for row in table for elmnt in row) + 2
+            names , table = self._columns()
+            if not n1 == n1 : n1 = len( self )
+            n0 = max( n0 , 0 )
+            n1 = max( min( n1 , len( self ) ) , n0 )
+            row_type = result_type( *table )
+            #find the best column width for the table. If a column has the same type of the 
+            #rows its strings are the same that will be printed, and are kept if they fit in a chunk.
+            table_col_width = 0
+            formatted = []
+            for x in table :
+                for i in range( n0 , n1 , chunk ) :
+                    x_str = _format_column( x[ i : min( i + chunk , n1 ) ] )
+                    table_col_width = max( table_col_width , max( map( len , x_str ) ) )
+                formatted.append( x_str if ( n1 - n0 <= chunk ) & ( x.dtype == row_type ) else None )
+            table_col_width += 2
             name_width = max(len(elmnt) for elmnt in names) + 2
             col_width = max(table_col_width,name_width)
             #print header
+            output = '#'
             output += str(names[0]).rjust(col_width-1)#the line begins with a '#'
             for name in names[1:]:
                 output += str(name).rjust(col_width)
-            output += '\n'
+            yield output + '\n'
             #print table
-            row_ID = 0
-            if not n1 == n1 : n1 = len( self )
-            for row in transpose(table):
-                if ( row_ID >= n0 ) and ( row_ID < n1 ) :
-                    output_row = ''
-                    for element in row:
-                        output_row += str(element).rjust(col_width)
-                    output += output_row+'\n'
-                row_ID += 1
+            row_format = ( '{:>' + str( col_width ) + '}' ) * len( table ) + '\n'
+            for i in range( n0 , n1 , chunk ) :
+                columns = [ formatted[ j ] if formatted[ j ] is not None else _format_column( table[ j ][ i : min( i + chunk , n1 ) ].astype( row_type ) ) for j in range( len( table ) ) ]
+                yield ''.join( [ row_format.format( *row ) for row in zip( *columns ) ] )
             #print annotations
-            output += '#'+'-'*(len(names)*col_width-1)+'\n'#nice separator
+            output = '#'+'-'*(len(names)*col_width-1)+'\n'#nice separator
             for name, item in self._annotations.items():
                 output += '# '+name+': '+ str( item )+'\n'
-            return output
+            yield output
 
 
     #Getters
@@ -236,6 +550,7 @@ class Traj:
                 print('Indexes in Traj().frames are out of bounds')
 
     def t(self,*items):
+        if self._pending is not None : self._apply_time()
         if (len(items)==0): return self._t
         elif len( items ) == 1 : return self._t[ items ]
         else: 
@@ -260,6 +575,7 @@ class Traj:
                 else :
                     for k in i:
                         new_items.append(k)
+        if self._pending is not None : self._apply()
         if (len(new_items)==0): return self._coord
         else: 
             try:
@@ -329,6 +645,7 @@ class Traj:
                 else :
                     for k in i:
                         new_items.append(k)
+        if self._pending is not None : self._apply()
         if (len(new_items)==0): return self._coord_err
         else: 
             try:
@@ -373,6 +690,8 @@ class Traj:
         .extract(range(10,20)) extracts all the rows from 10 to 19. 
         """
 
+        instrument.count( 'extract' )
+
         if (len(items)==0): 
             raise IndexError('Please, specify the values you want to extract from the trajectory')
         else:
@@ -391,46 +710,110 @@ class Traj:
                     else:
                         for k in i:
                             new_items.append(k)
-            #create the output trajectory
+            #the annotations of the output trajectory
+            annotations = {}
             if 'range' in self.annotations().keys():
-                output = Traj(range = self.annotations()['range']+' then '+str(new_items))
+                annotations[ 'range' ] = self.annotations()['range']+' then '+str(new_items)
             else:
-                output = Traj(range = str(new_items))
-            #inherit the annotations
+                annotations[ 'range' ] = str(new_items)
             for a in self.annotations().keys():
                 if a != 'range':
-                    output.annotations(a,self._annotations[a])
+                    annotations[ a ] = self._annotations[ a ]
+            #the rows of the attributes, which are already validated in this trajectory
+            self._apply()
+            values = {}
             try:
                 for a in self.attributes():
-                    if a == 'frames' : 
-                        output.input_values(a,self.frames(new_items))
-                    if (a == 't') : 
-                        output.input_values(a,self.t(new_items))
-                    if a == 'coord' : 
-                        output.input_values(a,self.coord(new_items))
-                    if a == 'f' : 
-                        output.input_values(a,self.f(new_items))
-                    if a == 'mol' : 
-                        output.input_values(a,self.mol(new_items))
-                    if a == 'n' : 
-                        output.input_values(a,self.n(new_items))
-                    if a == 'm2' : 
-                        output.input_values(a,self.m2(new_items))
-                    if a == 't_err' : 
-                        output.input_values(a,self.t_err(new_items))
-                    if a == 'coord_err' : 
-                        output.input_values(a,self.coord_err(new_items))
-                    if a == 'f_err' : 
-                        output.input_values(a,self.f_err(new_items))
-                    if a == 'mol_err' : 
-                        output.input_values(a,self.mol_err(new_items)) 
-                    if a == 'm2_err' : 
-                        output.input_values(a,self.m2_err(new_items)) 
+                    values[ a ] = getattr( self , '_' + a )[ ... , new_items ]
             except IndexError:
                 print('Indexes in range are out of bounds')
+            output = Traj.from_arrays( annotations = annotations , dtype = self._dtype , validate = False , **values )
 
         return output
 
+    def valid( self , attribute = 'f' ):
+
+        """
+        .valid( attribute = 'f' ) : returns the boolean mask of the time points where the attribute is not NaN. For 
+        'coord' (and 'coord_err') a time point is valid if both coordinates are not NaN. The mask is computed at each 
+        call, as the values can be changed in place through the attributes (e.g. t.f()[ 0 ] = NaN).
+        """
+
+        if '_' + attribute not in self._attribute_slots :
+
+            raise AttributeError( attribute + ' is not an attribute of the trajectory' )
+
+        self._apply()
+        x = getattr( self , '_' + attribute )
+        if x.ndim == 1 :
+            return ~ isnan( x )
+        else :
+            return ~ isnan( x ).any( axis = 0 )
+
+    def _time_grid( self ):
+        #( t0 , delta_t ) if the time points are regularly spaced by delta_t, None otherwise
+        key = ( 'time_grid' , )
+        if key not in self._cache :
+            grid = None
+            if ( len( self._t ) > 0 ) and ( 'delta_t' in self._annotations.keys() ) :
+                delta_t = float( self._annotations[ 'delta_t' ] )
+                if ( delta_t > 0 ) and ( abs( self._t[ 1: ] - self._t[ : len( self._t ) - 1 ] - delta_t ) <= 1e-6 * delta_t ).all() :
+                    grid = ( float( self._t[ 0 ] ) , delta_t )
+            self._cache[ key ] = grid
+        return self._cache[ key ]
+
+    def time_index( self , t ):
+
+        """
+        .time_index( t ) : returns the index of the time point closest to t, or None if t is more than delta_t / 2 
+        away from all the time points. If the time points are regularly spaced by delta_t, the index is computed 
+        directly from t, otherwise it is searched.
+        """
+
+        self._apply()
+
+        if len( self._t ) == 0 :
+            return None
+
+        grid = self._time_grid()
+        
+        if grid is not None :
+            
+            delta_t = grid[ 1 ]
+            i = int( round( ( t - grid[ 0 ] ) / delta_t ) )
+        
+        else :
+
+            if 'delta_t' in self._annotations.keys() :
+                delta_t = float( self._annotations[ 'delta_t' ] )
+            elif len( self._t ) > 1 :
+                delta_t = min( self._t[1:] - self._t[ 0 : ( len(self._t) - 1 ) ] )
+            else :
+                delta_t = 0
+            i = int( searchsorted( self._t , t ) )
+            if ( i == len( self._t ) ) or ( ( i > 0 ) and ( t - self._t[ i - 1 ] < self._t[ i ] - t ) ) :
+                i = i - 1
+
+        if ( 0 <= i < len( self._t ) ) and ( abs( self._t[ i ] - t ) <= delta_t / 2 ) :
+            return i
+        else :
+            return None
+
+    def _grid_index( self , t ):
+        #the index of the time point t, if the time points are regularly spaced and t is 
+        #close (isclose) to that time point only. None otherwise.
+        if self._time_grid() is None :
+            return None
+        i = self.time_index( t )
+        if i is None :
+            return None
+        if not ( isclose( t , self._t[ i ] ) & isclose( self._t[ i ] , t ) ) :
+            return None
+        for j in ( i - 1 , i + 1 ) :
+            if ( 0 <= j < len( self._t ) ) and ( isclose( t , self._t[ j ] ) | isclose( self._t[ j ] , t ) ) :
+                return None
+        return i
+
     def head( self , n = 10 ) :
 
         """
@@ -452,38 +835,50 @@ class Traj:
         """
         .fimax( self , filter = [ 1 ] ) : extracts a trajectory that stops at the max of the fluorescence intensity, included.
         'filter' defines the  filter used to smooth the fluorescence intensity profile. Default is no filter ( filter = [ 1 ] ).
+        The arrays of the extracted trajectory are read only views of the arrays of this trajectory: its methods (.translate(), 
+        .rotate(), .start( t ), ...) replace them and can be used as usual, but the values cannot be changed in place 
+        (e.g. .f()[ 0 ] = 0) without a copy of the trajectory (copy.deepcopy).
         """
 
-        output = cp.deepcopy( self )
-        
-        #check that the trajectory has a fluorescence intensity attribute which is not empty
-        if not len( self.f() ) :
-
-            raise AttributeError('The fluorescence intensity attribute is empty!')
+        instrument.count( 'fimax' )
+        end = self._fimax_end( filter )
 
-        if not len( self.t() ) :
-            
-            raise AttributeError('The time attribute is empty!')
+        if isinstance( end , int ) :
 
-        #running mean over fi. The same mean is run over the row numbers to find the 
-        #row at which the max in fi is.
-        not_nan = [ i for i in range( len( self ) ) if self.f( i ) == self.f( i ) ]
-        t_to_convolve = self.extract( not_nan )
+            #the trajectory up to the max of the fluorescence intensity, as a read only view on the data of self,
+            #so that changes in place of the output cannot change self
+            output = Traj()
+            output._dtype = self._dtype
+            for attribute in self._attribute_slots :
+                x = getattr( self , attribute )[ ... , 0 : end ]
+                x.flags.writeable = False
+                setattr( output , attribute , x )
+            output._annotations = cp.deepcopy( dict( self._annotations ) )
         
-        fi = array( convolve( t_to_convolve.f() , filter , 'valid' ) )
-        times = array( convolve( t_to_convolve.t() , filter , 'valid' ) )
-
-        time_where_fi_max_is = times[ min( fi.argmax() + 1 , len( fi ) - 1 ) ]
-
-        output.end( time_where_fi_max_is )
+        else :
+            
+            #the time of the max is not within the trajectory (e.g. filters with negative weights), 
+            #end() is used to find the cut
+            output = self._working_copy()
+            output.end( end )
 
         #create annotation
         output.annotations( 'fimax' , 'TRUE' )
 
         return output
 
+    def _fimax_end( self , filter ):
+        #the number of time points up to the max of the fluorescence intensity, included, or 
+        #the time of the max if it is outside the time span of the trajectory. The value is
+        #computed again only if the values of the trajectory changed (see fimax_indices).
+        return fimax_indices( [ self ] , filter )[ 0 ]
+
     # Mean Square Displacement utils
     def msd( self , scale = 1 ) :
+        #msd fills the trajectory, hence it works on a copy of a frozen trajectory
+        if self._frozen :
+            return self._working_copy().msd( scale )
+
         #check that the attribute .coord is not empty
         if len( self.coord() ) != 2 : 
 
@@ -512,20 +907,22 @@ class Traj:
             sem = [ inf ]
         
             l = len( self.coord()[ 0 ] )
+            valid = self.valid( 'coord' )
+            coord = self.coord().astype( 'float64' , copy = False ) #the displacements are computed in double precision
             ss = 1  #initiate the step size
 
             while( ss < l ) :
 
-                x1 = self.coord()[ 0 ][ ss : ] * scale
-                x2 = self.coord()[ 0 ][ : l - ss ] * scale
+                x1 = coord[ 0 ][ ss : ] * scale
+                x2 = coord[ 0 ][ : l - ss ] * scale
                 
-                y1 = self.coord()[ 1 ][ ss : ] * scale
-                y2 = self.coord()[ 1 ][ : l - ss ] * scale
+                y1 = coord[ 1 ][ ss : ] * scale
+                y2 = coord[ 1 ][ : l - ss ] * scale
 
-                d = [ ( x1[ i ] - x2[ i ] ) ** 2  + ( y1[ i ] - y2[ i ] ) ** 2 for i in range( l - ss ) ] 
+                d = ( x1 - x2 ) ** 2  + ( y1 - y2 ) ** 2
 
                 m.append( nanmean( d ) )
-                sem.append( nanstd( d ) / sqrt( sum( ~isnan( d ) ) ) ) #sem, dividing by the square root of the number of not nan items
+                sem.append( nanstd( d ) / sqrt( count_nonzero( valid[ ss : ] & valid[ : l - ss ] ) ) ) #sem, dividing by the square root of the number of not nan items
 
                 ss = ss + 1 
             
@@ -572,59 +969,38 @@ class Traj:
     # Integral calculator
     def integral( self , what , scale = 1 , two_dimentional = False ) :
 
+        self._apply()
         x = getattr( self , '_'+what )
         
-        xx = []
-
+        #the cumulative sums skip the NaN, which are NaN in the output (see kernels.nan_cumsum)
         if x.ndim == 1 :
-            x0 = 0 # reset the intergal starting value to 0
-            for i in range( 0 , len( x ) ) :
-                if x[ i ] == x[ i ] : 
-                    xx.append( x0 + x[ i ] * scale )
-                    x0 = xx[ -1 ]
-                else : 
-                    xx.append( NaN )
+            xx = kernels.nan_cumsum( x * scale ).tolist()
         else :
             if two_dimentional :
-                x0 = 0 # reset the intergal starting value to 0
-                for i in range( 0 , len( x[ 0 ] ) ) :
-
-                    if ( ( x[ 0 ][ i ] == x[ 0 ][ i ] ) & ( x[ 1 ][ i ] == x[ 1 ][ i ] ) ) : 
-                        xx.append( x0 + sign( x[ 0 ][ i ] ) * sqrt( x[ 0 ][ i ] ** 2 + x[ 1 ][ i ] ** 2 ) * scale )
-                        x0 = xx[ -1 ]
-                
-                    else : 
-
-                        xx.append( NaN )
+                xx = kernels.nan_cumsum( sign( x[ 0 ] ) * sqrt( x[ 0 ] ** 2 + x[ 1 ] ** 2 ) * scale ).tolist()
             else :
-                for j in range( 0 , x.ndim ) :
-                    xx.append( [] )
-                    x0 = 0 # reset the intergal starting value to 0
-                    for i in range( 0 , len( x[ j ] ) ) :
-                        if x[ j ][ i ] == x[ j ][ i ] : 
-                            xx[ j ].append( x0 + x[ j ][ i ] * scale )
-                            x0 = xx[ j ][ -1 ]
-                        else : 
-                            xx[ j ].append( NaN )
+                xx = [ kernels.nan_cumsum( x[ j ] * scale ).tolist() for j in range( 0 , x.ndim ) ]
         return( xx )
     #Setters
     #Input values in the Traj object as arrays. Array length must be equal to the length of frames and time
+    @_copy_on_write
     def input_values(self,name,x,unit=''):
         """
         input_values(attribute_names,array,unit='') inputs array in the trajectroy 
         attibute attribute_names. If known, allows to add the unit associated to the
         attribute values.
         """
-        if ('_'+name in self.__slots__[1:]):
+        self._apply()
+        if ('_'+name in self._attribute_slots):
             if ((name=='frames') & (len(self._t)==0)):
                 #copute the extent of gaps between frames (in general it is >= 1). If a 
                 #gap is negative it means that the chronological order of the frames
                 #is erroneous.
-                frame_gaps = [ x[ i + 1 ] - x[ i ] for i in range( 0 , len( x ) - 1 ) ]
+                frame_gaps = diff( x )
             
                 if len( x ) == 1 : #if there is only one frame it is not possible to compute frame_gaps
                     setattr(self,"_"+name,array(x,dtype='int64')) # add the frames; no time present yet 
-                elif min( frame_gaps ) > 0: 
+                elif ( frame_gaps > 0 ).all(): 
                     setattr(self,"_"+name,array(x,dtype='int64')) # add the frames; no time present yet 
                 else: 
                     raise AttributeError('The chronological order of the frames is wrong')
@@ -644,7 +1020,7 @@ class Traj:
 
                 if (len(x[0])==(len(self._frames) | len(self._t))):
 
-                    setattr(self,"_"+name,array(x,dtype='float64')) # add the coords
+                    setattr(self,"_"+name,array(x,dtype=self._dtype)) # add the coords
                     
                     if ( unit != '' ):
                         self._annotations['coord_unit'] = unit
@@ -657,7 +1033,7 @@ class Traj:
 
                 if (len(x[0])==(len(self._frames) | len(self._t))):
 
-                    setattr(self,"_"+name,array(x,dtype='float64')) # add the coords
+                    setattr(self,"_"+name,array(x,dtype=self._dtype)) # add the coords
 
                     # in the case the user wants to redefine the coord unit he needs to make sure that coord_units has
                     # not yet been assigned in .coord() 
@@ -680,7 +1056,8 @@ class Traj:
 
             elif (len(x)==(len(self._frames) | len(self._t))): 
                 if (name=='frames'): setattr(self,"_"+name,array(x,dtype='int64')) #add frames array checking it is as long as frames or times
-                else: setattr(self,"_"+name,array(x,dtype='float64')) #add array checking it is as long as frames or times
+                elif (name=='t_err'): setattr(self,"_"+name,array(x,dtype='float64')) #time is always stored in double precision
+                else: setattr(self,"_"+name,array(x,dtype=self._dtype)) #add array checking it is as long as frames or times
                 if len(unit) > 0:
                     self._annotations[name+' unit'] = unit
             else:
@@ -688,6 +1065,57 @@ class Traj:
         else:
             raise AttributeError('The attribute name does not match the allowd attributes of the trajectory class. Choose one among: \'frames\',\'t\',\'t_err\',\'coord\',\'coord_err\',\'f\',\'f_err\',\'n\'')
 
+    @_copy_on_write
+    def set_dtype( self , dtype = 'float64' ):
+        """
+        .set_dtype( dtype = 'float64' ): sets the floating point type in which the attributes of the trajectory are stored,
+        'float64' (default) or 'float32', and converts the attributes already present. 'float32' halves the memory used
+        and is precise to about 7 significant digits, which is well below the localisation precision of the coordinates.
+        The time ('t' and 't_err') is always stored as 'float64', as the alignment in time relies on it, and the 
+        computations on the trajectories (MSD, averages, ...) are done in 'float64'.
+        """
+
+        if dtype not in ( 'float32' , 'float64' ) :
+            raise TypeError( 'set_dtype: dtype must be either \'float32\' or \'float64\'' )
+
+        self._apply()
+        self._dtype = dtype
+        for attribute in self._attribute_slots :
+            if attribute not in ( '_frames' , '_t' , '_t_err' ) :
+                x = getattr( self , attribute )
+                if x.dtype != dtype :
+                    setattr( self , attribute , x.astype( dtype ) )
+
+    def dtype( self ):
+        """
+        .dtype(): the floating point type in which the attributes of the trajectory are stored (see set_dtype).
+        """
+        return self._dtype
+
+    def fingerprint( self , annotations = ( 'delta_t' , ) ):
+        """
+        .fingerprint( annotations = ( 'delta_t' , ) ): returns a hash (a hexadecimal string) of the values of the 
+        trajectory and of the annotations listed in 'annotations' (all of them if None). Trajectories with the same 
+        values, stored in the same type, and the same annotations have the same fingerprint. The hash is computed 
+        at each call, as the values can be changed in place through the attributes (e.g. t.f()[ 0 ] = 0).
+        """
+        self._apply()
+        h = blake2b( digest_size = 16 )
+        for s in self._attribute_slots :
+            x = ascontiguousarray( getattr( self , s ) )
+            h.update( ( s + ' ' + str( x.dtype ) + ' ' + str( x.shape ) ).encode() )
+            h.update( x.data )
+
+        if annotations is None :
+            annotations = sorted( self._annotations.keys() )
+
+        h = blake2b( h.digest() , digest_size = 16 )
+        for a in annotations :
+            if a in self._annotations.keys() :
+                h.update( repr( ( a , self._annotations[ a ] ) ).encode() )
+        return h.hexdigest()
+
+    @_copy_on_write
     def norm_f(self):
         """
         .norm_f(): normalises the fluorescence intensities .f() between 0 and 1.
@@ -709,6 +1137,7 @@ class Traj:
             #between 0 and 1, hence we do no propagate the error of the max(self._f)
             #and min(self._f).
 
+    @_copy_on_write
     def scale_f(self , v = 1 ):
         """
         .scale_f(): scale the fluorescence intensities so that their integral is an arbitrary value 'v'. Default is 1.
@@ -723,6 +1152,7 @@ class Traj:
             #so that all fluorescence intensiteis meet the same integral, 
             #hence we do no propagate the error of the S.
 
+    @_copy_on_write
     def n_mol( self , N , N_err ) :
         
         """
@@ -739,36 +1169,32 @@ class Traj:
                 ( self.f_err( self.f().tolist().index( nanmin( self.f() ) ) ) * N * ( M - F ) / M **2 ) ** 2 )
                 )
 
+    @_copy_on_write
     def rotate( self , angle , angle_err = 0):
         """
         rotate(angle): rotates the coordinated of the trajectory \
                 by an angle in radiants.
         """
 
-        R = matrix( [[ cos( angle ) , - sin( angle ) ] , [ sin( angle ) , cos( angle ) ]] , dtype = 'float64' ) 
-        sR = square( R )
-        
-        self._coord = array( R @ self._coord )
-
-        #if the attribute _coord_err is not empty, then propagate the errors accordingly 
-        if ( self._coord_err.shape[ self._coord_err.ndim - 1 ] > 0 ) :
-
-            self._coord_err = array( sqrt( 
-                    sR @ square( self._coord_err ) + \
-                            square( angle_err * sqrt( 1 - sR ) @ matrix([[ 1 , 0 ] , [ 0 , -1 ]] ) @ self._coord )
-                    ))
+        if angle_err == 0 :
+            
+            #the rotation is added to the pending transformations (see rotate_all)
+            R = array( [[ cos( angle ) , - sin( angle ) ] , [ sin( angle ) , cos( angle ) ]] , dtype = 'float64' )
+            self._compose( R , ( 0 , 0 ) , square( R ) , ( 0 , 0 ) , False )
         
-        elif angle_err > 0 : #if there is not attribute _coord_err, but there is an error then
-            self.insert_values( 'coord_err' , array( square( angle_err * sqrt( 1 - sR ) @ matrix([[ 1 , 0 ] , [ 0 , -1 ]] ) @ self.coord() )
-                    ) )
+        else :
+            
+            rotate_all( [ self ] , angle , angle_err )
 
     def center_mass(self):
         """
         center_mass(): centers the trajectory on its center of mass
         """
 
-        return( array( [ nanmean( self._coord[0,] ), nanmean( self._coord[1,] ) ] ))
+        self._apply()
+        return( array( [ nanmean( self._coord[0,] , dtype = 'float64' ), nanmean( self._coord[1,] , dtype = 'float64' ) ] ))
 
+    @_copy_on_write
     def translate( self , v , v_err = ( 0 , 0) ):
         """
         translate(v): translates the coordinates of the trajectory \
@@ -776,22 +1202,68 @@ class Traj:
                 .x[1,].
         """
 
-        self._coord[ 0 , ] = self._coord[ 0 , ] + v[ 0 ]
-        self._coord[ 1 , ] = self._coord[ 1 , ] + v[ 1 ]
         if len( v_err ) != 2 :
             raise AttributeError('The error must be a vector of length 2')
+        
+        #the translation is added to the pending transformations (see translate_all)
+        self._compose( _identity , v , _identity , ( v_err[ 0 ] ** 2 , v_err[ 1 ] ** 2 ) , 
+                ( v_err[ 0 ] != 0 ) | ( v_err[ 1 ] != 0 ) )
+
+    def _compose( self , A , b , E , c , new_err ):
+        #add the transformation x -> A @ x + b to the pending transformations of the coordinates, 
+        #and the transformation e2 -> E @ e2 + c to those of their squared errors. If new_err is
+        #True and the trajectory has no errors, c will be used as their squared errors.
+        p = self._pending
+        if p is None :
+            self._pending = p = { 'A' : None , 'b' : None , 'E' : None , 'c' : None , 'new_err' : False , 'dt' : 0 }
+        if p[ 'A' ] is None :
+            p[ 'A' ] = array( A , dtype = 'float64' )
+            p[ 'b' ] = array( b , dtype = 'float64' )
         else :
-            if ( v_err[ 0 ] != 0 ) | ( v_err[ 1 ] != 0 ) :
-                #if the attribute _coord_err is not empty, then propagate the errors accordingly 
-                if ( self._coord_err.shape[self._coord_err.ndim-1] > 0 ) :
-                    self._coord_err[ 0 , ] = sqrt( self._coord_err[ 0 , ] ** 2 + v_err[ 0 ] ** 2 )
-                    self._coord_err[ 1 , ] = sqrt( self._coord_err[ 1 , ] ** 2 + v_err[ 1 ] ** 2 )
-                else :
-                    setattr( self , '_coord_err' , array( [\
-                             [ v_err[ 0 ] ] * ( len( self )  ),
-                             [ v_err[ 1 ] ] * ( len( self )  )
-                                ] , dtype = 'float64' ) )
-    
+            p[ 'A' ] = A @ p[ 'A' ]
+            p[ 'b' ] = A @ p[ 'b' ] + b
+        if ( c[ 0 ] != 0 ) | ( c[ 1 ] != 0 ) | ( p[ 'E' ] is not None ) | ( ( E[ 0 , 1 ] != 0 ) | ( E[ 1 , 0 ] != 0 ) | ( E[ 0 , 0 ] != 1 ) | ( E[ 1 , 1 ] != 1 ) ) :
+            if p[ 'E' ] is None :
+                p[ 'E' ] = array( E , dtype = 'float64' )
+                p[ 'c' ] = array( c , dtype = 'float64' )
+            else :
+                p[ 'E' ] = E @ p[ 'E' ]
+                p[ 'c' ] = E @ p[ 'c' ] + c
+        p[ 'new_err' ] = p[ 'new_err' ] | new_err
+
+    def _apply_time( self ):
+        #apply the pending time shift
+        p = self._pending
+        if p[ 'dt' ] != 0 :
+            self._t = self._t + p[ 'dt' ]
+            self._record( None , None , p[ 'dt' ] )
+            p[ 'dt' ] = 0
+        if p[ 'A' ] is None :
+            self._pending = None
+
+    def _apply( self ):
+        #apply all the pending transformations at once, if any
+        if self._pending is not None :
+            apply_all( [ self ] )
+
+    def _record( self , A , b , dt ):
+        #compose the transformations applied to the trajectory in the annotations 'affine_transform', 
+        #the 2x3 matrix [ A | b ] of the transformation x -> A @ x + b, and 'time_shift'
+        if A is not None :
+            M = self._annotations.get( 'affine_transform' , None )
+            if isinstance( M , str ) : #annotation loaded from a file
+                try :
+                    M = literal_eval( M )
+                except ( ValueError , SyntaxError ) :
+                    M = None
+            if M is not None :
+                M = array( M , dtype = 'float64' )
+                A , b = A @ M[ : , 0:2 ] , A @ M[ : , 2 ] + b
+            self._annotations[ 'affine_transform' ] = tuple( ( float( A[ i , 0 ] ) , float( A[ i , 1 ] ) , float( b[ i ] ) ) for i in range( 2 ) )
+        if dt != 0 :
+            self._annotations[ 'time_shift' ] = float( self._annotations.get( 'time_shift' , 0 ) ) + float( dt )
+
+    @_copy_on_write
     def lag(self,shift):
         """
         lag(shift): shifts the time of the trajectory by 'shift', in the trajectory units. Shift is an integer that measure the number of time intervals, or frames, the trajectory has to be shifted. 
@@ -800,23 +1272,30 @@ class Traj:
             if len(self._t) == 0:
                 raise AttributeError('There is no time to be shifted')
             elif 'delta_t' in self._annotations.keys():
-                self._t += shift * float(self._annotations['delta_t'])
-                return self._t
+                self._shift( shift * float(self._annotations['delta_t']) )
+                return self.t()
             else :
                 print("Waring: lag() estimates the delta_t from the trajectory time attribute")
-                delta_t = min(self._t[1:]-self._t[0:(len(self._t)-1)])
-                self._t += shift * delta_t
-                return self._t
+                delta_t = min(self.t()[1:]-self.t()[0:(len(self._t)-1)])
+                self._shift( shift * delta_t )
+                return self.t()
         else :
             raise TypeError('shift in lag() must be integer')
 
+    def _shift( self , dt ):
+        #add the time shift dt to the pending transformations
+        if self._pending is None :
+            self._pending = { 'A' : None , 'b' : None , 'E' : None , 'c' : None , 'new_err' : False , 'dt' : 0 }
+        self._pending[ 'dt' ] += dt
+
+    @_copy_on_write
     def tshift( self , t0 ) :
         
         if len( self._t ) == 0 :
             raise AttributeError('There is no time to be shifted' )
         else :
             # shift the time
-            self._t += t0
+            self._shift( t0 )
             # and shift the mean start and end accordingly, if present
             if 'mean_starts' in  self.annotations().keys() :
                 self.annotations()[ 'mean_starts' ] = t0 + float( self.annotations()[ 'mean_starts' ] )
@@ -829,6 +1308,12 @@ class Traj:
         start(t=None): the start time of the trajectory. If t is specified
         the trajecotry points starting from t are extracted. 
         """
+        if ( t is not None ) and self._frozen :
+            output = self.thaw()
+            output.start( t )
+            return output
+        self._apply()
+        if t is not None : instrument.count( 'start' )
         
         if len(self._t) > 0:
             
@@ -843,8 +1328,13 @@ class Traj:
                     ( ( t  > self._t[0] ) | isclose( t , self._t[0] ) | isclose( self._t[0] , t ) ) & 
                     ( ( t < self._t[len(self)-1] ) | isclose( t , self._t[len(self)-1] ) | isclose( self._t[len(self)-1] , t ) )
                         ): #check wheter t is comprised between self._t[0] and self._t[len(self)-1]. The two isclose are needed because in rare cases isclose order of argumants can lead to different results, see numpy documentation
-                new_t = array([ i for i in self._t if ( (i > t) | isclose( i , t ) | isclose( t , i ) ) ] )
-                new_start = self._t.tolist().index(new_t[0])
+                new_start = self._grid_index( t )
+                if new_start is not None :
+                    new_t = self._t[ new_start : ]
+                else :
+                    keep = ( self._t > t ) | isclose( self._t , t ) | isclose( t , self._t )
+                    new_t = self._t[ keep ]
+                    new_start = int( keep.argmax() )
                 self._t = new_t
                 for attribute in self.attributes():
                     if attribute == 'coord':
@@ -901,6 +1391,12 @@ class Traj:
         end(t=None): the end time of the trajectory. If t is specified
         the trajecotry points ending before t are extracted. 
         """
+        if ( t is not None ) and self._frozen :
+            output = self.thaw()
+            output.end( t )
+            return output
+        self._apply()
+        if t is not None : instrument.count( 'end' )
 
         if len(self._t) > 0:
             if 'delta_t' in self._annotations.keys():
@@ -913,8 +1409,13 @@ class Traj:
                     ( ( t  > self._t[0] ) | isclose( t , self._t[0] ) | isclose( self._t[0] , t ) ) & 
                     ( ( t < self._t[len(self)-1] ) | isclose( t , self._t[len(self)-1] ) | isclose( self._t[len(self)-1] , t ) )
                         ) : #in rare cases isclose order of argumants can lead to different results, see numpy documentation
-                self._t = array([ i for i in self._t if ( (i < t) | isclose(i,t) ) ])
-                new_end = len(self._t)
+                new_end = self._grid_index( t )
+                if new_end is not None :
+                    new_end = new_end + 1
+                    self._t = self._t[ 0 : new_end ]
+                else :
+                    self._t = self._t[ ( self._t < t ) | isclose( self._t , t ) ]
+                    new_end = len(self._t)
                 for attribute in self.attributes():
                     if attribute == 'coord':
                         self._coord = array([\
@@ -973,12 +1474,14 @@ class Traj:
         """
         return self.end() - self.start()
 
+    @_copy_on_write
     def time(self,delta_t,unit):
         
         """
         time(delta_t,unit): assigns the time attribute based on the frame numbering
         given the known interval delta_t between frames
         """
+        self._apply()
     
         if (len(self._frames) > 0 & len(self._t) == 0):
             self._t=self._frames*delta_t
@@ -989,12 +1492,19 @@ class Traj:
             if (len(self._t) > 0) :raise AttributeError('The time attribute is already defined')
     
     def save(self,file_name):
+        """
+        .save(file_name) saves the trajectory as txt to file_name. If file_name ends with 
+        .gz, .bz2 or .xz the file is compressed accordingly.
+        """
+        self._apply()
+        file_name , compression = split_compression( file_name )
         if file_name[len(file_name)-3:] != 'txt' :
             file_name += '.txt'
-        with open(file_name,'w') as f:
-            f.write(repr(self))
-        f.close()
+        with open_file(file_name + compression,'w') as f:
+            for text in self._table():
+                f.write(text)
     
+    @_copy_on_write
     def load(self,file_name,sep=None,comment_char='#',**attrs):
         """
         .load(file_name,sep=None,comment_char='#',**attribute_names): loads data from a txt table.
@@ -1017,9 +1527,10 @@ class Traj:
         Note that 'coord' requires two values and the column indexing starts 
         from 0.
         """
+        self._apply()
 
         output = {}
-        for a in [a for a in attrs.keys() if '_'+a in self.__slots__[1:]]:
+        for a in [a for a in attrs.keys() if '_'+a in self._attribute_slots]:
             if (a == 'coord') | (a == 'coord_err'):
                 output[a] = [[],[]]
             else:
@@ -1028,7 +1539,7 @@ class Traj:
         # annotate the file_name
         self.annotations( 'file' , file_name )
     
-        with open( file_name , 'r' ) as file:
+        with open_file( file_name , 'r' ) as file:
             
             for line in file:
                 line_elements = line.split( sep )
@@ -1046,13 +1557,13 @@ class Traj:
                                 else :
                                     attrs[ e ] = i
                                     i += 1
-                        for a in [a for a in attrs.keys() if '_'+a in self.__slots__[1:]]:
+                        for a in [a for a in attrs.keys() if '_'+a in self._attribute_slots]:
                             if (a == 'coord') | (a == 'coord_err'):
                                 output[a] = [[],[]]
                             else:
                                 output[a] = []
                     elif (( len(attrs.keys()) > 0 ) & ( line_elements[0][0:len(comment_char)] != comment_char )):
-                        for a in [a for a in attrs.keys() if '_'+a in self.__slots__[1:]]:
+                        for a in [a for a in attrs.keys() if '_'+a in self._attribute_slots]:
                             try:
                                 if (a == 'coord') | (a == 'coord_err'):
                                     output[a][0].append(float(line_elements[attrs[a][0]]))
@@ -1066,17 +1577,9 @@ class Traj:
                     elif  line_elements[ 0 ][ 0:len( comment_char ) ] == comment_char  :
                         if not ( ( sep == None ) | ( sep == " " ) ) :
                             line_elements = line.split( None ) #annotations are split with spaces
-                        if len( line_elements ) > 1 :
-                            last_character = len( line_elements[ 1 ] ) - 1
-                            if line_elements[ 1 ][ last_character ] == ":" :
-                                annotation_name = line_elements[ 1 ][ 0 : last_character  ]
-                                annotation = str("")
-                                for i in range( 2 , len( line_elements ) ):
-                                    if i != len( line_elements ) - 1 :
-                                        annotation = annotation + str(line_elements[ i ]) + " "
-                                    else :
-                                        annotation = annotation + str(line_elements[ i ]) #the last element has not space following
-                                self.annotations( annotation_name , annotation ) 
+                        annotation = read_annotation( line_elements )
+                        if annotation is not None :
+                            self.annotations( annotation[ 0 ] , annotation[ 1 ] ) 
         if 'frames' in output.keys():
             try:
                 self.input_values('frames',output['frames'])
@@ -1097,95 +1600,81 @@ class Traj:
                         self.input_values(item,output[item],unit=self._annotations['coord_unit'])
                 else :
                     self.input_values(item,output[item])
-        for a in [a for a in attrs.keys() if '_'+a not in self.__slots__]:
+        for a in [a for a in attrs.keys() if '_'+a not in self._attribute_slots + [ '_annotations' ]]:
             if a not in self._annotations.keys():
                 self.annotations(a,attrs[a])    
             else :
                 raise AttributeError(a+' has been already annotated as: '+self._annotations[a])
         
+    @_copy_on_write
     def fill(self):
         """
         fill() fills attributes of missing frames with Nan
         """
+        self._apply()
+        if len( self ) < 2 : #a single time point has no gaps to fill
+            return
         non_empty_attributes = self.attributes()
         if 'frames' in non_empty_attributes: #Are frames empty?
             #Check if there are missing frames
-            frame_intervals = self._frames[1:]-self._frames[0:(len(self._frames)-1)]
-            if max(frame_intervals) > 1:
-                for i in range(len(frame_intervals)-1,-1,-1):
-                    while frame_intervals[i] > 1:
-                        for attribute in non_empty_attributes:
-                            if attribute == 'frames' : #insert the missing frame
-                                x = insert(getattr(self,'_frames'),i+1,self._frames[i+1]-1)
-                                setattr(self,"_frames",array(x,dtype='int64')) # add the coords
-                            #insert a NaN in the attribute
-                            elif attribute == 't' : #insert the missing time point
-                                delta_t = min(self._t[1:]-self._t[0:(len(self._t)-1)])
-                                x = insert(getattr(self,'_t'),i+1,self._t[i+1]-delta_t)
-                                setattr(self,"_t",array(x,dtype='float64')) # add the coords
-                            elif attribute == 'coord' :
-                                x = getattr(self,'_coord')
-                                setattr(self,"_coord",array([\
-                                        insert(x[0,],i+1,NaN),
-                                        insert(x[1,],i+1,NaN)\
-                                                ],dtype='float64'))
-                            elif attribute == 'coord_err' :
-                                x = getattr(self,'_coord_err')
-                                setattr(self,'_coord_err',array([\
-                                        insert(x[0,],i+1,NaN),
-                                        insert(x[1,],i+1,NaN)\
-                                                ],dtype='float64'))
-                            else: 
-                                x = insert(getattr(self,'_'+attribute),i+1,NaN)
-                                setattr(self,"_"+attribute,array(x,dtype='float64')) # add the coords
-                        frame_intervals[i] = frame_intervals[i]-1 #The number of missing frames has been reduced by one
+            missing = diff( self._frames ) - 1
+            if max( missing ) == 0 :
+                return
+            if 't' in non_empty_attributes :
+                #each missing time point precedes the following one by the shortest interval between time points
+                new_t = kernels.fill_time( self._t , missing )
         elif 't' in non_empty_attributes: #Are times empty?
             #Check if there are missing frames
             time_intervals = self._t[1:]-self._t[0:(len(self._t)-1)]
             delta_t = min(time_intervals)
             time_intervals = time_intervals/delta_t
-
-            if max(time_intervals) > 1:
-                for i in range(len(time_intervals)-1,-1,-1):
-                    while time_intervals[i] > 1:
-                        for attribute in non_empty_attributes:
-                            if attribute == 't' : #insert the missing time point
-                                x = insert(getattr(self,'_t'),i+1,self._t[i+1]-delta_t)
-                                setattr(self,"_t",array(x,dtype='float64')) # add the coords
-                            #insert a NaN in the attribute
-                            elif attribute == 'coord' :
-                                x = getattr(self,'_coord')
-                                setattr(self,"_coord",array([\
-                                        insert(x[0,],i+1,NaN),
-                                        insert(x[1,],i+1,NaN)\
-                                                ],dtype='float64'))
-                            elif attribute == 'coord_err' :
-                                x = getattr(self,'_coord_err')
-                                setattr(self,'_coord_err',array([\
-                                        insert(x[0,],i+1,NaN),
-                                        insert(x[1,],i+1,NaN)\
-                                                ],dtype='float64'))
-                            else: 
-                                x = insert(getattr(self,'_'+attribute),i+1,NaN)
-                                setattr(self,"_"+attribute,array(x,dtype='float64')) # add the coords
-                        time_intervals[i] = time_intervals[i]-1 #The number of missing frames has been reduced by one
+            #the number of missing time points in each interval, i.e. the times 1 can be subtracted from the interval before it is <= 1
+            missing = where( time_intervals > 1 , ceil( time_intervals ) - 1 , 0 ).astype( 'int64' )
+            if max( missing ) == 0 :
+                return
+            new_t = kernels.fill_time_step( self._t , missing , delta_t )
         else:
-            pass
+            return
+
+        #the time points of the trajectory in the filled trajectory, where the other time points are NaN
+        positions = repeat( 1 , len( self ) ) 
+        positions[ 1 : ] = positions[ 1 : ] + missing
+        positions = positions.cumsum() - 1
+        l = positions[ -1 ] + 1
+        for attribute in non_empty_attributes:
+            if attribute == 'frames' : #the missing frames
+                setattr(self,"_frames",arange(self._frames[0],self._frames[0]+l,dtype='int64'))
+            elif attribute == 't' : #the missing time points
+                setattr(self,"_t",new_t)
+            else: #NaN in the missing time points
+                x = getattr(self,'_'+attribute)
+                if attribute in ( 'coord' , 'coord_err' ) :
+                    dtype = self._dtype
+                else :
+                    dtype = x.dtype
+                y = full( x.shape[ 0 : x.ndim - 1 ] + ( l , ) , NaN , dtype = dtype )
+                y[ ... , positions ] = x
+                setattr(self,"_"+attribute,y)
 
     def attributes(self):
         """
         attributes() reports the attributes of the trajectory that are
         not empty
         """
+        self._apply()
         
         non_empty_attributes = []
-        for s in self.__slots__[1:]:
+        for s in self._attribute_slots:
             x = getattr(self,s)
             if (x.shape[x.ndim-1] > 0):
                 non_empty_attributes.append(s[1:])
         return non_empty_attributes
 
     def annotations(self,annotation=None,string=''):
+        if ( annotation is not None ) and self._frozen :
+            output = self.thaw()
+            output.annotations( annotation , string )
+            return output
         if (annotation == None ) & ( not string ) :
             return self.__dict__()
         elif (annotation == None ) & ( not ( not string ) ) :
@@ -1199,3 +1688,268 @@ class Traj:
         else:
             self._annotations[annotation] = string
 
+def _affine_columns( x , a00 , a01 , a10 , a11 , b0 , b1 ) :
+
+    #the affine transformation of the columns of x, written element by element so that
+    #each coefficient can be a scalar or an array with one value per column
+    return array( [ a00 * x[ 0 ] + a01 * x[ 1 ] + b0 , a10 * x[ 0 ] + a11 * x[ 1 ] + b1 ] )
+
+def _per_column( values , lengths ) :
+
+    #repeat the value of each trajectory for each of its columns
+    if len( lengths ) == 1 :
+        return float64( values[ 0 ] )
+    return repeat( asarray( values , dtype = 'float64' ) , lengths )
+
+def _join_columns( x ) :
+
+    #join the columns of the arrays in x
+    if len( x ) == 1 :
+        return x[ 0 ]
+    return concatenate( x , axis = 1 )
+
+def _split_columns( x , lengths ) :
+
+    #split the columns of x back into one array per trajectory
+    if len( lengths ) == 1 :
+        return [ x ]
+    output = []
+    i = 0
+    for n in lengths :
+        output.append( x[ : , i : i + n ].copy() )
+        i += n
+    return output
+
+def apply_all( trajectories ) :
+
+    """
+    apply_all( trajectories ): applies the pending rotations, translations and time shifts of all 
+    the trajectories in the list at once, in the same vectorised operation. The trajectories
+    apply their own pending transformations when their data are accessed: apply_all is only 
+    faster when many trajectories have to be transformed.
+    """
+
+    pending = []
+    for t in trajectories :
+        if t._pending is not None :
+            pending.append( ( t , t._pending ) )
+            t._pending = None
+
+    for t , p in pending :
+        if p[ 'dt' ] != 0 :
+            t._t = t._t + p[ 'dt' ]
+
+    #transform the coordinates of all the trajectories together
+    coord = [ ( t , p ) for t , p in pending if ( p[ 'A' ] is not None ) and ( t._coord.shape[ t._coord.ndim - 1 ] > 0 ) ]
+    if coord :
+        lengths = [ t._coord.shape[ 1 ] for t , p in coord ]
+        x = _affine_columns( _join_columns( [ t._coord for t , p in coord ] ) ,
+                *[ _per_column( [ p[ 'A' ][ i , j ] for t , p in coord ] , lengths ) for i , j in ( ( 0 , 0 ) , ( 0 , 1 ) , ( 1 , 0 ) , ( 1 , 1 ) ) ] ,
+                *[ _per_column( [ p[ 'b' ][ i ] for t , p in coord ] , lengths ) for i in ( 0 , 1 ) ] 
+                )
+        for ( t , p ) , y in zip( coord , _split_columns( x , lengths ) ) :
+            t._coord = y.astype( t._dtype , copy = False )
+   
+    #and their squared errors
+    coord_err = [ ( t , p ) for t , p in pending if ( p[ 'E' ] is not None ) and ( t._coord_err.shape[ t._coord_err.ndim - 1 ] > 0 ) ]
+    if coord_err :
+        lengths = [ t._coord_err.shape[ 1 ] for t , p in coord_err ]
+        x = sqrt( _affine_columns( square( _join_columns( [ t._coord_err for t , p in coord_err ] ) ) ,
+                *[ _per_column( [ p[ 'E' ][ i , j ] for t , p in coord_err ] , lengths ) for i , j in ( ( 0 , 0 ) , ( 0 , 1 ) , ( 1 , 0 ) , ( 1 , 1 ) ) ] ,
+                *[ _per_column( [ p[ 'c' ][ i ] for t , p in coord_err ] , lengths ) for i in ( 0 , 1 ) ] 
+                ) )
+        for ( t , p ) , y in zip( coord_err , _split_columns( x , lengths ) ) :
+            t._coord_err = y.astype( t._dtype , copy = False )
+
+    for t , p in pending :
+        #if the trajectory had no errors, the errors of the translations become its errors
+        if ( p[ 'E' ] is not None ) and p[ 'new_err' ] and ( t._coord_err.shape[ t._coord_err.ndim - 1 ] == 0 ) :
+            t._coord_err = array( [\
+                     [ sqrt( p[ 'c' ][ 0 ] ) ] * ( len( t )  ),
+                     [ sqrt( p[ 'c' ][ 1 ] ) ] * ( len( t )  )
+                        ] , dtype = t._dtype )
+        t._record( p[ 'A' ] , p[ 'b' ] , p[ 'dt' ] )
+
+def rotate_all( trajectories , angles , angle_err = 0 ) :
+
+    """
+    rotate_all( trajectories , angles , angle_err = 0 ): rotates each trajectory in the list by its
+    angle in 'angles', with error 'angle_err'. Both 'angles' and 'angle_err' can be a single value, 
+    used for all the trajectories, or a list with one value per trajectory. It is equivalent to 
+    trajectories[ i ].rotate( angles[ i ] , angle_err[ i ] ) but rotations with an error are 
+    computed for all the trajectories together.
+    """
+
+    n = len( trajectories )
+    angles = broadcast_to( asarray( angles , dtype = 'float64' ) , ( n , ) )
+    angle_err = broadcast_to( asarray( angle_err , dtype = 'float64' ) , ( n , ) )
+
+    #rotation matrices and their element-wise square
+    R = [ array( [[ cos( a ) , - sin( a ) ] , [ sin( a ) , cos( a ) ]] , dtype = 'float64' ) for a in angles ]
+    sR = [ square( r ) for r in R ]
+
+    with_err = []
+    for i in range( n ) :
+        if angle_err[ i ] == 0 :
+            #the rotation is added to the pending transformations. The squared errors 
+            #are rotated by the squared rotation matrix
+            trajectories[ i ]._compose( R[ i ] , ( 0 , 0 ) , sR[ i ] , ( 0 , 0 ) , False )
+        else :
+            with_err.append( i )
+
+    if not with_err :
+        return
+
+    #the error on the angle depends on the coordinates, hence these rotations 
+    #cannot be postponed
+    apply_all( [ trajectories[ i ] for i in with_err ] )
+
+    lengths = [ len( trajectories[ i ]._coord[ 0 ] ) for i in with_err ]
+    x = _join_columns( [ trajectories[ i ]._coord for i in with_err ] )
+    #a trajectory without _coord_err has no error to propagate, other than that of the angle
+    x_err = _join_columns( [ trajectories[ i ]._coord_err if trajectories[ i ]._coord_err.shape[ trajectories[ i ]._coord_err.ndim - 1 ] > 0 
+        else zeros( ( 2 , lengths[ k ] ) ) for k , i in enumerate( with_err ) ] )
+
+    x = _affine_columns( x ,
+            *[ _per_column( [ R[ i ][ j , k ] for i in with_err ] , lengths ) for j , k in ( ( 0 , 0 ) , ( 0 , 1 ) , ( 1 , 0 ) , ( 1 , 1 ) ) ] ,
+            0 , 0 )
+
+    #error propagation: sR @ err^2 + ( angle_err * sqrt( 1 - sR ) @ [[ 1 , 0 ] , [ 0 , -1 ]] @ x )^2
+    K = [ angle_err[ i ] * sqrt( 1 - sR[ i ] ) for i in with_err ]
+    x_err = sqrt( 
+            _affine_columns( square( x_err ) ,
+                *[ _per_column( [ sR[ i ][ j , k ] for i in with_err ] , lengths ) for j , k in ( ( 0 , 0 ) , ( 0 , 1 ) , ( 1 , 0 ) , ( 1 , 1 ) ) ] ,
+                0 , 0 ) +
+            square( _affine_columns( x , 
+                *[ _per_column( [ s * k[ j ][ l ] for k in K ] , lengths ) for s , j , l in ( ( 1 , 0 , 0 ) , ( -1 , 0 , 1 ) , ( 1 , 1 , 0 ) , ( -1 , 1 , 1 ) ) ] , 
+                0 , 0 ) )
+            )
+
+    for i , y , y_err in zip( with_err , _split_columns( x , lengths ) , _split_columns( x_err , lengths ) ) :
+        trajectories[ i ]._coord = y.astype( trajectories[ i ]._dtype , copy = False )
+        trajectories[ i ]._coord_err = y_err.astype( trajectories[ i ]._dtype , copy = False )
+        trajectories[ i ]._record( R[ i ] , ( 0 , 0 ) , 0 )
+
+def translate_all( trajectories , v , v_err = ( 0 , 0 ) ) :
+
+    """
+    translate_all( trajectories , v , v_err = ( 0 , 0 ) ): translates each trajectory in the list
+    by its vector in 'v', with error 'v_err'. Both 'v' and 'v_err' can be a single vector, used
+    for all the trajectories, or a list with one vector per trajectory. It is equivalent to 
+    trajectories[ i ].translate( v[ i ] , v_err[ i ] ).
+    """
+    
+    n = len( trajectories )
+    v = asarray( v , dtype = 'float64' )
+    v_err = asarray( v_err , dtype = 'float64' )
+
+    if v_err.shape[ v_err.ndim - 1 ] != 2 :
+        raise AttributeError('The error must be a vector of length 2')
+    
+    v = broadcast_to( v , ( n , 2 ) )
+    v_err = broadcast_to( v_err , ( n , 2 ) )
+
+    for i in range( n ) :
+        #the translation is added to the pending transformations. The squared errors
+        #of the translation add to the squared errors of the coordinates.
+        trajectories[ i ]._compose( _identity , v[ i ] , _identity , square( v_err[ i ] ) , 
+                ( v_err[ i , 0 ] != 0 ) | ( v_err[ i , 1 ] != 0 ) )
+
+def fimax_indices( trajectories , filter = [ 1 ] ) :
+
+    """
+    fimax_indices( trajectories , filter = [ 1 ] ): computes for all the trajectories in the list, at once, 
+    where .fimax( filter ) cuts them, i.e. the number of time points up to the max of the smoothed 
+    fluorescence intensity, included. The result is stored in each trajectory with the fingerprint of 
+    its values (see Traj.fingerprint), so that the following calls of .fimax( filter ) do not need to 
+    compute it again, unless the values were changed in place in between. fimax_indices returns the list 
+    of the number of time points (or of the times of the max, if outside the time span of the trajectory).
+    """
+
+    filter = array( filter , dtype = 'float64' )
+    key = ( 'fimax' , tuple( float( f ) for f in filter ) )
+
+    for t in trajectories :
+
+        t._apply()
+
+        #check that the trajectory has a fluorescence intensity attribute which is not empty
+        if not len( t.f() ) :
+
+            raise AttributeError('The fluorescence intensity attribute is empty!')
+
+        if not len( t.t() ) :
+            
+            raise AttributeError('The time attribute is empty!')
+
+    #the cuts are reused only if they were computed on the current values of the trajectory, which
+    #can be changed in place through its attributes (e.g. t.f()[ 0 ] = 0), or on trajectories with
+    #the same values (see trajalign.memo)
+    fingerprints = [ t.fingerprint( annotations = () ) for t in trajectories ]
+    output = [ None ] * len( trajectories )
+    keys = [ None ] * len( trajectories )
+    for i in range( len( trajectories ) ) :
+        cut = trajectories[ i ]._cache.get( key , None )
+        if ( cut is not None ) and ( cut[ 0 ] == fingerprints[ i ] ) :
+            output[ i ] = cut[ 1 ]
+        else :
+            keys[ i ] = memo.key( 'fimax' , [ trajectories[ i ] ] , annotations = () , options = key[ 1 ] )
+            output[ i ] = memo.get( keys[ i ] )
+    to_compute = [ i for i in range( len( trajectories ) ) if output[ i ] is None ]
+
+    if to_compute :
+        ends = _fimax_ends( [ trajectories[ i ] for i in to_compute ] , filter )
+        for i , end in zip( to_compute , ends ) :
+            output[ i ] = memo.put( keys[ i ] , end )
+
+    for i in range( len( trajectories ) ) :
+        trajectories[ i ]._cache[ key ] = ( fingerprints[ i ] , output[ i ] )
+
+    return output
+
+def _fimax_ends( trajectories , filter ) :
+
+    #the fimax cuts of the trajectories, computed at once
+    w = len( filter )
+
+    #the not-nan fluorescence intensities and their times, padded with NaN to the same length
+    not_nan = [ t.valid( 'f' ) for t in trajectories ]
+    l = [ count_nonzero( v ) for v in not_nan ]
+    L = max( l + [ w ] )
+    f = full( ( len( trajectories ) , L ) , NaN )
+    times = full( ( len( trajectories ) , L ) , NaN )
+    for i in range( len( trajectories ) ) :
+        f[ i , : l[ i ] ] = trajectories[ i ]._f[ not_nan[ i ] ]
+        times[ i , : l[ i ] ] = trajectories[ i ]._t[ not_nan[ i ] ]
+
+    #running mean over fi. The same mean is run over the times to find the 
+    #time at which the max in fi is.
+    f = sliding_window_view( f , w , axis = 1 )
+    times = sliding_window_view( times , w , axis = 1 )
+    fi = f[ ... , 0 ] * filter[ w - 1 ] 
+    ti = times[ ... , 0 ] * filter[ w - 1 ]
+    for k in range( 1 , w ) :
+        fi = fi + f[ ... , k ] * filter[ w - 1 - k ]
+        ti = ti + times[ ... , k ] * filter[ w - 1 - k ]
+
+    output = []
+    for i in range( len( trajectories ) ) :
+
+        n = l[ i ] - w + 1 #number of valid running means
+        if n > 0 :
+            time_where_fi_max_is = ti[ i , min( fi[ i , 0 : n ].argmax() + 1 , n - 1 ) ]
+        else : #the filter is longer than the trajectory
+            x = convolve( trajectories[ i ]._f[ not_nan[ i ] ] , filter , 'valid' )
+            time_where_fi_max_is = convolve( trajectories[ i ]._t[ not_nan[ i ] ] , filter , 'valid' )[ min( x.argmax() + 1 , len( x ) - 1 ) ]
+
+        t = trajectories[ i ]._t
+        if ( ( ( time_where_fi_max_is  > t[ 0 ] ) | isclose( time_where_fi_max_is , t[ 0 ] ) | isclose( t[ 0 ] , time_where_fi_max_is ) ) & 
+                ( ( time_where_fi_max_is < t[ len( t ) - 1 ] ) | isclose( time_where_fi_max_is , t[ len( t ) - 1 ] ) | isclose( t[ len( t ) - 1 ] , time_where_fi_max_is ) ) ) :
+            #the points kept by .end( time_where_fi_max_is )
+            end = int( count_nonzero( ( t < time_where_fi_max_is ) | isclose( t , time_where_fi_max_is ) ) )
+        else :
+            end = time_where_fi_max_is
+
+        output.append( end )
+
+    return output